@@ -0,0 +1,71 @@
+import argparse
+import json
+import sys
+
+from socketsender import bench, sender
+
+
+class SOCSBenchCli:
+    def __init__(self, args):
+        self.args = args
+        parser = argparse.ArgumentParser(
+            description="Measure how fast socketsender can send on loopback."
+        )
+        parser.add_argument(
+            "-d",
+            "--duration",
+            action="store",
+            type=float,
+            default=1.0,
+            help="Seconds to run each case",
+        )
+        parser.add_argument(
+            "-l",
+            "--length",
+            action="store",
+            type=int,
+            default=64,
+            help="Bytes per packet",
+        )
+        parser.add_argument(
+            "--sources",
+            nargs="+",
+            choices=bench.SOURCES,
+            default=bench.SOURCES,
+            help="Builtin sources to measure",
+        )
+        parser.add_argument(
+            "--engines",
+            nargs="+",
+            choices=sender.ENGINES,
+            default=sender.ENGINES,
+            help="Engines to measure",
+        )
+        parser.add_argument(
+            "--paths",
+            nargs="+",
+            choices=bench.PATHS,
+            default=bench.PATHS,
+            help="Send paths to measure",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            type=argparse.FileType("w"),
+            help="Write the results to this file as JSON",
+        )
+        self.cli_args = parser.parse_args(args[1:])
+
+    def run(self):
+        args = self.cli_args
+        results = bench.SOCSBench(args.duration, args.length).run(
+            args.sources, args.engines, args.paths, progress=sys.stdout
+        )
+        if args.output:
+            json.dump(results, args.output, indent=2)
+            args.output.write("\n")
+            args.output.close()
+
+
+def run():
+    SOCSBenchCli(sys.argv).run()
@@ -1,14 +1,17 @@
 import argparse
-import importlib.util
 import sys
-from pathlib import Path
-
-from socketsender import sender
+import time
 
 
 class SOCSCli:
     def __init__(self, args):
         self.args = args
+        # The heavier modules are imported here rather than at the top,
+        # so that their import time can be reported
+        start = time.perf_counter()
+        from socketsender import sender, stats
+
+        self.timings = {"import": time.perf_counter() - start}
         parser = argparse.ArgumentParser(description="Send IP packets.")
         parser.add_argument(
             "-m",
@@ -16,15 +19,79 @@ class SOCSCli:
             action="store",
             help="Specifies a module.class to use with a 'source' parameter",
         )
+        parser.add_argument(
+            "-e",
+            "--engine",
+            action="store",
+            choices=sender.ENGINES,
+            default="thread",
+            help="Drive schedules with one thread each, or from one asyncio loop",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            action="store",
+            help="Share the schedules between this many processes, or 'auto'",
+        )
+        parser.add_argument(
+            "--affinity",
+            action="store_true",
+            help="Pin each worker process to its own CPU",
+        )
+        parser.add_argument(
+            "-r",
+            "--report-interval",
+            action="store",
+            type=float,
+            help="Report progress every this many seconds, and results at the end",
+        )
+        parser.add_argument(
+            "--report-format",
+            action="store",
+            choices=stats.REPORT_FORMATS,
+            default="text",
+            help="Report in human-readable text or as JSON lines",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store",
+            metavar="DIR",
+            help="Cache the validated schedules in this directory, and reuse them"
+            " while the config file is unchanged",
+        )
+        parser.add_argument(
+            "--timing",
+            action="store_true",
+            help="Report the time spent importing, parsing and validating",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Time the source, the send and the wait of every schedule, and"
+            " report the CPU time of each thread",
+        )
+        parser.add_argument(
+            "--profile-dir",
+            action="store",
+            metavar="DIR",
+            help="Profile every schedule with cProfile too, writing the statistics"
+            " to this directory",
+        )
         parser.add_argument(
             "config",
-            type=argparse.FileType("r"),
-            help="YAML config file for SOCSender.",
+            type=argparse.FileType("rb"),
+            help="YAML or JSON (*.json) config file for SOCSender.",
         )
         self.cli_args = parser.parse_args(args[1:])
 
     def run(self):
+        from socketsender import config, sender
+
         if self.cli_args.module:
+            # Imported here as few runs need them
+            import importlib.util
+            from pathlib import Path
+
             path = Path(self.cli_args.module)
             if not path.exists():
                 print(f'Can\'t find module file "{path}"', file=sys.stderr)
@@ -38,7 +105,22 @@ class SOCSCli:
             # by name later.
             sys.modules[module_name] = module
 
-        sender.SOCSender().run(self.cli_args.config)
+        schedules = config.load(self.cli_args.config, self.cli_args.cache, self.timings)
+        if self.cli_args.timing:
+            print(
+                ", ".join(f"{k} {v * 1e3:.1f} ms" for k, v in self.timings.items()),
+                file=sys.stderr,
+            )
+
+        sender.SOCSender(
+            engine=self.cli_args.engine,
+            workers=self.cli_args.workers,
+            affinity=self.cli_args.affinity,
+            report_interval=self.cli_args.report_interval,
+            report_format=self.cli_args.report_format,
+            profile=self.cli_args.profile,
+            profile_dir=self.cli_args.profile_dir,
+        ).run_schedules(schedules)
 
 
 def run():
@@ -0,0 +1,61 @@
+import argparse
+import sys
+
+from socketsender import config, sink, stats
+
+
+class SOCSSinkCli:
+    def __init__(self, args):
+        self.args = args
+        parser = argparse.ArgumentParser(
+            description="Receive the packets of a socketsender run and check them."
+        )
+        parser.add_argument(
+            "-b",
+            "--bind",
+            action="store",
+            help="Listen on this address instead of the target addresses",
+        )
+        parser.add_argument(
+            "-d",
+            "--duration",
+            action="store",
+            type=float,
+            help="Stop after this many seconds, instead of at Ctrl-C",
+        )
+        parser.add_argument(
+            "-r",
+            "--report-interval",
+            action="store",
+            type=float,
+            help="Report progress every this many seconds",
+        )
+        parser.add_argument(
+            "--report-format",
+            action="store",
+            choices=stats.REPORT_FORMATS,
+            default="text",
+            help="Report in human-readable text or as JSON lines",
+        )
+        parser.add_argument(
+            "config",
+            type=argparse.FileType("r"),
+            help="YAML or JSON (*.json) config file of the run to receive. Only"
+            " the names and targets of its schedules are read.",
+        )
+        self.cli_args = parser.parse_args(args[1:])
+
+    def run(self):
+        args = self.cli_args
+        socs = sink.SOCSSink(
+            config.get_targets(args.config),
+            bind_addr=args.bind,
+            report_interval=args.report_interval,
+            report_format=args.report_format,
+        )
+        socs.run(args.duration)
+        stats.report_results(socs.results(), args.report_format, sys.stdout)
+
+
+def run():
+    SOCSSinkCli(sys.argv).run()
@@ -0,0 +1,187 @@
+"""Random gaps between the events of a schedule.
+
+By default, a schedule with a `frequency` spaces its events evenly. An
+arrival model draws the gaps from a distribution instead, with the
+mean that `frequency` sets, so the average rate is kept while the
+receiver sees the queueing of real traffic.
+
+The gaps are drawn a block at a time and summed into send times, which
+the pacer reads into its table like the times of a profile, so the
+cost per packet stays a table lookup whatever the distribution.
+"""
+
+import bisect
+import random
+import typing
+
+MODELS = ("constant", "poisson", "uniform", "pareto", "empirical")
+
+# Gaps drawn at a time
+BLOCK_SIZE = 1024
+
+
+class SOCSArrivals:
+    def __init__(self, seed: typing.Optional[int] = None) -> None:
+        """Draws gaps with a generator seeded with `seed`, or from the
+        system if it is None. Every call to `times` starts over from
+        the seed.
+        """
+        self.seed = seed
+
+    def gaps(self, rng: random.Random, mean: float, count: int) -> typing.List[float]:
+        """`count` gaps, in seconds, that are `mean` seconds on average.
+        """
+        raise NotImplementedError
+
+    def times(self, mean: float) -> typing.Iterator[float]:
+        """Yields the send times, in seconds from the first, of events
+        `mean` seconds apart on average.
+        """
+        rng = random.Random(self.seed)
+        t = 0.0
+        yield t
+        while True:
+            for gap in self.gaps(rng, mean, BLOCK_SIZE):
+                t += gap
+                yield t
+
+
+class SOCSPoissonArrivals(SOCSArrivals):
+    """Exponential gaps, as between the events of a Poisson process.
+    """
+
+    def gaps(self, rng: random.Random, mean: float, count: int) -> typing.List[float]:
+        expovariate = rng.expovariate
+        rate = 1 / mean
+        return [expovariate(rate) for _ in range(0, count)]
+
+
+class SOCSUniformArrivals(SOCSArrivals):
+    def __init__(self, jitter: float, seed: typing.Optional[int] = None) -> None:
+        """Gaps uniform within `jitter` times the mean either side of it.
+        """
+        super().__init__(seed)
+        self.jitter = jitter
+
+    def gaps(self, rng: random.Random, mean: float, count: int) -> typing.List[float]:
+        low = mean * (1 - self.jitter)
+        width = 2 * mean * self.jitter
+        rand = rng.random
+        return [low + width * rand() for _ in range(0, count)]
+
+
+class SOCSParetoArrivals(SOCSArrivals):
+    def __init__(self, shape: float, seed: typing.Optional[int] = None) -> None:
+        """Heavy-tailed gaps, from a Pareto distribution of `shape`
+        above 1. The closer it is to 1, the longer the tail: most gaps
+        are short, and a few are very long.
+        """
+        super().__init__(seed)
+        self.shape = shape
+
+    def gaps(self, rng: random.Random, mean: float, count: int) -> typing.List[float]:
+        # The distribution starts at 1 and has a mean of shape / (shape - 1)
+        scale = mean * (self.shape - 1) / self.shape
+        paretovariate = rng.paretovariate
+        shape = self.shape
+        return [scale * paretovariate(shape) for _ in range(0, count)]
+
+
+class SOCSEmpiricalArrivals(SOCSArrivals):
+    def __init__(
+        self,
+        values: typing.List[float],
+        probabilities: typing.Optional[typing.List[float]] = None,
+        seed: typing.Optional[int] = None,
+    ) -> None:
+        """Gaps shaped like `values`, scaled to the mean.
+
+        Without `probabilities`, the gaps are drawn from `values`
+        themselves. Otherwise the values, in increasing order, and
+        their cumulative `probabilities` are points of the distribution
+        function, which is interpolated linearly between them.
+        """
+        super().__init__(seed)
+        self.values = values
+        self.probabilities = probabilities
+        if probabilities is None:
+            self.unit_mean = sum(values) / len(values)
+        else:
+            points = list(zip(probabilities, values))
+            self.unit_mean = probabilities[0] * values[0] + sum(
+                (p1 - p0) * (v0 + v1) / 2
+                for (p0, v0), (p1, v1) in zip(points, points[1:])
+            )
+
+    def gaps(self, rng: random.Random, mean: float, count: int) -> typing.List[float]:
+        scale = mean / self.unit_mean
+        values = self.values
+        if self.probabilities is None:
+            return [v * scale for v in rng.choices(values, k=count)]
+
+        probabilities = self.probabilities
+        retval = list()
+        for _ in range(0, count):
+            u = rng.random()
+            i = bisect.bisect_left(probabilities, u)
+            if i == 0:
+                retval.append(values[0] * scale)
+                continue
+            p0, p1 = probabilities[i - 1], probabilities[i]
+            v0, v1 = values[i - 1], values[i]
+            retval.append((v0 + (v1 - v0) * (u - p0) / (p1 - p0)) * scale)
+        return retval
+
+
+def read_distribution(
+    path: str,
+) -> typing.Tuple[typing.List[float], typing.Optional[typing.List[float]]]:
+    """Reads the gaps of an empirical distribution from the file at `path`.
+
+    Each line holds either one gap, a sample of the distribution, or a
+    gap and the probability of a gap no longer than it. Blank lines and
+    lines starting with '#' are ignored.
+    """
+    values = list()
+    probabilities = list()
+    with open(path) as fd:
+        for line in fd:
+            fields = line.split("#", 1)[0].replace(",", " ").split()
+            if not fields:
+                continue
+            values.append(float(fields[0]))
+            if len(fields) > 1:
+                probabilities.append(float(fields[1]))
+    if not values or min(values) < 0 or max(values) == 0:
+        raise ValueError(f'"{path}" holds no gaps, or negative ones')
+    if not probabilities:
+        return values, None
+    if (
+        len(probabilities) != len(values)
+        or sorted(values) != values
+        or sorted(probabilities) != probabilities
+        or probabilities[-1] != 1.0
+    ):
+        raise ValueError(
+            f'"{path}" is not a distribution function: gaps and probabilities'
+            " must both increase, and the last probability must be 1"
+        )
+    return values, probabilities
+
+
+def to_model(
+    data: dict, seed: typing.Optional[int] = None
+) -> typing.Optional[SOCSArrivals]:
+    """Builds the arrival model from its validated configuration, or
+    returns None for evenly spaced events.
+    """
+    model = data["model"]
+    if model == "poisson":
+        return SOCSPoissonArrivals(seed)
+    if model == "uniform":
+        return SOCSUniformArrivals(data.get("jitter", 1.0), seed)
+    if model == "pareto":
+        return SOCSParetoArrivals(data.get("shape", 1.5), seed)
+    if model == "empirical":
+        return SOCSEmpiricalArrivals(*read_distribution(data["file"]), seed=seed)
+    return None
@@ -0,0 +1,377 @@
+"""Sends IP packets on a schedule from a single asyncio event loop.
+
+This is an alternative to running one `SOCSrunner` thread per
+schedule. Each schedule becomes a task driving its own datagram
+endpoint, and the runners leave the same `result` dict behind.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+import typing
+
+from socketsender import config, pacing, pool, sender, stats, transport
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class SOCSTcpProtocol(asyncio.Protocol):
+    def __init__(self) -> None:
+        """Tracks whether the connection can take more writes.
+        """
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    def pause_writing(self):
+        self.writable.clear()
+
+    def resume_writing(self):
+        self.writable.set()
+
+    def connection_lost(self, exc):
+        # Wakes up a runner waiting to write, which then reconnects
+        self.writable.set()
+
+
+class SOCSUdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        """Tracks whether the endpoint can take more datagrams.
+
+        The endpoint queues what the kernel has no room for, and pauses
+        the protocol once the queue is past its high-water mark.
+        """
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    def pause_writing(self):
+        self.writable.clear()
+
+    def resume_writing(self):
+        self.writable.set()
+
+    def connection_lost(self, exc):
+        self.writable.set()
+
+
+class SOCSAsyncTcpTransport:
+    def __init__(
+        self, schedule: config.SOCSSchedule, stopping: typing.Callable[[], bool]
+    ) -> None:
+        """Sends the packets of `schedule` down one TCP connection, like
+        `transport.SOCSTcpTransport`, from the event loop.
+
+        Writes to a lost connection are dropped until the runner calls
+        `connect` again, which retries with backoff until it succeeds
+        or `stopping` returns true. Only the connections made after a
+        first one succeeded are counted as reconnections.
+        """
+        self.schedule = schedule
+        self.stopping = stopping
+        self.endpoint = None
+        self.reconnects = 0
+        if schedule.stamp:
+            # Stamped packets are views into buffers that are reused at
+            # the next send, so they are copied in case the endpoint has
+            # to keep them.
+            self.send = self.send_copy
+            self.send_batch = self.send_batch_copy
+
+    async def connect(self, retry: bool = True) -> bool:
+        """Connects, retrying, if `retry`, and tells whether it did.
+        """
+        if self.endpoint is not None:
+            self.reconnects += 1
+        loop = asyncio.get_event_loop()
+        addr = self.schedule.ip_addr
+        for delay in transport.backoff(self.schedule.reconnect_delay):
+            sock = transport.tcp_socket(self.schedule)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, addr)
+                self.endpoint, _ = await loop.create_connection(
+                    SOCSTcpProtocol, sock=sock
+                )
+                return True
+            except OSError as exc:
+                sock.close()
+                log.warning("Cannot connect to %s:%s: %s", *addr, exc)
+            if not retry:
+                return False
+            await asyncio.sleep(delay)
+            if self.stopping():
+                return False
+
+    def is_closed(self) -> bool:
+        return self.endpoint is None or self.endpoint.is_closing()
+
+    def send(self, data: bytes) -> None:
+        self.endpoint.write(data)
+
+    def send_batch(self, packets: typing.List[bytes]) -> None:
+        self.endpoint.writelines(packets)
+
+    def send_copy(self, data: bytes) -> None:
+        self.endpoint.write(bytes(data))
+
+    def send_batch_copy(self, packets: typing.List[bytes]) -> None:
+        self.endpoint.writelines([bytes(d) for d in packets])
+
+    async def wait_writable(self) -> None:
+        """Waits out flow control, or for the connection to drop.
+        """
+        await self.endpoint.get_protocol().writable.wait()
+
+    def add_result(self, result: dict) -> None:
+        result["reconnects"] = self.reconnects
+
+    def close(self) -> None:
+        if self.endpoint is not None:
+            self.endpoint.close()
+
+
+class SOCSAsyncRunner:
+    def __init__(self, schedule: config.SOCSSchedule, profile: bool = False) -> None:
+        """See `sender.SOCSender` for `profile`.
+        """
+        self.schedule = schedule
+        self.profile = profile
+        self.name = schedule.name
+        # A plain flag, as `stop` may be called from outside the loop
+        self.quitquit = False
+        self.result = dict()
+        self.endpoint = None
+        # The transport of the schedule, which adds its counts to the
+        # result
+        self.conn = None
+        # Set once sending starts, for progress reports
+        self.flow = None
+        self.pacer = None
+        self.bucket = None
+        self.start_time = None
+
+    def stop(self):
+        self.quitquit = True
+
+    async def open_udp(
+        self,
+    ) -> typing.Tuple[asyncio.BaseTransport, typing.Callable, typing.Callable]:
+        """Opens the UDP endpoint and returns it with its `send` and
+        `send_batch`.
+
+        With the 'block' policy, the endpoint queues the packets the
+        kernel has no room for, and the runner waits for the queue to
+        drain once it is past the endpoint's high-water mark.
+
+        With a `backpressure` policy other than 'block', the transport
+        is its own endpoint, so that it sees the packets the kernel
+        refuses, which an asyncio endpoint would queue. Its waits for
+        room then hold up the loop, for at most a few milliseconds.
+        """
+        loop = asyncio.get_event_loop()
+        udp = transport.SOCSUdpTransport(self.schedule)
+        self.conn = udp
+        if udp.backpressure != "block":
+            return udp, udp.send, udp.send_batch
+        udp.sock.setblocking(False)
+        endpoint, _ = await loop.create_datagram_endpoint(
+            SOCSUdpProtocol, sock=udp.sock
+        )
+        sendto = endpoint.sendto
+        # A connected endpoint sends without an address
+        addr = None if udp.connected else self.schedule.ip_addr
+        targets = self.schedule.targets
+
+        if udp.copies > 1:
+
+            def send(data):
+                for target in targets:
+                    sendto(data, target)
+
+            def send_batch(packets):
+                for data in packets:
+                    for target in targets:
+                        sendto(data, target)
+
+        elif udp.rotate:
+            rotation = itertools.cycle(targets)
+
+            def send(data):
+                sendto(data, next(rotation))
+
+            def send_batch(packets):
+                for data in packets:
+                    sendto(data, next(rotation))
+
+        else:
+
+            def send(data):
+                sendto(data, addr)
+
+            def send_batch(packets):
+                for data in packets:
+                    sendto(data, addr)
+
+        return endpoint, send, send_batch
+
+    async def run(self, run_request: asyncio.Event, ready: asyncio.Event) -> None:
+        """Sends the schedule. An error is logged and left in the result
+        as `error`, with the counts of what was sent before it, and the
+        other runners carry on.
+        """
+        try:
+            flow = await self.open()
+        except Exception as exc:
+            log.exception("Schedule %s cannot start", self.name)
+            self.result["error"] = str(exc)
+            return
+        finally:
+            ready.set()
+        await run_request.wait()
+        await self.send_all(flow)
+
+    async def open(self) -> sender.SOCSflow:
+        """Opens the endpoint and fills the packet pool, if any.
+        """
+        if self.schedule.protocol == "tcp":
+            tcp = SOCSAsyncTcpTransport(self.schedule, lambda: self.quitquit)
+            # Tried once, so a target that is down does not hold up the
+            # start; the runner reconnects once it is sending
+            await tcp.connect(retry=False)
+            self.conn = endpoint = tcp
+            send, send_batch = tcp.send, tcp.send_batch
+        else:
+            endpoint, send, send_batch = await self.open_udp()
+
+        self.endpoint = endpoint
+        flow = sender.SOCSflow(self.schedule, send, send_batch, self.profile)
+        # Pools are filled in threads, so slow sources fill side by side
+        await asyncio.get_event_loop().run_in_executor(None, flow.prefill)
+        return flow
+
+    async def send_all(self, flow: sender.SOCSflow) -> None:
+        tcp = self.schedule.protocol == "tcp"
+        conn = self.conn
+        endpoint = self.endpoint
+        # The flow control of a UDP endpoint; see `open_udp`
+        writable = None
+        if not tcp and isinstance(endpoint, asyncio.BaseTransport):
+            writable = endpoint.get_protocol().writable
+        # There is no spinning here; the loop's timers set the resolution.
+        pacer = pacing.make_pacer(self.schedule, spin=False)
+        bucket = pacing.make_bucket(self.schedule, spin=False)
+        waits = None
+        if self.profile:
+            # The time other tasks run is counted in, as it is waited out
+            waits = flow.histograms["wait"] = stats.SOCSHistogram()
+        await asyncio.sleep(self.schedule.delay)
+        start_time = time.perf_counter()
+        pacer.start()
+        if bucket is not None:
+            bucket.start()
+        self.pacer = pacer
+        self.bucket = bucket
+        self.start_time = start_time
+        self.flow = flow
+        try:
+            while not self.quitquit:
+                if tcp and conn.is_closed() and not await conn.connect():
+                    break
+                if flow.pool is not None and not flow.pool.ready(flow.batch_size):
+                    # Waiting on the pool would block every task of the loop
+                    flow.pool.underruns += 1
+                    while not flow.pool.ready(flow.batch_size):
+                        await asyncio.sleep(pool.UNDERRUN_WAIT)
+                size = flow.send_event()
+                if flow.done() or pacer.finished:
+                    break
+                if tcp:
+                    await conn.wait_writable()
+                elif writable is not None:
+                    # Waits for what the kernel had no room for to drain
+                    await writable.wait()
+                # Always yield, so a late schedule cannot starve the others
+                if waits is None:
+                    await asyncio.sleep(max(0, pacer.remaining()) / 1e9)
+                else:
+                    start = time.perf_counter_ns()
+                    await asyncio.sleep(max(0, pacer.remaining()) / 1e9)
+                    waits.record(time.perf_counter_ns() - start)
+                pacer.advance()
+                if bucket is not None:
+                    bucket.consume(size)
+                    remaining = bucket.remaining()
+                    if remaining > 0:
+                        await asyncio.sleep(remaining / 1e9)
+        except Exception as exc:
+            log.exception("Schedule %s stopped", self.name)
+            self.result["error"] = str(exc)
+
+        endpoint.close()
+        sender.set_result(self.result, flow, start_time, pacer)
+        conn.add_result(self.result)
+
+
+class SOCSAsyncEngine:
+    def __init__(
+        self,
+        runners: typing.List[SOCSAsyncRunner],
+        profile_dir: typing.Optional[str] = None,
+    ) -> None:
+        """Runs `runners` on a new event loop, under cProfile if there is
+        a `profile_dir` to write the statistics to.
+
+        `prepare` opens the endpoints and fills the pools of every
+        runner, and `start` then lets them all send, and returns once
+        they are done.
+        """
+        self.runners = runners
+        self.profile_dir = profile_dir
+        self.profiler = None
+        if profile_dir is not None:
+            # Imported here so runs without profiling do not pay for it
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+        self.loop = asyncio.new_event_loop()
+        self.run_request = None
+        self.main = None
+
+    def prepare(self) -> None:
+        self.run_until_complete(self.loop.create_task(self.prepare_all()))
+
+    async def prepare_all(self) -> None:
+        self.run_request = asyncio.Event()
+        ready = [asyncio.Event() for _ in self.runners]
+        self.main = asyncio.gather(
+            *(r.run(self.run_request, e) for r, e in zip(self.runners, ready))
+        )
+        for event in ready:
+            await event.wait()
+
+    def start(self) -> None:
+        try:
+            self.run_request.set()
+            self.run_until_complete(self.main)
+        finally:
+            self.loop.close()
+            if self.profiler is not None:
+                self.profiler.dump_stats(
+                    sender.profile_path(self.profile_dir, f"asyncio-{os.getpid()}")
+                )
+
+    def run_until_complete(self, future: asyncio.Future) -> None:
+        if self.profiler is not None:
+            self.profiler.enable()
+        try:
+            try:
+                self.loop.run_until_complete(future)
+            except KeyboardInterrupt:
+                for runner in self.runners:
+                    runner.stop()
+                self.loop.run_until_complete(future)
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
@@ -0,0 +1,232 @@
+"""Measures how fast socketsender itself can send.
+
+Every case runs one unpaced schedule for a while against a sink on
+loopback, and measures the packets and bytes sent per second and the
+CPU time the sending process spent per packet. The sink runs in its
+own process, so its CPU time is not counted.
+
+The cases cover each builtin source, each engine and each send path:
+
+udp
+   One `sendto` per packet.
+
+udp-batch
+   Batches of `BATCH_SIZE` packets, sent with `sendmmsg` where the
+   platform has it.
+
+tcp
+   One write per packet down a persistent connection.
+
+tcp-batch
+   Batches of `BATCH_SIZE` packets coalesced into one `sendmsg` write.
+"""
+
+import datetime
+import itertools
+import multiprocessing
+import os
+import platform
+import select
+import socket
+import struct
+import tempfile
+import threading
+import time
+import typing
+
+import socketsender
+from socketsender import config, pcap, sender, transport
+
+SOURCES = tuple(config.builtin_sources)
+PATHS = ("udp", "udp-batch", "tcp", "tcp-batch")
+
+BATCH_SIZE = 32
+
+# High enough that every deadline is already past, so the schedule
+# sends as fast as it can
+UNPACED_FREQUENCY = 1e12
+
+# Size of the file replayed by the 'file' source, in bytes
+FILE_SIZE = 1 << 20
+
+# Packets in the capture replayed by the 'pcap' source
+CAPTURE_PACKETS = 1024
+
+
+def sink(ready: multiprocessing.Queue, quitquit: multiprocessing.Event) -> None:
+    """Receives and discards everything sent to it until `quitquit`.
+
+    The UDP and TCP ports it listens on are put on `ready`.
+    """
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(("127.0.0.1", 0))
+    udp.setblocking(False)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+    listener.setblocking(False)
+    ready.put((udp.getsockname()[1], listener.getsockname()[1]))
+
+    socks = [udp, listener]
+    while not quitquit.is_set():
+        readable, _, _ = select.select(socks, [], [], 0.1)
+        for sock in readable:
+            if sock is listener:
+                conn, _ = listener.accept()
+                conn.setblocking(False)
+                socks.append(conn)
+                continue
+            try:
+                # Drains whatever has arrived
+                while sock.recv(1 << 16) or sock is udp:
+                    pass
+                # An empty read is the end of a TCP connection
+                socks.remove(sock)
+                sock.close()
+            except BlockingIOError:
+                pass
+
+
+def write_capture(fd: typing.BinaryIO, length: int, count: int) -> None:
+    """Writes a pcap capture of `count` IPv4 UDP packets with random
+    payloads of `length` bytes to `fd`.
+    """
+    header = (pcap.PCAP_MAGIC_US, 2, 4, 0, 0, 65535, pcap.LINKTYPE_RAW)
+    fd.write(struct.pack("<IHHiIII", *header))
+    for i in range(0, count):
+        ip = struct.pack(
+            "!BBHHHBBH4s4s",
+            0x45,
+            0,
+            28 + length,
+            0,
+            0,
+            64,
+            pcap.IPPROTO_UDP,
+            0,
+            bytes([127, 0, 0, 1]),
+            bytes([127, 0, 0, 1]),
+        )
+        udp = struct.pack("!HHHH", 9, 9, 8 + length, 0)
+        frame = ip + udp + os.urandom(length)
+        fd.write(struct.pack("<IIII", 0, i, len(frame), len(frame)))
+        fd.write(frame)
+
+
+class SOCSBench:
+    def __init__(self, duration: float = 1.0, length: int = 64) -> None:
+        """Runs each case for `duration` seconds with packets of
+        `length` bytes.
+        """
+        self.duration = duration
+        self.length = length
+        self.udp_port = None
+        self.tcp_port = None
+
+    def schedule(
+        self, source: str, path: str, data_file: str, capture_file: str
+    ) -> config.SOCSSchedule:
+        protocol, _, batch = path.partition("-")
+        return config.SOCSSchedule(
+            {
+                "name": "bench",
+                "target_addr": "127.0.0.1",
+                "target_port": self.tcp_port if protocol == "tcp" else self.udp_port,
+                "protocol": protocol,
+                "frequency": UNPACED_FREQUENCY,
+                "length": self.length,
+                "source": source,
+                "total": "infinity",
+                "batch_size": BATCH_SIZE if batch else 1,
+                "loop": True,
+                "user_data1": capture_file if source == "pcap" else data_file,
+            }
+        )
+
+    def run_case(self, schedule: config.SOCSSchedule, engine: str) -> dict:
+        socs = sender.SOCSender(engine=engine)
+        timer = threading.Timer(self.duration, socs.stop_all)
+        cpu = time.process_time()
+        timer.start()
+        socs.run_schedules([schedule])
+        cpu = time.process_time() - cpu
+        timer.cancel()
+
+        result = socs.results[schedule.name]
+        packets = result["packets"]
+        return {
+            "packets": packets,
+            "bytes": result["bytes"],
+            "seconds": result["time"],
+            "pps": packets / result["time"],
+            "bytes_per_sec": result["bytes"] / result["time"],
+            "cpu_per_packet": cpu / packets if packets else None,
+        }
+
+    def run(
+        self,
+        sources: typing.Sequence[str] = SOURCES,
+        engines: typing.Sequence[str] = sender.ENGINES,
+        paths: typing.Sequence[str] = PATHS,
+        progress: typing.Optional[typing.TextIO] = None,
+    ) -> dict:
+        """Runs every combination of `sources`, `engines` and `paths`.
+
+        Returns the results with a description of the machine, ready
+        to be written as JSON. A line per case is written to
+        `progress`, if given.
+        """
+        ready = multiprocessing.Queue()
+        quitquit = multiprocessing.Event()
+        sinker = multiprocessing.Process(
+            target=sink, args=(ready, quitquit), name="SOCSBenchSink", daemon=True
+        )
+        sinker.start()
+        self.udp_port, self.tcp_port = ready.get()
+
+        cases = list()
+        with tempfile.NamedTemporaryFile(
+            prefix="socsbench"
+        ) as data_file, tempfile.NamedTemporaryFile(
+            prefix="socsbench", suffix=".pcap"
+        ) as capture_file:
+            data_file.write(os.urandom(FILE_SIZE))
+            data_file.flush()
+            write_capture(capture_file, self.length, CAPTURE_PACKETS)
+            capture_file.flush()
+            try:
+                for source, engine, path in itertools.product(sources, engines, paths):
+                    schedule = self.schedule(
+                        source, path, data_file.name, capture_file.name
+                    )
+                    case = {"source": source, "engine": engine, "path": path}
+                    case.update(self.run_case(schedule, engine))
+                    cases.append(case)
+                    if progress is not None:
+                        print(format_case(case), file=progress, flush=True)
+            finally:
+                quitquit.set()
+                sinker.join()
+
+        return {
+            "version": socketsender.__version__,
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sendmmsg": transport.has_sendmmsg(),
+            "duration": self.duration,
+            "length": self.length,
+            "batch_size": BATCH_SIZE,
+            "cases": cases,
+        }
+
+
+def format_case(case: dict) -> str:
+    cpu = case["cpu_per_packet"]
+    cpu = "-" if cpu is None else f"{cpu * 1e6:.2f}"
+    return (
+        f"{case['source']:<10} {case['engine']:<7} {case['path']:<9}"
+        f" {case['pps']:12.0f} pps {case['bytes_per_sec'] * 8 / 1e6:10.1f} Mbit/s"
+        f" {cpu:>8} us/packet"
+    )
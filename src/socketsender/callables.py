@@ -1,5 +1,13 @@
-import array
+import mmap
+import os
 import random
+import struct
+import typing
+
+from socketsender import pcap
+
+# Big-endian length header used by the file source's 'prefixed' framing
+LENGTH_PREFIX = struct.Struct("!H")
 
 
 class SOCS_GenRandom:
@@ -10,14 +18,30 @@ class SOCS_GenRandom:
         else:
             self.length = sched.length
 
+        self.rng = random.Random(sched.seed)
+        self.pool = None
+        self.offset = 0
+        if sched.random_pool is not None:
+            self.pool = self.generate(self.length * sched.random_pool)
+
+    def generate(self, size: int) -> bytes:
+        """Generates `size` random bytes in one call to the engine.
+        """
+        return self.rng.getrandbits(size * 8).to_bytes(size, "little")
+
     def __call__(self, **kwds) -> bytes:
         """Generates a bytestring of ramdom values.
+
+        Without a pool, every packet is freshly generated. With a
+        pool, successive packets are sliced from it, wrapping around
+        when it is used up.
         """
-        retval = array.array("B")
-        for _ in range(0, self.length):
-            retval.append(random.randrange(0, 256))
+        if self.pool is None:
+            return self.generate(self.length)
 
-        return retval.tobytes()
+        offset = self.offset
+        self.offset = (offset + self.length) % len(self.pool)
+        return self.pool[offset : offset + self.length]
 
 
 class SOCS_SequentialSource:
@@ -29,15 +53,21 @@ class SOCS_SequentialSource:
         else:
             self.length = sched.length
 
-    def __call__(self, **kwds) -> bytes:
+        # The sequence repeats every 256 bytes, so a packet starting at
+        # any value is a contiguous slice of enough repetitions to
+        # cover the largest starting value plus one packet.
+        repeats = (self.length + 255) // 256 + 1
+        self.ring = memoryview(bytes(range(0, 256)) * repeats)
+
+    def __call__(self, **kwds) -> memoryview:
         """Generates a bytestring of sequential values.
-        """
-        retval = array.array("B")
-        for _ in range(0, self.length):
-            retval.append(self.starting_value)
-            self.starting_value = (self.starting_value + 1) % 256
 
-        return retval.tobytes()
+        The result is a read-only view into a shared ring buffer, so
+        no memory is allocated per packet.
+        """
+        start = self.starting_value
+        self.starting_value = (start + self.length) % 256
+        return self.ring[start : start + self.length]
 
 
 class SOCS_FileSource:
@@ -48,10 +78,127 @@ class SOCS_FileSource:
         else:
             self.length = sched.length
 
-        self.fd = open(sched.user_data["user_data1"], "r")
+        self.loop = sched.loop
+        self.offset = 0
+        self.next_record = {
+            "fixed": self.next_fixed,
+            "line": self.next_line,
+            "prefixed": self.next_prefixed,
+        }[sched.framing]
 
-    def __call__(self, **kwds) -> bytes:
-        """Generates a bytestring of sequential values.
+        with open(sched.user_data["user_data1"], "rb") as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                # mmap refuses empty files
+                self.map = b""
+            else:
+                self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.map)
+        self.size = len(self.map)
+
+    def next_fixed(self) -> memoryview:
+        start = self.offset
+        self.offset = min(start + self.length, self.size)
+        return self.data[start : self.offset]
+
+    def next_line(self) -> memoryview:
+        start = self.offset
+        end = self.map.find(b"\n", start)
+        if end < 0:
+            self.offset = self.size
+        else:
+            self.offset = end + 1
+        return self.data[start : self.offset]
+
+    def next_prefixed(self) -> memoryview:
+        start = self.offset + LENGTH_PREFIX.size
+        if start > self.size:
+            self.offset = self.size
+            return self.data[self.size :]
+
+        (length,) = LENGTH_PREFIX.unpack_from(self.map, self.offset)
+        self.offset = min(start + length, self.size)
+        return self.data[start : self.offset]
+
+    def __call__(self, **kwds) -> memoryview:
+        """Returns the next record of the file.
+
+        The result is a read-only view into the memory-mapped file. At
+        the end of the file, empty records are returned unless the
+        schedule asks to loop back to the beginning.
+        """
+        if self.loop and self.offset >= self.size:
+            self.offset = 0
+        return self.next_record()
+
+
+class SOCS_PcapSource:
+    # Paces its schedule by the times in the capture, unless the
+    # schedule has a frequency or profile of its own.
+    timed = True
+
+    def __init__(self, sched: object) -> None:
+        self.sched = sched
+        self.path = sched.user_data["user_data1"]
+        self.length = sched.length
+        self.loop = sched.loop
+        self.speed = sched.replay_speed
+        self.packets = pcap.SOCSPcapReader(self.path).packets()
+        self.last = None
+        # Capture time covered by the packets returned so far
+        self.capture_ns = 0
+
+    def __call__(self, **kwds) -> memoryview:
+        """Returns the UDP payload of the next packet in the capture.
+
+        The result is a view into the memory-mapped capture. At the
+        end of the capture, empty packets are returned unless the
+        schedule asks to loop back to the beginning.
+        """
+        try:
+            stamp, payload = next(self.packets)
+        except StopIteration:
+            if not self.loop:
+                return b""
+            self.packets = pcap.SOCSPcapReader(self.path).packets()
+            self.last = None
+            try:
+                stamp, payload = next(self.packets)
+            except StopIteration:
+                return b""
+        if self.last is not None:
+            self.capture_ns += stamp - self.last
+        self.last = stamp
+        if self.length is not None:
+            return payload[: self.length]
+        return payload
+
+    def times(self, batch_size: int = 1) -> typing.Iterator[float]:
+        """Yields the send time of every `batch_size`-th packet, in
+        seconds from the first, as captured and scaled by
+        `replay_speed`. With a `replay_speed` of 'max', every time is
+        0, so packets are sent as fast as possible.
+        """
+        offset = 0.0
+        while True:
+            first = None
+            t = 0.0
+            packets = pcap.SOCSPcapReader(self.path).packets()
+            for i, (stamp, _) in enumerate(packets):
+                if first is None:
+                    first = stamp
+                if self.speed != "max":
+                    t = (stamp - first) / 1e9 / self.speed
+                if not i % batch_size:
+                    yield offset + t
+            if not self.loop or first is None:
+                return
+            # The next pass starts with the last packet of this one
+            offset += t
+
+    def add_result(self, result: dict) -> None:
+        """Adds how long the packets sent took in the capture, and how
+        much faster than that they were sent.
         """
-        data = self.fd.read(self.length)
-        return data.encode()
+        result["capture_time"] = self.capture_ns / 1e9
+        if result["time"]:
+            result["achieved_speed"] = result["capture_time"] / result["time"]
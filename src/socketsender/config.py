@@ -10,20 +10,192 @@ packet, the destination IP address and port number, and the delay
 between packets.
 
 A configuration file is written in a YAML format and sets the
-following properties:
+following properties. A file whose name ends in '.json' is read as
+JSON instead, which is much quicker to parse. With `--cache DIR`,
+`socketsender` keeps the validated schedules in DIR and reuses them
+until the file changes, skipping the parsing and validation.
 
 name
   The name of this schedule. It is used in reporting,
 
 target_addr
-  IP address address used as the destination of the packets.
+  IP address address used as the destination of the packets. It may
+  also be a network such as '10.0.0.0/28', which stands for each of
+  its hosts, or a list of addresses and networks, to send to several
+  targets; see `fanout`. All of them must be of one family.
 
 target_port
-  IP port number used as the destination of the packets.
+  IP port number used as the destination of the packets. It may also
+  be a range such as '5000-5007', or a list of ports and ranges. Every
+  target address is sent to on every target port.
+
+fanout
+  How the packets are shared out when there is more than one target.
+  Each packet is generated once, whatever the number of targets.
+  `frequency`, `total` and `bandwidth` count the packets generated.
+  UDP only; TCP schedules and `connect` take a single target.
+
+  broadcast
+     Every packet is sent to every target, from the same buffer. The
+     number of datagrams sent is reported. This is the default.
+
+  round-robin
+     Each packet is sent to the next target in turn.
+
+protocol
+  'udp' or 'tcp'. If not present, the value defaults to 'udp'. With
+  'tcp', the sender opens one connection when the run starts and
+  writes every packet to it, so the receiver sees a stream of bytes
+  rather than separate packets. Small writes are not delayed
+  (TCP_NODELAY), and the packets of a batch (see `batch_size`) are
+  coalesced into one write. A lost connection is reopened with
+  exponential backoff, and the number of reconnections is reported.
+  A target that cannot be reached when the run starts is tried again
+  the same way, without holding up the other schedules.
+
+reconnect_delay
+  Seconds before the first attempt to reopen a lost TCP connection.
+  The delay doubles after each failed attempt, up to 5 seconds.
+  Defaults to 0.1.
+
+connect
+  If true, the UDP socket is connected to the target once, and each
+  packet is sent with `send` rather than `sendto`, which saves the
+  kernel a route lookup per packet. ICMP errors from the target, such
+  as 'port unreachable', then surface as failed sends; the packet is
+  sent once more and dropped if that fails too. Defaults to false.
+  TCP sockets are always connected.
+
+bind_addr
+  Local IP address the packets are sent from. It must be of the same
+  family as `target_addr`. Defaults to any address.
+
+bind_port
+  Local port the packets are sent from. Defaults to a port chosen by
+  the system.
+
+sndbuf
+  Size, in bytes, of the kernel send buffer of the socket
+  (SO_SNDBUF). A larger buffer absorbs longer bursts at high rates.
+  The kernel may round or cap it; see net.core.wmem_max on Linux.
+  Defaults to the system's default.
+
+tos
+  Type of service byte of the packets sent (IP_TOS, or IPV6_TCLASS
+  for IPv6), from 0 to 255.
+
+dscp
+  Differentiated services code point of the packets sent, from 0 to
+  63; the type of service byte is `dscp` shifted left by 2. Only one
+  of `tos` and `dscp` may be given.
+
+priority
+  Linux queueing priority of the packets sent (SO_PRIORITY).
+  Priorities above 6 need the CAP_NET_ADMIN capability. Ignored, with
+  a warning, where the platform does not have it.
+
+backpressure
+  What a UDP schedule does when the kernel has no room for a packet.
+
+  block
+     The send waits until there is room, which holds up the pacing.
+     This is the default. With the asyncio engine, the packets are
+     queued instead, and the schedule waits once the queue is past
+     64 KB until it drains; the queued packets are counted as sent.
+
+  retry
+     The socket does not block. A refused packet is sent again, after
+     waiting up to a millisecond for room, up to `send_retries` times,
+     then dropped.
+
+  drop
+     The socket does not block, and a refused packet is dropped.
+
+  With 'retry' or 'drop', the number of sends the kernel refused
+  (EAGAIN or ENOBUFS), the number of datagrams dropped and the seconds
+  spent waiting for room are reported as `refused`, `dropped` and
+  `blocked_time`. TCP schedules always block.
+
+send_retries
+  Times a refused packet is sent again with the 'retry' policy.
+  Defaults to 3.
 
 frequency
   In units of packets per second. It may be a floating point or the name of
-  a function that returns a floating point.
+  a function that returns a floating point. The function is given the
+  seconds since the schedule started, and is asked ahead of time, a
+  block of packets at a time. It may be left out if `bandwidth` or
+  `profile` is given.
+
+profile
+  A rate that changes over time, instead of `frequency`. It is a list
+  of phases, run in order; the schedule ends with the last phase, or
+  before if `total` is reached. Each phase has a `duration` in seconds
+  and one of
+
+  rate
+     A constant packet rate. A rate of 0 is a pause.
+
+  ramp
+     A list of two rates; the rate changes linearly from the first to
+     the second over the phase.
+
+  sine
+     A packet rate of `mean` + `amplitude` * sin(2 pi t / `period`),
+     where t is the seconds since the start of the phase. No packets
+     are sent while the rate is 0 or less.
+
+  For instance, a warmup, sustain and cooldown::
+
+    profile:
+      - {duration: 10, ramp: [100, 10000]}
+      - {duration: 60, rate: 10000}
+      - {duration: 10, ramp: [10000, 100]}
+
+arrival
+  How the gaps between the events of a `frequency` vary. The mean gap
+  is always set by `frequency`, so the average rate is kept. It is the
+  name of a model, or a mapping of `model` to it and its parameters::
+
+    arrival: poisson
+    arrival: {model: pareto, shape: 1.2}
+
+  constant
+     Evenly spaced events. This is the default.
+
+  poisson
+     Exponential gaps, as between the events of a Poisson process.
+
+  uniform
+     Gaps uniform within `jitter` times the mean gap either side of
+     it. `jitter` is from 0 to 1, and defaults to 1.
+
+  pareto
+     Heavy-tailed gaps, from a Pareto distribution of `shape` above 1,
+     by default 1.5. The closer `shape` is to 1, the burstier the
+     traffic: most gaps are short, and a few are very long.
+
+  empirical
+     Gaps shaped like those in the file named by `file`. Each line of
+     the file holds either a sample gap, or a gap and the probability
+     of a gap no longer than it, the points of a distribution function
+     that is interpolated between them. The gaps are scaled to the
+     mean that `frequency` sets.
+
+  The random gaps are drawn with the generator seeded by `seed`. They
+  may not be used with a `profile` or a callable `frequency`.
+
+bandwidth
+  In units of bytes per second. It may be a number, or a string with
+  a unit such as '100Mbit', '2.5 MB/s' or '1Gbit/s' (the multipliers
+  k, M and G are powers of 1000). Sending is held back by a token
+  bucket, so the rate holds whatever the size of the packets. If
+  `frequency` is also given, both limits apply.
+
+bandwidth_burst
+  Bytes' worth of sending that may be saved up while the sender is
+  idle, then sent back-to-back. Defaults to 0, which spaces every
+  packet exactly.
 
 length
   Indicates the number of bytes to send per packet. A value of 'none'
@@ -44,6 +216,21 @@ source
      packets. If `length` is 'none', this function will return 128
      byte bytestrings.
 
+  file
+     Records read from the file named by `user_data1`. The file is
+     memory-mapped and each packet is a view into it, so files of any
+     size may be replayed without reading them into memory. See
+     `framing` and `loop`.
+
+  pcap
+     The UDP payloads of the packets in the pcap or pcapng capture
+     named by `user_data1`, cut to `length` if it is not 'none'. The
+     capture is read lazily, like the `file` source. Unless a
+     `frequency` or `profile` is given, which then sets the rate, the
+     packets are sent with the timing of the capture; see
+     `replay_speed`. The results report the capture time covered by
+     the packets sent and the speed achieved against it. See `loop`.
+
 total
   In units of packets. It may be an integer or the name of a function
   that returns an integer. It may also be 'infinity', which means that
@@ -53,36 +240,181 @@ delay
   Seconds until transmissions start (floating point). If not present,
   the value defaults to 0.0.
 
+catchup
+  What to do when the sender falls behind `frequency`, for instance
+  because the source was slow. If not present, the value defaults to
+  'burst'.
+
+  burst
+     Send back-to-back until the schedule is caught up, so the
+     average rate is kept.
+
+  skip
+     Forget the missed packets and carry on from the next one, so the
+     spacing is kept. The number skipped is reported.
+
+spin_time
+  Seconds before each send time that the sender busy-waits instead of
+  sleeping, because sleeping is too coarse for high rates. Larger
+  values are more precise but use more CPU; 0 disables spinning.
+  Defaults to 0.0002.
+
+batch_size
+  Number of packets generated and handed to the kernel at once. On
+  Linux, each batch is sent with a single `sendmmsg` system call;
+  elsewhere, with a tight loop of `sendto` calls. Batches are spaced
+  so the average rate is still `frequency`. Useful above about 100,000
+  packets per second, where per-call overhead dominates. Defaults
+  to 1.
+
+burst_size
+  Sends the packets in bursts of this many, back-to-back, then idles
+  until the next burst; receivers that cope with an average rate
+  often fail on such microbursts. It may also be a list of two sizes,
+  between which the size of each burst is drawn at random, with the
+  generator seeded by `seed`. A burst is sent as one batch, so with
+  the thread engine on Linux it is one `sendmmsg` system call; leave
+  out `batch_size`. The bursts are spaced so that the average rate is
+  still `frequency`, or they start every `burst_interval` seconds.
+  The time each burst took to send is reported as `burst_duration`.
+
+burst_interval
+  Seconds from the start of one burst to the start of the next,
+  instead of a `frequency`. With an `arrival` model, this is the mean.
+
+histograms
+  If true, the sender records histograms of the interval between
+  sends, the time taken by `source` and the time taken by the send
+  system call, and reports their count, min, max, mean and
+  percentiles in its results, in seconds. The memory used does not
+  grow with the length of the run. Defaults to false.
+
+seed
+  Integer seed for the `random` source and the `arrival` model. Runs
+  with the same seed send the same bytes, with the same gaps. If not
+  present, they are seeded from the system.
+
+framing
+  How the `file` source splits its file into packets. If not present,
+  the value defaults to 'fixed'.
+
+  fixed
+     Packets of `length` bytes (128 if `length` is 'none'). The last
+     packet of the file may be shorter.
+
+  line
+     One newline-terminated record per packet, including the newline.
+
+  prefixed
+     Each record is preceded by its length as a 2-byte big-endian
+     integer. The prefix is not sent.
+
+loop
+  If true, the `file` and `pcap` sources start over at the beginning
+  of the file when they reach the end. Otherwise, they return empty
+  packets from then on; a `pcap` schedule paced by its capture ends
+  at the end of the capture. Defaults to false.
+
+replay_speed
+  How much faster than captured a `pcap` source is replayed: 1 keeps
+  the original timing, 2 replays twice as fast, 0.5 half as fast. A
+  value of 'max' sends as fast as possible. Defaults to 1.
+
+random_pool
+  If present, the `random` source generates this many packets' worth
+  of random bytes once, then recycles them, slicing each packet out of
+  the pool. This is the cheapest way to send random-looking data at
+  high rates. If not present, every packet is freshly generated.
+
+stamp
+  If true, every packet is sent behind a 24-byte sequence header
+  holding the schedule, the sequence number of the packet and the
+  time it was sent, so that `socketsender-sink` can measure loss,
+  reordering and latency. It works with any `source`; the packets are
+  24 bytes longer than `length`, and the header is counted in the
+  bytes sent and in `bandwidth`. Defaults to false.
+
+prefill
+  If present, this many packets are generated from `source` before
+  the run starts, and a background thread keeps generating more while
+  the schedule sends, so a slow `source` only slows sending if it
+  cannot keep up on average. The number of times the sender had to
+  wait for a packet is reported. If not present, every packet is
+  generated just before it is sent.
+
+Templates
+---------
+
+An entry with `instances` or `each` is a template for many schedules
+that differ only in their addresses, such as the thousands of flows
+of a test of receive-side scaling. The rest of the entry is validated
+once, and the schedules are stamped out from it.
+
+instances
+  The number of schedules. Defaults to the length of the longest list
+  in `each`.
+
+each
+  A mapping of `target_addr`, `target_port`, `bind_addr` and
+  `bind_port` to lists, networks or ranges, written as for
+  `target_addr` and `target_port`. Schedule i takes item i of each,
+  starting over at the beginning of lists that are too short.
+
+Each schedule is named after the template, with its number, counting
+from 0, appended after a '-', or put in place of '{i}' if the name has
+one. For instance, 4096 flows from as many source ports::
+
+  - name: "flow{i}"
+    instances: 4096
+    target_addr: 10.0.0.2
+    target_port: 9000
+    each:
+      bind_port: 20000-24095
+    frequency: 100
+    length: 64
+    source: random
+    random_pool: 64
+    total: infinity
+
 The following properties may be implemented later:
 
 spacing
   Seconds between packets (floating point). Conflicts with `frequency`.
 
-bandwidth
-  Desired bytes per second. Conflicts with `length`.
-
 total
   May also have units of bytes.
 
 """
 
+import hashlib
 import importlib
 import ipaddress
+import json
+import logging
+import os
+import pickle
+import re
+import time
 import typing
 
-import yaml
-from schema import And, Const, Optional, Or, Schema, Use
-from socketsender import callables
+import socketsender
+from socketsender import arrivals, callables, pacing, profiles, transport
 
 # from socketsender import exceptions as uexc
 
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
 MAX_PACKET_SIZE = 65500  # Find a better value, or make it configurable
 
+IPAddress = typing.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
 
 builtin_sources = {
     "random": callables.SOCS_GenRandom,
     "sequential": callables.SOCS_SequentialSource,
     "file": callables.SOCS_FileSource,
+    "pcap": callables.SOCS_PcapSource,
 }
 
 
@@ -92,6 +424,50 @@ def to_source(source_name: str) -> typing.Callable[[int], bytes]:
     return builtin_sources[source_name]
 
 
+BANDWIDTH_RE = re.compile(
+    r"^\s*(?P<number>[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*"
+    r"(?P<multiplier>[kMG]?)(?P<unit>B|bit)?(?:/s)?\s*$"
+)
+BANDWIDTH_MULTIPLIERS = {"": 1, "k": 1e3, "M": 1e6, "G": 1e9}
+
+
+def to_bandwidth(value: typing.Union[int, float, str]) -> float:
+    """Converts a bandwidth such as '100Mbit' to bytes per second.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = BANDWIDTH_RE.match(value)
+    if match is None:
+        raise ValueError(f'Bad bandwidth "{value}"')
+    retval = float(match["number"]) * BANDWIDTH_MULTIPLIERS[match["multiplier"]]
+    if match["unit"] == "bit":
+        retval /= 8
+    return retval
+
+
+def to_addresses(value: typing.Union[str, list]) -> typing.List[IPAddress]:
+    """Expands an address, a network such as '10.0.0.0/28', or a list of
+    them, to a list of addresses.
+    """
+    if isinstance(value, list):
+        return [a for v in value for a in to_addresses(v)]
+    if isinstance(value, str) and "/" in value:
+        return list(ipaddress.ip_network(value, strict=False).hosts())
+    return [ipaddress.ip_address(value)]
+
+
+def to_ports(value: typing.Union[int, str, list]) -> typing.List[int]:
+    """Expands a port, a range such as '5000-5007', or a list of them,
+    to a list of ports.
+    """
+    if isinstance(value, list):
+        return [p for v in value for p in to_ports(v)]
+    if isinstance(value, str) and "-" in value:
+        first, _, last = value.partition("-")
+        return list(range(int(first), int(last) + 1))
+    return [int(value)]
+
+
 def from_callable(c):
     name, _, func = c.rpartition(".")
     mod = importlib.import_module(name)
@@ -106,12 +482,123 @@ class SOCSSchedule:
         Then, we must interpret some of the values.
         """
 
+        # Imported here so schedules loaded from the cache do not pay
+        # for the schemas
+        from socketsender.schemas import SchemaError, schema
+
         validated = schema.validate(data)
         self.name = validated["name"]
-        self.tgt_addr = validated["target_addr"]
-        self.tgt_port = validated["target_port"]
+        addresses = validated["target_addr"]
+        ports = validated["target_port"]
+        if len({a.version for a in addresses}) > 1:
+            raise SchemaError("The target addresses must be of one family")
+        self.tgt_addr = addresses[0]
+        self.tgt_port = ports[0]
         self.ip_addr = (str(self.tgt_addr), self.tgt_port)
-        self.frequency = validated["frequency"]
+        self.targets = [(str(a), p) for a in addresses for p in ports]
+
+        if "fanout" in validated:
+            self.fanout = validated["fanout"]
+        else:
+            self.fanout = "broadcast"
+        # Datagrams sent per packet generated
+        self.copies = len(self.targets) if self.fanout == "broadcast" else 1
+
+        if "protocol" in validated:
+            self.protocol = validated["protocol"]
+        else:
+            self.protocol = "udp"
+
+        if "reconnect_delay" in validated:
+            self.reconnect_delay = validated["reconnect_delay"]
+        else:
+            self.reconnect_delay = transport.RECONNECT_DELAY
+
+        if "connect" in validated:
+            self.connect = validated["connect"]
+        else:
+            self.connect = False
+
+        if len(self.targets) > 1 and (self.protocol == "tcp" or self.connect):
+            raise SchemaError("TCP and connected schedules take a single target")
+
+        if "bind_addr" in validated:
+            if validated["bind_addr"].version != self.tgt_addr.version:
+                raise SchemaError("bind_addr and target_addr must be of one family")
+            self.bind_addr = str(validated["bind_addr"])
+        else:
+            self.bind_addr = None
+
+        if "bind_port" in validated:
+            self.bind_port = validated["bind_port"]
+        else:
+            self.bind_port = None
+
+        if "sndbuf" in validated:
+            self.sndbuf = validated["sndbuf"]
+        else:
+            self.sndbuf = None
+
+        if "tos" in validated and "dscp" in validated:
+            raise SchemaError("Only one of tos and dscp may be given")
+        if "tos" in validated:
+            self.tos = validated["tos"]
+        elif "dscp" in validated:
+            self.tos = validated["dscp"] << 2
+        else:
+            self.tos = None
+
+        if "priority" in validated:
+            self.priority = validated["priority"]
+        else:
+            self.priority = None
+
+        if "backpressure" in validated:
+            self.backpressure = validated["backpressure"]
+        else:
+            self.backpressure = "block"
+        if self.backpressure != "block" and self.protocol == "tcp":
+            raise SchemaError("TCP schedules always block")
+
+        if "send_retries" in validated:
+            self.send_retries = validated["send_retries"]
+        else:
+            self.send_retries = transport.SEND_RETRIES
+
+        rates = {"frequency", "bandwidth", "profile", "burst_interval"} & set(validated)
+        if not rates and not getattr(validated["source"], "timed", False):
+            raise SchemaError(
+                "Either frequency, bandwidth, profile or burst_interval must be given"
+            )
+        if "frequency" in validated and "profile" in validated:
+            raise SchemaError("Only one of frequency and profile may be given")
+
+        if "frequency" in validated:
+            self.frequency = validated["frequency"]
+        else:
+            self.frequency = None
+
+        if "profile" in validated:
+            self.profile = profiles.SOCSProfile(
+                [profiles.to_phase(p) for p in validated["profile"]]
+            )
+        elif callable(self.frequency):
+            self.profile = profiles.SOCSProfile(
+                [profiles.SOCSCallablePhase(self.frequency)]
+            )
+        else:
+            self.profile = None
+
+        if "bandwidth" in validated:
+            self.bandwidth = validated["bandwidth"]
+        else:
+            self.bandwidth = None
+
+        if "bandwidth_burst" in validated:
+            self.bandwidth_burst = validated["bandwidth_burst"]
+        else:
+            self.bandwidth_burst = 0.0
+
         self.length = self.validate_length(validated)
         self.total = self.validate_total(validated)
 
@@ -120,6 +607,75 @@ class SOCSSchedule:
         else:
             self.delay = 0.0
 
+        if "catchup" in validated:
+            self.catchup = validated["catchup"]
+        else:
+            self.catchup = "burst"
+
+        if "spin_time" in validated:
+            self.spin_time = validated["spin_time"]
+        else:
+            self.spin_time = pacing.SPIN_TIME
+
+        if "batch_size" in validated:
+            self.batch_size = validated["batch_size"]
+        else:
+            self.batch_size = 1
+
+        self.validate_bursts(validated)
+
+        if "histograms" in validated:
+            self.histograms = validated["histograms"]
+        else:
+            self.histograms = False
+
+        if "seed" in validated:
+            self.seed = validated["seed"]
+        else:
+            self.seed = None
+
+        if "arrival" in validated:
+            if self.profile is not None or self.frequency is None:
+                raise SchemaError("arrival needs a frequency that is a number")
+            self.arrival_data = validated["arrival"]
+            try:
+                self.arrival = arrivals.to_model(self.arrival_data, self.seed)
+            except (OSError, ValueError) as exc:
+                raise SchemaError(f"Bad arrival: {exc}") from exc
+        else:
+            self.arrival_data = None
+            self.arrival = None
+
+        if "random_pool" in validated:
+            self.random_pool = validated["random_pool"]
+        else:
+            self.random_pool = None
+
+        if "framing" in validated:
+            self.framing = validated["framing"]
+        else:
+            self.framing = "fixed"
+
+        if "loop" in validated:
+            self.loop = validated["loop"]
+        else:
+            self.loop = False
+
+        if "replay_speed" in validated:
+            self.replay_speed = validated["replay_speed"]
+        else:
+            self.replay_speed = 1.0
+
+        if "stamp" in validated:
+            self.stamp = validated["stamp"]
+        else:
+            self.stamp = False
+
+        if "prefill" in validated:
+            self.prefill = validated["prefill"]
+        else:
+            self.prefill = None
+
         self.user_data = dict()
 
         if "user_data1" in validated:
@@ -128,7 +684,61 @@ class SOCSSchedule:
         if "user_data2" in validated:
             self.user_data["user_data2"] = validated["user_data2"]
 
-        self.source = validated["source"](self)
+        self.source_factory = validated["source"]
+        self.source = self.source_factory(self)
+
+    def instance(
+        self,
+        name: str,
+        target_addr: typing.Optional[IPAddress] = None,
+        target_port: typing.Optional[int] = None,
+        bind_addr: typing.Optional[IPAddress] = None,
+        bind_port: typing.Optional[int] = None,
+    ) -> "SOCSSchedule":
+        """A copy of this schedule named `name`, with the addresses and
+        ports given instead of its own, and a source of its own.
+
+        Nothing is validated again, so the values must already be.
+        """
+        # Not copy.copy, which would build a source through __setstate__
+        retval = SOCSSchedule.__new__(SOCSSchedule)
+        retval.__dict__.update(self.__dict__)
+        retval.name = name
+        addresses = list(dict.fromkeys(a for a, _ in self.targets))
+        ports = list(dict.fromkeys(p for _, p in self.targets))
+        if target_addr is not None:
+            addresses = [str(target_addr)]
+            retval.tgt_addr = target_addr
+        if target_port is not None:
+            ports = [target_port]
+            retval.tgt_port = target_port
+        retval.ip_addr = (str(retval.tgt_addr), retval.tgt_port)
+        retval.targets = [(a, p) for a in addresses for p in ports]
+        retval.copies = len(retval.targets) if retval.fanout == "broadcast" else 1
+        if bind_addr is not None:
+            retval.bind_addr = str(bind_addr)
+        if bind_port is not None:
+            retval.bind_port = bind_port
+        retval.source = retval.source_factory(retval)
+        return retval
+
+    def __getstate__(self) -> dict:
+        """Sources may hold open files and mappings, so a pickled
+        schedule leaves its source behind and builds a fresh one when
+        it is unpickled. So does its arrival model, which may have been
+        read from a file that has changed since.
+        """
+        state = self.__dict__.copy()
+        del state["source"]
+        del state["arrival"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.source = self.source_factory(self)
+        self.arrival = None
+        if self.arrival_data is not None:
+            self.arrival = arrivals.to_model(self.arrival_data, self.seed)
 
     def validate_length(self, schema_data):
         """`length` can have a special value of `none`.
@@ -151,6 +761,38 @@ class SOCSSchedule:
 
         return retval
 
+    def validate_bursts(self, validated: dict) -> None:
+        """Sets the burst sizes and interval, and the `frequency` and
+        `batch_size` that follow from them.
+        """
+        from socketsender.schemas import SchemaError
+
+        self.burst_sizes = None
+        self.burst_interval = None
+        if "burst_size" not in validated:
+            if "burst_interval" in validated:
+                raise SchemaError("burst_interval needs a burst_size")
+            return
+        if "batch_size" in validated:
+            raise SchemaError("A burst is sent as one batch; leave out batch_size")
+        if self.profile is not None:
+            raise SchemaError("Bursts may not follow a profile")
+        if "burst_interval" in validated and self.frequency is not None:
+            raise SchemaError("Only one of frequency and burst_interval may be given")
+
+        sizes = validated["burst_size"]
+        if isinstance(sizes, int):
+            sizes = [sizes, sizes]
+        low, high = sizes
+        self.burst_sizes = (low, high)
+        self.batch_size = high
+        mean = (low + high) / 2
+        if "burst_interval" in validated:
+            self.burst_interval = validated["burst_interval"]
+            self.frequency = mean / self.burst_interval
+        elif self.frequency is not None:
+            self.burst_interval = mean / self.frequency
+
     def validate_total(self, schema_data):
         """`total` can have a special value of `infinity`.
         """
@@ -178,11 +820,21 @@ class SOCSSchedule:
             f"    target_addr: {self.tgt_addr}",
             f"    target_port: {self.tgt_port}",
             f"    frequency:   {self.frequency} packets/sec",
-            f"    length:      {self.length} bytes/packet",
-            f"    source:      {self.source.__class__.__name__}",
-            f"    total:       {self.total} bytes for all packets",
-            f"    delay:       {self.delay} sec",
         ]
+        if len(self.targets) > 1:
+            retval.append(f"    targets:     {len(self.targets)} ({self.fanout})")
+        if self.protocol != "udp":
+            retval.append(f"    protocol:    {self.protocol}")
+        if self.bandwidth is not None:
+            retval.append(f"    bandwidth:   {self.bandwidth} bytes/sec")
+        retval.extend(
+            [
+                f"    length:      {self.length} bytes/packet",
+                f"    source:      {self.source.__class__.__name__}",
+                f"    total:       {self.total} bytes for all packets",
+                f"    delay:       {self.delay} sec",
+            ]
+        )
         udat = list()
         if "user_data1" in self.user_data:
             udat.append(f"    user_data1 is \"{self.user_data['user_data1']}\"")
@@ -194,23 +846,223 @@ class SOCSSchedule:
         return "\n".join(retval) + "\n"
 
 
-schema = Schema(
-    {
-        "name": And(str, len),
-        "target_addr": Use(ipaddress.ip_address),
-        "target_port": And(Use(int), lambda n: 0 <= n <= 65535),
-        "frequency": Or(callable, Const(And(Use(float), lambda n: 0 < n))),
-        "length": Or("none", And(Use(int), lambda n: 0 < n)),
-        "source": Or(callable, Use(to_source), Use(from_callable)),
-        "total": Or("infinity", And(Use(int), lambda n: 0 < n)),
-        Optional("delay"): And(Or(int, float), Use(float), lambda f: f > 0.0),
-        Optional("user_data1"): str,
-        Optional("user_data2"): str,
-    }
-)
+class SOCSTargets:
+    def __init__(self, data: dict) -> None:
+        """The name and targets of a configuration section, for the
+        receiving end of a run.
+
+        Only those are validated. Nothing else is built, so the sources
+        of the schedule, and any files or modules they need, do not
+        have to be there.
+        """
+        from socketsender.schemas import SchemaError, targets_schema
+
+        validated = targets_schema.validate(data)
+        self.name = validated["name"]
+        addresses = validated["target_addr"]
+        ports = validated["target_port"]
+        if len({a.version for a in addresses}) > 1:
+            raise SchemaError("The target addresses must be of one family")
+        self.tgt_addr = addresses[0]
+        self.targets = [(str(a), p) for a in addresses for p in ports]
+
+        if "fanout" in validated:
+            self.fanout = validated["fanout"]
+        else:
+            self.fanout = "broadcast"
+        self.copies = len(self.targets) if self.fanout == "broadcast" else 1
+
+        if "protocol" in validated:
+            self.protocol = validated["protocol"]
+        else:
+            self.protocol = "udp"
+
+    def instance(
+        self,
+        name: str,
+        target_addr: typing.Optional[IPAddress] = None,
+        target_port: typing.Optional[int] = None,
+        bind_addr: typing.Optional[IPAddress] = None,
+        bind_port: typing.Optional[int] = None,
+    ) -> "SOCSTargets":
+        """As `SOCSSchedule.instance`; the local address is not kept.
+        """
+        retval = SOCSTargets.__new__(SOCSTargets)
+        retval.__dict__.update(self.__dict__)
+        retval.name = name
+        addresses = list(dict.fromkeys(a for a, _ in self.targets))
+        ports = list(dict.fromkeys(p for _, p in self.targets))
+        if target_addr is not None:
+            addresses = [str(target_addr)]
+            retval.tgt_addr = target_addr
+        if target_port is not None:
+            ports = [target_port]
+        retval.targets = [(a, p) for a in addresses for p in ports]
+        retval.copies = len(retval.targets) if retval.fanout == "broadcast" else 1
+        return retval
 
 
-def get_schedules(stream: typing.TextIO) -> typing.List[SOCSSchedule]:
+Schedules = typing.Union[typing.Type[SOCSSchedule], typing.Type[SOCSTargets]]
+
+
+def expand(data: dict, kind: Schedules = SOCSSchedule) -> typing.Iterator[SOCSSchedule]:
+    """Yields the schedules of the template `data`, as `kind`.
+
+    The template is validated once, as its first schedule, and the
+    others are copies of that one with their own addresses.
+    """
+    from socketsender.schemas import SchemaError, template_schema
+
+    data = dict(data)
+    template = template_schema.validate(
+        {k: data.pop(k) for k in ("instances", "each") if k in data}
+    )
+    each = template.get("each", dict())
+    if "instances" in template:
+        count = template["instances"]
+    elif each:
+        count = max(len(values) for values in each.values())
+    else:
+        count = 1
+
+    for key, values in each.items():
+        data[key] = values[0] if key.endswith("_port") else str(values[0])
+    base = kind(data)
+    for key in ("target_addr", "bind_addr"):
+        if any(a.version != base.tgt_addr.version for a in each.get(key, [])):
+            raise SchemaError(f"The addresses in each {key} must be of one family")
+
+    name = base.name
+    for i in range(0, count):
+        if "{i}" in name:
+            instance_name = name.replace("{i}", str(i))
+        else:
+            instance_name = f"{name}-{i}"
+        yield base.instance(
+            instance_name, **{k: v[i % len(v)] for k, v in each.items()}
+        )
+
+
+def parse(text: typing.Union[str, bytes], name: str = "") -> list:
+    """The entries of the configuration `text`, read from a file called
+    `name`.
+
+    A file whose name ends in '.json' is read as JSON, which parses much
+    faster than YAML; anything else is read as YAML.
+    """
+    if name.endswith(".json"):
+        return json.loads(text)
+    # Imported here so JSON and cached configurations do not pay for it
+    import yaml
+
+    # PyYAML's C parser, where it was built with libyaml
+    return yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def from_entries(
+    entries: list, kind: Schedules = SOCSSchedule
+) -> typing.Iterator[SOCSSchedule]:
+    """Yields the schedules of the parsed `entries`, as `kind`,
+    expanding templates as it goes.
+    """
+    for entry in entries:
+        if "instances" in entry or "each" in entry:
+            yield from expand(entry, kind)
+        else:
+            yield kind(entry)
+
+
+def iter_schedules(
+    stream: typing.Union[str, typing.TextIO]
+) -> typing.Iterator[SOCSSchedule]:
+    """Yields the schedules configured in `stream`, a string or a file,
+    expanding templates as it goes.
+    """
+    if isinstance(stream, str):
+        return from_entries(parse(stream))
+    return from_entries(parse(stream.read(), getattr(stream, "name", "")))
+
+
+def get_schedules(
+    stream: typing.Union[str, typing.TextIO]
+) -> typing.List[SOCSSchedule]:
     # max_packet_size = 65500
-    data: list = yaml.safe_load(stream)
-    return [SOCSSchedule(i) for i in data]
+    return list(iter_schedules(stream))
+
+
+def get_targets(stream: typing.Union[str, typing.TextIO]) -> typing.List[SOCSTargets]:
+    """The names and targets of the schedules configured in `stream`, a
+    string or a file, without building the schedules.
+    """
+    if isinstance(stream, str):
+        entries = parse(stream)
+    else:
+        entries = parse(stream.read(), getattr(stream, "name", ""))
+    return list(from_entries(entries, SOCSTargets))
+
+
+def load(
+    stream: typing.IO,
+    cache_dir: typing.Optional[str] = None,
+    timings: typing.Optional[dict] = None,
+) -> typing.List[SOCSSchedule]:
+    """Reads the schedules configured in the file `stream`.
+
+    With a `cache_dir`, the schedules are pickled into it, keyed on the
+    hash of the configuration and the version of socketsender, and a
+    later load of the same configuration unpickles them instead of
+    parsing and validating it again. Sources and arrival models are not
+    cached; each schedule builds fresh ones when it is unpickled, from
+    files read again. Functions named in the configuration are pickled
+    by name, so they must still be importable.
+
+    The seconds spent are put in `timings`, if given, under 'parse' and
+    'validate', or under 'cache' for a configuration found in the cache.
+    """
+    timings = dict() if timings is None else timings
+    data = stream.read()
+    raw = data.encode() if isinstance(data, str) else data
+    path = None
+    if cache_dir is not None:
+        key = hashlib.sha256(socketsender.__version__.encode() + b"\0" + raw)
+        path = os.path.join(cache_dir, key.hexdigest() + ".pickle")
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as fd:
+                schedules = pickle.load(fd)
+            timings["cache"] = time.perf_counter() - start
+            return schedules
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            log.warning('Ignoring the cached configuration "%s": %s', path, exc)
+
+    start = time.perf_counter()
+    entries = parse(data, getattr(stream, "name", ""))
+    parsed = time.perf_counter()
+    schedules = list(from_entries(entries))
+    timings["parse"] = parsed - start
+    timings["validate"] = time.perf_counter() - parsed
+
+    if path is not None:
+        # Written aside and renamed, so concurrent runs never read half
+        # a file
+        temp = f"{path}.{os.getpid()}"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(temp, "wb") as fd:
+                pickle.dump(schedules, fd, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except OSError as exc:
+            log.warning('Cannot cache the configuration in "%s": %s', path, exc)
+    return schedules
+
+
+def __getattr__(name: str) -> typing.Any:
+    """Gives `schema` and the other schemas, from `socketsender.schemas`.
+    """
+    if name in ("schema", "targets_schema", "template_schema", "phase_schema"):
+        from socketsender import schemas
+
+        return getattr(schemas, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,98 @@
+"""The sequence header that lets a sink check what it receives.
+
+A packet that carries the header starts with
+
+=======  ======  ==================================================
+Offset   Size    Field
+=======  ======  ==================================================
+0        4       Magic, b"SOCS"
+4        4       Schedule id, the CRC-32 of the schedule name
+8        8       Sequence number, counting from 0 in each schedule
+16       8       Send time, in nanoseconds since the epoch
+=======  ======  ==================================================
+
+All fields are big-endian. The rest of the packet is the payload.
+
+A schedule with `stamp` set sends every packet from its source behind
+this header, through a `SOCSStamper`.
+"""
+
+import struct
+import time
+import typing
+import zlib
+
+MAGIC = b"SOCS"
+HEADER = struct.Struct("!4sIQQ")
+SIZE = HEADER.size
+
+
+class SOCSHeader(typing.NamedTuple):
+    schedule_id: int
+    seq: int
+    time_ns: int
+
+
+def schedule_id(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+def unpack(data: bytes) -> typing.Optional[SOCSHeader]:
+    """The header at the start of `data`, or None if it has none.
+    """
+    if len(data) < SIZE or data[:4] != MAGIC:
+        return None
+    _, schedule, seq, time_ns = HEADER.unpack_from(data)
+    return SOCSHeader(schedule, seq, time_ns)
+
+
+class SOCSStamper:
+    def __init__(self, name: str, count: int = 1, size: int = 65536) -> None:
+        """Puts the header of schedule `name` in front of packets of up
+        to `size` bytes.
+
+        Each of the `count` packets of a batch is copied behind the
+        header in its own preallocated buffer, so stamping allocates
+        nothing but the views returned. A buffer is only replaced with
+        a larger one for a packet longer than `size`. The send time is
+        read just before the header is packed.
+        """
+        self.schedule_id = schedule_id(name)
+        self.seq = 0
+        self.buffers = [bytearray(SIZE + size) for _ in range(0, count)]
+        self.views = [memoryview(b) for b in self.buffers]
+
+    def stamp(self, data: bytes, slot: int = 0) -> memoryview:
+        """Stamps `data` into buffer `slot`, and returns a view of the
+        stamped packet, valid until the slot is stamped again.
+        """
+        end = SIZE + len(data)
+        buffer = self.buffers[slot]
+        if end > len(buffer):
+            # The view pins the old buffer, which cannot grow in place
+            buffer = self.buffers[slot] = bytearray(end)
+            self.views[slot] = memoryview(buffer)
+        buffer[SIZE:end] = data
+        HEADER.pack_into(buffer, 0, MAGIC, self.schedule_id, self.seq, time.time_ns())
+        self.seq += 1
+        return self.views[slot][:end]
+
+    def wrap(
+        self, send: typing.Callable[[bytes], None]
+    ) -> typing.Callable[[bytes], None]:
+        stamp = self.stamp
+
+        def stamped_send(data):
+            send(stamp(data))
+
+        return stamped_send
+
+    def wrap_batch(
+        self, send_batch: typing.Callable[[typing.List[bytes]], None]
+    ) -> typing.Callable[[typing.List[bytes]], None]:
+        stamp = self.stamp
+
+        def stamped_send_batch(packets):
+            send_batch([stamp(data, i) for i, data in enumerate(packets)])
+
+        return stamped_send_batch
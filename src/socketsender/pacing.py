@@ -0,0 +1,285 @@
+"""Decides when each packet of a schedule is sent.
+
+Deadlines are absolute times on the `time.perf_counter_ns` clock,
+computed from the start of the run, so the time spent generating and
+sending packets does not accumulate as drift. Waiting for a deadline
+sleeps for most of the time, then spins for the last stretch, which
+`time.sleep` is too coarse to hit.
+
+A schedule with a rate `profile`, a callable `frequency` or a random
+`arrival` model takes its deadlines from a table that is refilled a
+block at a time.
+
+A schedule with a `bandwidth` is also held back by a token bucket.
+"""
+
+import time
+import typing
+
+from socketsender import profiles
+
+CATCHUP_POLICIES = ("burst", "skip")
+
+# Default stretch before a deadline that is spun rather than slept, in
+# seconds
+SPIN_TIME = 0.0002
+
+# Deadlines computed at a time by a table pacer
+BLOCK_SIZE = 1024
+
+# Seconds of lateness credited back to a token bucket, so that waking
+# up late does not lower the rate
+BUCKET_SLACK = 0.001
+
+
+def wait_until(deadline: int, spin_ns: int) -> None:
+    """Sleeps, then spins, until `time.perf_counter_ns` reaches `deadline`.
+    """
+    remaining = deadline - time.perf_counter_ns()
+    if remaining > spin_ns:
+        time.sleep((remaining - spin_ns) / 1e9)
+    if remaining > 0:
+        perf_counter_ns = time.perf_counter_ns
+        while perf_counter_ns() < deadline:
+            pass
+
+
+class SOCSPacer:
+    def __init__(
+        self, period: float, catchup: str = "burst", spin_time: float = SPIN_TIME
+    ) -> None:
+        """Paces events `period` seconds apart.
+
+        When the sender falls behind, the `catchup` policy decides
+        what happens to the deadlines it missed.
+
+        burst
+           Send back-to-back until the schedule is caught up.
+
+        skip
+           Forget the missed deadlines and carry on from the next one.
+        """
+        self.period_ns = period * 1e9
+        self.catchup = catchup
+        self.spin_ns = int(spin_time * 1e9)
+        self.start_ns = 0
+        self.index = 0
+        self.deadline = 0
+        self.skipped = 0
+
+    @property
+    def finished(self) -> bool:
+        """True once there are no more deadlines.
+        """
+        return False
+
+    def start(self) -> None:
+        """Starts the clock at the first event, which happens now.
+        """
+        self.start_ns = time.perf_counter_ns()
+        self.index = 1
+        self.deadline = self.start_ns + int(self.period_ns)
+
+    def remaining(self) -> int:
+        """Nanoseconds until the current deadline, negative if it is past.
+        """
+        return self.deadline - time.perf_counter_ns()
+
+    def lag(self) -> float:
+        """Seconds the sender is behind its deadlines, or 0.
+        """
+        if not self.period_ns:
+            return 0.0
+        return max(0, time.perf_counter_ns() - self.deadline) / 1e9
+
+    def advance(self) -> None:
+        """Moves on to the next deadline.
+        """
+        if self.catchup == "skip":
+            late = time.perf_counter_ns() - self.deadline
+            if late >= self.period_ns > 0:
+                missed = int(late // self.period_ns)
+                self.skipped += missed
+                self.index += missed
+        self.index += 1
+        self.deadline = self.start_ns + int(self.index * self.period_ns)
+
+    def wait(self) -> None:
+        """Blocks until the current deadline, then advances to the next.
+        """
+        wait_until(self.deadline, self.spin_ns)
+        self.advance()
+
+
+class SOCSTablePacer(SOCSPacer):
+    def __init__(
+        self,
+        times: typing.Iterator[float],
+        catchup: str = "burst",
+        spin_time: float = SPIN_TIME,
+    ) -> None:
+        """Paces events at `times`, in seconds from the first event.
+
+        The times are read BLOCK_SIZE at a time into a table of
+        nanoseconds. When they run out, the pacer is `finished`. With
+        the 'skip' `catchup` policy, every deadline that is past when
+        the next one is due is skipped.
+        """
+        super().__init__(0.0, catchup, spin_time)
+        self.times = times
+        self.table = list()
+        self.position = 0
+        self.first = 0
+        self.upcoming = None
+
+    @property
+    def finished(self) -> bool:
+        return self.deadline is None
+
+    def pull(self) -> typing.Optional[int]:
+        """The next deadline from the table, or None if there are no more.
+        """
+        if self.position >= len(self.table):
+            self.table = profiles.block(self.times, BLOCK_SIZE)
+            self.position = 0
+            if not self.table:
+                return None
+        offset = self.table[self.position]
+        self.position += 1
+        return self.start_ns + offset
+
+    def start(self) -> None:
+        """Starts the clock at the first event, which happens now.
+        """
+        now = time.perf_counter_ns()
+        self.start_ns = now
+        first = self.pull()
+        if first is None:
+            self.deadline = None
+            return
+        # A profile that starts with a pause starts with its first event
+        self.start_ns = now - (first - now)
+        self.index = 1
+        self.deadline = self.pull()
+        self.upcoming = None if self.deadline is None else self.pull()
+
+    def lag(self) -> float:
+        if self.deadline is None:
+            return 0.0
+        return max(0, time.perf_counter_ns() - self.deadline) / 1e9
+
+    def advance(self) -> None:
+        self.index += 1
+        self.deadline = self.upcoming
+        if self.deadline is None:
+            return
+        self.upcoming = self.pull()
+        if self.catchup == "skip":
+            now = time.perf_counter_ns()
+            while self.upcoming is not None and self.upcoming <= now:
+                self.skipped += 1
+                self.index += 1
+                self.deadline = self.upcoming
+                self.upcoming = self.pull()
+
+
+class SOCSTokenBucket:
+    def __init__(
+        self, rate: float, burst: float = 0.0, spin_time: float = SPIN_TIME
+    ) -> None:
+        """Limits sending to `rate` bytes per second.
+
+        While the sender is idle, up to `burst` bytes' worth of tokens
+        accumulate and may then be sent back-to-back. A packet may be
+        sent whenever the bucket is not in debt, and its size is then
+        taken out, so packets bigger than `burst` still go out and the
+        rate holds whatever the packet sizes.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.capacity = burst + rate * BUCKET_SLACK
+        self.spin_ns = int(spin_time * 1e9)
+        self.tokens = burst
+        self.last = 0
+        self.start_ns = 0
+        self.consumed = 0
+
+    def start(self) -> None:
+        self.tokens = self.burst
+        self.last = time.perf_counter_ns()
+        self.start_ns = self.last
+        self.consumed = 0
+
+    def lag(self) -> float:
+        """Seconds the sender is behind `rate`, or 0.
+        """
+        due = self.start_ns + self.consumed * 1e9 / self.rate
+        return max(0, time.perf_counter_ns() - due) / 1e9
+
+    def consume(self, size: int) -> None:
+        """Takes out the tokens for `size` bytes that were just sent.
+        """
+        now = time.perf_counter_ns()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last) * self.rate / 1e9
+        )
+        self.tokens -= size
+        self.last = now
+        self.consumed += size
+
+    def remaining(self) -> int:
+        """Nanoseconds until the bucket is out of debt, or 0.
+        """
+        if self.tokens >= 0:
+            return 0
+        return int(-self.tokens * 1e9 / self.rate) + self.last - time.perf_counter_ns()
+
+    def wait(self) -> None:
+        """Blocks until the bucket is out of debt.
+        """
+        if self.tokens < 0:
+            wait_until(self.last + int(-self.tokens * 1e9 / self.rate), self.spin_ns)
+
+
+def period(schedule: object) -> float:
+    """The mean seconds between the events of `schedule`, which has a
+    `frequency`.
+    """
+    if schedule.burst_interval is not None:
+        return schedule.burst_interval
+    return schedule.batch_size / schedule.frequency
+
+
+def make_pacer(schedule: object, spin: bool = True) -> SOCSPacer:
+    """Builds the pacer for `schedule`, which spins before deadlines
+    only if `spin` is true.
+    """
+    spin_time = schedule.spin_time if spin else 0.0
+    if schedule.profile is not None:
+        times = schedule.profile.times(schedule.batch_size)
+        return SOCSTablePacer(times, schedule.catchup, spin_time)
+    if schedule.arrival is not None:
+        times = schedule.arrival.times(period(schedule))
+        return SOCSTablePacer(times, schedule.catchup, spin_time)
+    if schedule.frequency is None and getattr(schedule.source, "timed", False):
+        # Paced by the source, as a pcap source is by its capture
+        times = schedule.source.times(schedule.batch_size)
+        return SOCSTablePacer(times, schedule.catchup, spin_time)
+    if schedule.frequency is None:
+        # Paced by bandwidth alone
+        return SOCSPacer(0.0, schedule.catchup, spin_time)
+    return SOCSPacer(period(schedule), schedule.catchup, spin_time)
+
+
+def make_bucket(
+    schedule: object, spin: bool = True
+) -> typing.Optional[SOCSTokenBucket]:
+    """Builds the token bucket for `schedule`, if it has a `bandwidth`.
+    """
+    if schedule.bandwidth is None:
+        return None
+    return SOCSTokenBucket(
+        schedule.bandwidth,
+        schedule.bandwidth_burst,
+        schedule.spin_time if spin else 0.0,
+    )
@@ -0,0 +1,192 @@
+"""Reads the UDP payloads out of pcap and pcapng capture files.
+
+The file is memory-mapped and walked one record at a time, so
+captures of any size are read without loading them into memory, and
+each payload is a view into the mapping.
+
+Ethernet (with VLAN tags), raw IP, Linux cooked (v1 and v2) and BSD
+loopback link types are understood. IPv4 fragments and anything that
+is not UDP are skipped.
+"""
+
+import mmap
+import os
+import struct
+import typing
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+# Option of an interface description block
+IF_TSRESOL = 9
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLANS = (0x8100, 0x88A8, 0x9100)
+
+IPPROTO_UDP = 17
+# IPv6 extension headers that are skipped to find the UDP header
+IPV6_EXTENSIONS = (0, 43, 60)
+
+
+class SOCSPcapError(Exception):
+    pass
+
+
+def ip_payload(data: memoryview) -> typing.Optional[memoryview]:
+    """The UDP payload of the IP packet `data`, or None.
+    """
+    if len(data) < 1:
+        return None
+    version = data[0] >> 4
+    if version == 4:
+        if len(data) < 20:
+            return None
+        header = (data[0] & 0x0F) * 4
+        total = (data[2] << 8) | data[3]
+        fragment = ((data[6] << 8) | data[7]) & 0x3FFF
+        if data[9] != IPPROTO_UDP or fragment:
+            return None
+        udp = data[header:total]
+    elif version == 6:
+        if len(data) < 40:
+            return None
+        length = (data[4] << 8) | data[5]
+        following = data[6]
+        udp = data[40 : 40 + length]
+        while following in IPV6_EXTENSIONS and len(udp) >= 8:
+            following = udp[0]
+            udp = udp[(udp[1] + 1) * 8 :]
+        if following != IPPROTO_UDP:
+            return None
+    else:
+        return None
+    if len(udp) < 8:
+        return None
+    length = (udp[4] << 8) | udp[5]
+    return udp[8:length]
+
+
+def udp_payload(linktype: int, frame: memoryview) -> typing.Optional[memoryview]:
+    """The UDP payload of a captured `frame`, or None if it has none.
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        ethertype = (frame[12] << 8) | frame[13] if len(frame) >= 14 else 0
+        while ethertype in ETHERTYPE_VLANS and len(frame) >= offset + 6:
+            offset += 4
+            ethertype = (frame[offset] << 8) | frame[offset + 1]
+        if ethertype not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+            return None
+        return ip_payload(frame[offset + 2 :])
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return ip_payload(frame)
+    if linktype == LINKTYPE_LINUX_SLL:
+        return ip_payload(frame[16:])
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return ip_payload(frame[20:])
+    if linktype == LINKTYPE_NULL:
+        return ip_payload(frame[4:])
+    return None
+
+
+class SOCSPcapReader:
+    def __init__(self, path: str) -> None:
+        """Reads the capture in the file at `path`.
+        """
+        with open(path, "rb") as fd:
+            if os.fstat(fd.fileno()).st_size < 4:
+                raise SOCSPcapError(f'"{path}" is not a capture file')
+            self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.map)
+        (magic,) = struct.unpack_from("<I", self.map)
+        if magic == PCAPNG_SHB:
+            self.records = self.pcapng_records
+        elif magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self.records = self.pcap_records
+            self.order = "<"
+        elif struct.unpack_from(">I", self.map)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self.records = self.pcap_records
+            self.order = ">"
+        else:
+            raise SOCSPcapError(f'"{path}" is not a capture file')
+
+    def pcap_records(self) -> typing.Iterator[typing.Tuple[int, int, memoryview]]:
+        order = self.order
+        magic, linktype = struct.unpack_from(order + "I16xI", self.map)
+        scale = 1 if magic == PCAP_MAGIC_NS else 1000
+        record = struct.Struct(order + "IIII")
+        offset = 24
+        size = len(self.map)
+        while offset + record.size <= size:
+            seconds, fraction, captured, _ = record.unpack_from(self.map, offset)
+            offset += record.size
+            frame = self.data[offset : offset + captured]
+            offset += captured
+            yield seconds * 1000000000 + fraction * scale, linktype, frame
+
+    def pcapng_records(self) -> typing.Iterator[typing.Tuple[int, int, memoryview]]:
+        order = "<"
+        # Interface -> (link type, nanoseconds per timestamp unit)
+        interfaces = list()
+        offset = 0
+        size = len(self.map)
+        while offset + 12 <= size:
+            block_type = struct.unpack_from(order + "I", self.map, offset)[0]
+            if block_type == PCAPNG_SHB:
+                (byte_order,) = struct.unpack_from("<I", self.map, offset + 8)
+                order = "<" if byte_order == PCAPNG_BYTE_ORDER else ">"
+                interfaces = list()
+            (length,) = struct.unpack_from(order + "I", self.map, offset + 4)
+            if length < 12:
+                raise SOCSPcapError(f"Bad pcapng block at offset {offset}")
+            body = self.data[offset + 8 : offset + length - 4]
+            offset += length
+            if block_type == PCAPNG_IDB:
+                (linktype,) = struct.unpack_from(order + "H", body)
+                interfaces.append((linktype, self.resolution(body[8:], order)))
+            elif block_type == PCAPNG_EPB:
+                interface, high, low, captured = struct.unpack_from(
+                    order + "IIII", body
+                )
+                linktype, unit = interfaces[interface]
+                stamp = ((high << 32) | low) * unit
+                yield int(stamp), linktype, body[20 : 20 + captured]
+
+    @staticmethod
+    def resolution(options: memoryview, order: str) -> float:
+        """Nanoseconds per timestamp unit, from an interface's options.
+        """
+        offset = 0
+        while offset + 4 <= len(options):
+            code, length = struct.unpack_from(order + "HH", options, offset)
+            if code == 0:
+                break
+            if code == IF_TSRESOL and length >= 1:
+                value = options[offset + 4]
+                if value & 0x80:
+                    return 1e9 / (1 << (value & 0x7F))
+                return 1e9 / 10 ** value
+            offset += 4 + (length + 3) // 4 * 4
+        return 1000.0
+
+    def packets(self) -> typing.Iterator[typing.Tuple[int, memoryview]]:
+        """Yields the time, in nanoseconds, and the UDP payload of each
+        UDP packet in the capture.
+        """
+        for stamp, linktype, frame in self.records():
+            payload = udp_payload(linktype, frame)
+            if payload is not None:
+                yield stamp, payload
@@ -0,0 +1,126 @@
+"""Generates the packets of a schedule ahead of sending them.
+
+A pool is filled before the run starts, then kept topped up by a
+producer thread while the runner takes packets out of it, so a slow
+`source` no longer holds up the sending as long as it keeps up on
+average.
+"""
+
+import threading
+import typing
+
+# Seconds between checks on a pool that has fallen behind, in an event
+# loop that cannot block on it
+UNDERRUN_WAIT = 0.001
+
+
+class SOCSPacketPool:
+    def __init__(
+        self,
+        source: typing.Callable[[], bytes],
+        size: int,
+        total: typing.Optional[int] = None,
+    ) -> None:
+        """Holds up to `size` packets from `source` in a ring buffer.
+
+        There is one producer and one consumer, so each end of the
+        ring is only moved by one thread; the semaphores count the
+        filled and the free slots. No more than `total` packets are
+        generated, if it is given.
+
+        If `source` raises in the producer, the error is raised again
+        by the call that would have taken the packet.
+        """
+        self.source = source
+        self.size = size
+        self.total = total
+        self.remaining = total
+        self.slots = [None] * size
+        self.head = 0
+        self.tail = 0
+        self.filled = threading.Semaphore(0)
+        self.free = threading.Semaphore(size)
+        self.quitquit = False
+        self.error = None
+        self.underruns = 0
+        # Each written by one end only, for `ready`
+        self.produced = 0
+        self.taken = 0
+        self.producer = threading.Thread(
+            target=self.produce, name="SOCSPacketPool", daemon=True
+        )
+
+    def put(self) -> bool:
+        """Generates one packet into the free slot at the tail.
+
+        Returns false once `total` packets have been generated.
+        """
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+        self.slots[self.tail] = self.source()
+        self.tail = (self.tail + 1) % self.size
+        self.produced += 1
+        self.filled.release()
+        return True
+
+    def fill(self) -> None:
+        """Fills the pool, then starts the producer to keep it full.
+        """
+        for _ in range(0, self.size):
+            self.free.acquire()
+            if not self.put():
+                break
+        self.producer.start()
+
+    def produce(self):
+        try:
+            while True:
+                self.free.acquire()
+                if self.quitquit or not self.put():
+                    return
+        except Exception as exc:
+            # The slot at the tail stays empty, and marks the error
+            self.error = exc
+            self.filled.release()
+
+    def stop(self):
+        self.quitquit = True
+        self.free.release()
+
+    def ready(self, count: int) -> bool:
+        """True if `count` packets, or as many as the pool holds, can be
+        taken without waiting, or if taking them would fail at once.
+        """
+        count = min(count, self.size)
+        if self.total is not None:
+            count = min(count, self.total - self.taken)
+        return self.produced - self.taken >= count or self.error is not None
+
+    def __call__(self) -> bytes:
+        """Takes the packet at the head, waiting for one if the producer
+        has fallen behind.
+        """
+        if not self.filled.acquire(blocking=False):
+            self.underruns += 1
+            self.filled.acquire()
+        head = self.head
+        data = self.slots[head]
+        if data is None:
+            # Left for the consumers that come after
+            self.filled.release()
+            raise self.error
+        self.slots[head] = None
+        self.head = (head + 1) % self.size
+        self.taken += 1
+        self.free.release()
+        return data
+
+
+def make_pool(schedule: object) -> typing.Optional[SOCSPacketPool]:
+    """Builds the pool for `schedule`, if it has a `prefill`.
+    """
+    if schedule.prefill is None:
+        return None
+    return SOCSPacketPool(schedule.source, schedule.prefill, schedule.total)
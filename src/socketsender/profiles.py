@@ -0,0 +1,162 @@
+"""Rates that change while a schedule runs.
+
+A profile is a sequence of phases, each lasting a number of seconds
+and giving the packet rate at every moment of it. The pacer does not
+evaluate the rate per packet; it takes the send times from
+`SOCSProfile.times` in blocks, so the cost per packet stays the same
+whatever the shape of the profile.
+"""
+
+import itertools
+import math
+import typing
+
+# Seconds skipped at a time through a stretch where the rate is 0
+IDLE_STEP = 0.001
+
+# Longest step, in seconds, over which the rate is taken as constant
+MAX_STEP = 0.01
+
+# Seconds by which times are taken to be the same
+EPSILON = 1e-9
+
+
+class SOCSPhase:
+    def __init__(self, duration: float) -> None:
+        self.duration = duration
+
+    def rate(self, t: float) -> float:
+        """Packets per second `t` seconds into the phase.
+        """
+        raise NotImplementedError
+
+    def mean_rate(self) -> float:
+        raise NotImplementedError
+
+
+class SOCSConstantPhase(SOCSPhase):
+    def __init__(self, duration: float, rate: float) -> None:
+        super().__init__(duration)
+        self.value = rate
+
+    def rate(self, t: float) -> float:
+        return self.value
+
+    def mean_rate(self) -> float:
+        return self.value
+
+
+class SOCSRampPhase(SOCSPhase):
+    def __init__(self, duration: float, start: float, end: float) -> None:
+        """Changes the rate linearly from `start` to `end`.
+        """
+        super().__init__(duration)
+        self.start = start
+        self.end = end
+
+    def rate(self, t: float) -> float:
+        return self.start + (self.end - self.start) * t / self.duration
+
+    def mean_rate(self) -> float:
+        return (self.start + self.end) / 2
+
+
+class SOCSSinePhase(SOCSPhase):
+    def __init__(
+        self, duration: float, mean: float, amplitude: float, period: float
+    ) -> None:
+        super().__init__(duration)
+        self.mean = mean
+        self.amplitude = amplitude
+        self.period = period
+
+    def rate(self, t: float) -> float:
+        return self.mean + self.amplitude * math.sin(2 * math.pi * t / self.period)
+
+    def mean_rate(self) -> float:
+        return self.mean
+
+
+class SOCSCallablePhase(SOCSPhase):
+    def __init__(self, func: typing.Callable[[float], float]) -> None:
+        """Asks `func` for the rate, given the seconds since the start.
+        This phase never ends.
+        """
+        super().__init__(math.inf)
+        self.func = func
+
+    def rate(self, t: float) -> float:
+        return self.func(t)
+
+    def mean_rate(self) -> float:
+        return self.func(0.0)
+
+
+def to_phase(data: dict) -> SOCSPhase:
+    """Builds a phase from its validated configuration.
+    """
+    duration = data["duration"]
+    if "rate" in data:
+        return SOCSConstantPhase(duration, data["rate"])
+    if "ramp" in data:
+        return SOCSRampPhase(duration, *data["ramp"])
+    sine = data["sine"]
+    return SOCSSinePhase(duration, sine["mean"], sine["amplitude"], sine["period"])
+
+
+class SOCSProfile:
+    def __init__(self, phases: typing.List[SOCSPhase]) -> None:
+        self.phases = phases
+
+    def times(self, batch_size: int = 1) -> typing.Iterator[float]:
+        """Yields the send times, in seconds from the start, of events
+        of `batch_size` packets, until the last phase ends.
+
+        The rate is integrated over time, and an event is due whenever
+        another `batch_size` packets' worth has built up. The first is
+        due as soon as the rate is above 0. Where the rate is low, the
+        integral is taken in steps of at most MAX_STEP seconds, so a
+        rate that rises from 0 is followed closely.
+        """
+        t = 0.0
+        credit = float(batch_size)
+        # Rounding may leave the credit a hair short
+        due = batch_size - EPSILON
+        for phase in self.phases:
+            start = t
+            end = start + phase.duration - EPSILON
+            while t < end:
+                rate = phase.rate(t - start)
+                if rate <= 0:
+                    t += IDLE_STEP
+                    continue
+                if credit >= due:
+                    yield t
+                    credit -= batch_size
+                step = min((batch_size - credit) / rate, MAX_STEP, end - t)
+                if step <= 0:
+                    # end - t is below the float resolution
+                    break
+                t += step
+                credit += rate * step
+            t = start + phase.duration
+
+    def mean_rate(self) -> float:
+        """The average packet rate, over the phases that end.
+        """
+        finite = [p for p in self.phases if p.duration != math.inf]
+        if len(finite) < len(self.phases):
+            return self.phases[-1].mean_rate()
+        total = sum(p.duration for p in finite)
+        if not total:
+            return 0.0
+        return sum(p.mean_rate() * p.duration for p in finite) / total
+
+    def duration(self) -> float:
+        return sum(p.duration for p in self.phases)
+
+
+def block(times: typing.Iterator[float], size: int) -> typing.List[int]:
+    """The next `size` of `times`, in nanoseconds.
+    """
+    return [int(t * 1e9) for t in itertools.islice(times, size)]
@@ -0,0 +1,132 @@
+"""The schemas that configuration entries are validated against.
+
+They are in a module of their own, imported when the first entry is
+validated, so that schedules loaded from the cache (see
+`config.load`) do not pay for importing `schema` and building them.
+"""
+
+import ipaddress
+
+from schema import And, Const, Optional, Or, Schema, SchemaError, Use  # noqa: F401
+from socketsender import arrivals, pacing, transport
+from socketsender.config import (
+    from_callable,
+    to_addresses,
+    to_bandwidth,
+    to_ports,
+    to_source,
+)
+
+ports_schema = And(
+    Use(to_ports), len, lambda ports: all(0 <= n <= 65535 for n in ports)
+)
+
+rate_schema = And(Or(int, float), Use(float), lambda f: f >= 0.0)
+
+phase_schema = And(
+    {
+        "duration": And(Or(int, float), Use(float), lambda f: f > 0.0),
+        Optional("rate"): rate_schema,
+        Optional("ramp"): And([rate_schema], lambda r: len(r) == 2),
+        Optional("sine"): {
+            "mean": And(Or(int, float), Use(float)),
+            "amplitude": And(Or(int, float), Use(float)),
+            "period": And(Or(int, float), Use(float), lambda f: f > 0.0),
+        },
+    },
+    lambda p: len({"rate", "ramp", "sine"} & set(p)) == 1,
+)
+
+schema = Schema(
+    {
+        "name": And(str, len),
+        "target_addr": And(Use(to_addresses), len),
+        "target_port": ports_schema,
+        Optional("fanout"): Or("broadcast", "round-robin"),
+        Optional("protocol"): Or(*transport.PROTOCOLS),
+        Optional("reconnect_delay"): And(Or(int, float), Use(float), lambda f: f > 0),
+        Optional("connect"): bool,
+        Optional("bind_addr"): Use(ipaddress.ip_address),
+        Optional("bind_port"): And(Use(int), lambda n: 0 <= n <= 65535),
+        Optional("sndbuf"): And(Use(int), lambda n: 0 < n),
+        Optional("tos"): And(Use(int), lambda n: 0 <= n <= 255),
+        Optional("dscp"): And(Use(int), lambda n: 0 <= n <= 63),
+        Optional("priority"): And(Use(int), lambda n: 0 <= n),
+        Optional("backpressure"): Or(*transport.BACKPRESSURE_POLICIES),
+        Optional("send_retries"): And(Use(int), lambda n: 0 <= n),
+        Optional("frequency"): Or(
+            callable,
+            Const(And(Use(float), lambda n: 0 < n)),
+            And(str, Use(from_callable), callable),
+        ),
+        Optional("profile"): And([phase_schema], len),
+        Optional("arrival"): Or(
+            And(Or(*arrivals.MODELS), Use(lambda m: {"model": m})),
+            And(
+                {
+                    "model": Or(*arrivals.MODELS),
+                    Optional("jitter"): And(
+                        Or(int, float), Use(float), lambda f: 0.0 <= f <= 1.0
+                    ),
+                    Optional("shape"): And(
+                        Or(int, float), Use(float), lambda f: f > 1.0
+                    ),
+                    Optional("file"): str,
+                },
+                lambda a: a["model"] != "empirical" or "file" in a,
+            ),
+        ),
+        Optional("bandwidth"): And(Use(to_bandwidth), lambda n: 0 < n),
+        Optional("bandwidth_burst"): And(Or(int, float), Use(float), lambda f: f >= 0),
+        "length": Or("none", And(Use(int), lambda n: 0 < n)),
+        "source": Or(callable, Use(to_source), Use(from_callable)),
+        "total": Or("infinity", And(Use(int), lambda n: 0 < n)),
+        Optional("delay"): And(Or(int, float), Use(float), lambda f: f > 0.0),
+        Optional("catchup"): Or(*pacing.CATCHUP_POLICIES),
+        Optional("spin_time"): And(Or(int, float), Use(float), lambda f: f >= 0.0),
+        Optional("batch_size"): And(Use(int), lambda n: 0 < n),
+        Optional("burst_size"): Or(
+            And(int, lambda n: 0 < n),
+            And([And(int, lambda n: 0 < n)], lambda s: len(s) == 2 and s[0] <= s[1]),
+        ),
+        Optional("burst_interval"): And(Or(int, float), Use(float), lambda f: f > 0.0),
+        Optional("histograms"): bool,
+        Optional("seed"): Use(int),
+        Optional("random_pool"): And(Use(int), lambda n: 0 < n),
+        Optional("framing"): Or("fixed", "line", "prefixed"),
+        Optional("loop"): bool,
+        Optional("replay_speed"): Or(
+            "max", And(Or(int, float), Use(float), lambda f: f > 0.0)
+        ),
+        Optional("stamp"): bool,
+        Optional("prefill"): And(Use(int), lambda n: 0 < n),
+        Optional("user_data1"): str,
+        Optional("user_data2"): str,
+    }
+)
+
+
+# What a receiver needs of an entry; the rest is left unchecked
+targets_schema = Schema(
+    {
+        "name": And(str, len),
+        "target_addr": And(Use(to_addresses), len),
+        "target_port": ports_schema,
+        Optional("fanout"): Or("broadcast", "round-robin"),
+        Optional("protocol"): Or(*transport.PROTOCOLS),
+    },
+    ignore_extra_keys=True,
+)
+
+
+template_schema = Schema(
+    {
+        Optional("instances"): And(Use(int), lambda n: 0 < n),
+        Optional("each"): {
+            Optional("target_addr"): And(Use(to_addresses), len),
+            Optional("target_port"): ports_schema,
+            Optional("bind_addr"): And(Use(to_addresses), len),
+            Optional("bind_port"): ports_schema,
+        },
+    }
+)
@@ -2,74 +2,501 @@
 """
 
 import logging
-import socket
+import os
+import random
+import re
 import threading
 import time
 import typing
 
-from socketsender import config
+from socketsender import config, header, pacing, pool, stats, transport
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
-class SOCSrunner(threading.Thread):
-    def __init__(self, run_request: threading.Event, schedule: config.SOCSSchedule):
+ENGINES = ("thread", "asyncio")
+
+
+def set_result(
+    result: dict, flow: "SOCSflow", start_time: float, pacer: pacing.SOCSPacer
+) -> None:
+    """Fills in the `result` of a runner that has finished sending.
+
+    `start_time` is on the `time.perf_counter` clock.
+    """
+    result["packets"] = flow.packets
+    result["bytes"] = flow.bytes
+    result["time"] = time.perf_counter() - start_time
+    # The time runs from the first event to the last, so the packets
+    # of the last event are not counted against it
+    if flow.packets:
+        result["frequency"] = (flow.packets - flow.last_count) / result["time"]
+    else:
+        result["frequency"] = 0.0
+    result["bandwidth"] = flow.bytes / result["time"]
+    result["skipped"] = pacer.skipped
+    if flow.copies > 1:
+        result["datagrams"] = flow.packets * flow.copies
+    flow.finished = True
+    if flow.pool is not None:
+        flow.pool.stop()
+        result["pool_underruns"] = flow.pool.underruns
+    if flow.add_source_result is not None:
+        flow.add_source_result(result)
+    if flow.bursts is not None:
+        result["burst_duration"] = flow.bursts.summary()
+    if flow.histograms is not None:
+        result["histograms"] = {
+            name: hist.summary() for name, hist in flow.histograms.items()
+        }
+
+
+def profile_path(directory: str, name: str) -> str:
+    """The file in `directory` for the cProfile statistics of `name`.
+    """
+    return os.path.join(directory, re.sub(r"[^\w.-]", "_", name) + ".prof")
+
+
+def timed(
+    func: typing.Callable[[], None], histogram: stats.SOCSHistogram
+) -> typing.Callable[[], None]:
+    """Wraps `func`, recording how long each call takes in `histogram`.
+    """
+    record = histogram.record
+
+    def timed_func():
+        start = time.perf_counter_ns()
+        func()
+        record(time.perf_counter_ns() - start)
+
+    return timed_func
+
+
+class SOCSflow:
+    def __init__(
+        self,
+        schedule: config.SOCSSchedule,
+        send: typing.Callable[[bytes], None],
+        send_batch: typing.Callable[[typing.List[bytes]], None],
+        histograms: bool = False,
+    ) -> None:
+        """Generates and sends the packets of `schedule`.
+
+        The engines decide when to call `send_event`, which sends the
+        packets due at one time with `send` or `send_batch`. The
+        counters are only written here, so other threads may read them
+        without locking.
+
+        With a `prefill`, packets come from a `pool.SOCSPacketPool`,
+        which must be filled with `prefill` before the run starts. With
+        `stamp`, `send` and `send_batch` are handed the packets behind
+        a sequence header, which is counted in the bytes sent.
 
+        With a `burst_size`, each event is a burst, sent as one batch
+        whose send time is recorded in `bursts`.
+
+        With `histograms`, the histograms are recorded even if the
+        schedule does not ask for them.
+        """
+        self.source = schedule.source
+        # Sources may add results of their own
+        self.add_source_result = getattr(schedule.source, "add_result", None)
+        self.pool = pool.make_pool(schedule)
+        if self.pool is not None:
+            self.source = self.pool
+        self.send = send
+        self.send_batch = send_batch
+        self.overhead = 0
+        if schedule.stamp:
+            # Sized for `length`; the stamper makes room for longer packets
+            size = schedule.length
+            if size is None:
+                size = config.MAX_PACKET_SIZE
+            stamper = header.SOCSStamper(schedule.name, schedule.batch_size, size)
+            self.send = stamper.wrap(send)
+            self.send_batch = stamper.wrap_batch(send_batch)
+            self.overhead = header.SIZE
+        self.copies = schedule.copies
+        self.total = schedule.total
+        self.batch_size = schedule.batch_size
+        self.packets = 0
+        self.bytes = 0
+        # The number of packets of the latest event
+        self.last_count = 0
+        self.finished = False
+        self.histograms = None
+        if schedule.histograms or histograms:
+            self.histograms = {
+                "interval": stats.SOCSHistogram(),
+                "source": stats.SOCSHistogram(),
+                "send": stats.SOCSHistogram(),
+            }
+            self.last_send = None
+            self.send_event = self.send_event_timed
+        self.bursts = None
+        if schedule.burst_sizes is not None:
+            if self.histograms is not None:
+                # The send times of the events are those of the bursts
+                self.bursts = self.histograms["send"]
+            else:
+                self.bursts = stats.SOCSHistogram()
+                self.send_event = self.send_burst
+            low, high = schedule.burst_sizes
+            if low != high:
+                self.burst_sizes = schedule.burst_sizes
+                self.rng = random.Random(schedule.seed)
+                self.next_count = self.next_burst_count
+
+    def prefill(self) -> None:
+        if self.pool is not None:
+            self.pool.fill()
+
+    def done(self) -> bool:
+        return self.total is not None and self.packets >= self.total
+
+    def next_count(self) -> int:
+        if self.total is None:
+            return self.batch_size
+        return min(self.batch_size, self.total - self.packets)
+
+    def next_burst_count(self) -> int:
+        count = self.rng.randint(*self.burst_sizes)
+        if self.total is None:
+            return count
+        return min(count, self.total - self.packets)
+
+    def send_event(self) -> int:
+        """Sends the packets due now, and returns their size in bytes.
+        """
+        count = self.next_count()
+        if count == 1:
+            data = self.source()
+            self.send(data)
+            size = len(data) + self.overhead
+        else:
+            packets = [self.source() for _ in range(0, count)]
+            self.send_batch(packets)
+            size = sum(map(len, packets)) + self.overhead * count
+        self.packets += count
+        self.bytes += size
+        self.last_count = count
+        return size
+
+    def send_burst(self) -> int:
+        """`send_event` for a burst, which is sent as one batch, whatever
+        its size, and timed.
+        """
+        count = self.next_count()
+        packets = [self.source() for _ in range(0, count)]
+        start = time.perf_counter_ns()
+        self.send_batch(packets)
+        self.bursts.record(time.perf_counter_ns() - start)
+        size = sum(map(len, packets)) + self.overhead * count
+        self.packets += count
+        self.bytes += size
+        self.last_count = count
+        return size
+
+    def send_event_timed(self) -> int:
+        """`send_event`, recording how long the source and the send took,
+        and the interval since the previous send.
+        """
+        count = self.next_count()
+        start = time.perf_counter_ns()
+        if count == 1:
+            data = self.source()
+            sending = time.perf_counter_ns()
+            self.send(data)
+            size = len(data) + self.overhead
+        else:
+            packets = [self.source() for _ in range(0, count)]
+            sending = time.perf_counter_ns()
+            self.send_batch(packets)
+            size = sum(map(len, packets)) + self.overhead * count
+        sent = time.perf_counter_ns()
+
+        histograms = self.histograms
+        histograms["source"].record(sending - start)
+        histograms["send"].record(sent - sending)
+        if self.last_send is not None:
+            histograms["interval"].record(sending - self.last_send)
+        self.last_send = sending
+        self.packets += count
+        self.bytes += size
+        self.last_count = count
+        return size
+
+
+class SOCSrunner(threading.Thread):
+    def __init__(
+        self,
+        run_request: threading.Event,
+        schedule: config.SOCSSchedule,
+        profile: bool = False,
+        profile_dir: typing.Optional[str] = None,
+    ):
+        """See `SOCSender` for `profile` and `profile_dir`.
+        """
         super().__init__(name=schedule.name)
         self.schedule = schedule
+        self.profile = profile
+        self.profile_dir = profile_dir
         self.name = schedule.name
         self.run_request = run_request
         self.quitquit = threading.Event()
+        # Set once the runner is ready for run_request
+        self.ready = threading.Event()
         self.result = dict()
+        # Set once sending starts, for progress reports
+        self.flow = None
+        self.pacer = None
+        self.bucket = None
+        self.start_time = None
         log.info("hello")
 
     def stop(self):
         self.quitquit.set()
 
     def run(self):
+        if self.profile_dir is None:
+            self.send_all()
+            return
+        # Imported here so runs without profiling do not pay for it
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(self.send_all)
+        finally:
+            profiler.dump_stats(profile_path(self.profile_dir, self.name))
+
+    def send_all(self):
+        """Sends the schedule. An error is logged and left in the result
+        as `error`, with the counts of what was sent before it.
+        """
+        try:
+            conn = transport.make_transport(self.schedule, self.quitquit.wait)
+            flow = SOCSflow(self.schedule, conn.send, conn.send_batch, self.profile)
+            flow.prefill()
+        except Exception as exc:
+            log.exception("Schedule %s cannot start", self.name)
+            self.result["error"] = str(exc)
+            return
+        finally:
+            self.ready.set()
+        pacer = pacing.make_pacer(self.schedule)
+        bucket = pacing.make_bucket(self.schedule)
+        wait = pacer.wait
+        if self.profile:
+            flow.histograms["wait"] = stats.SOCSHistogram()
+            wait = timed(pacer.wait, flow.histograms["wait"])
+            if bucket is not None:
+                flow.histograms["bucket"] = stats.SOCSHistogram()
+                bucket.wait = timed(bucket.wait, flow.histograms["bucket"])
         self.run_request.wait()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        period = 1.0 / self.schedule.frequency
-        # print(f"{self.name} frequency is {self.schedule.frequency}")
-        # print(f"{self.name} period is {period}")
         time.sleep(self.schedule.delay)
-        start_time = time.time()
-        number_of_packets_sent = 0
-        while not self.quitquit.is_set():
-            last_time = time.time()
-            next_time = last_time + period
-            data = self.schedule.source()
-            sock.sendto(data, self.schedule.ip_addr)
-            number_of_packets_sent += 1
-            #            print(f"{self.name} Sent packet {number_of_packets_sent}")
-            if number_of_packets_sent >= self.schedule.total:
-                break
-            wait_time = next_time - time.time()
-            #            print(f"{self.name} wait_time is {wait_time}")
-            if wait_time > 0.0:
-                time.sleep(wait_time)
-
-        self.result["packets"] = number_of_packets_sent
-        self.result["time"] = time.time() - start_time
-        self.result["frequency"] = (number_of_packets_sent - 1) / self.result["time"]
+        start_time = time.perf_counter()
+        pacer.start()
+        if bucket is not None:
+            bucket.start()
+        self.pacer = pacer
+        self.bucket = bucket
+        self.start_time = start_time
+        self.flow = flow
+        cpu_start = time.thread_time()
+        try:
+            while not self.quitquit.is_set():
+                size = flow.send_event()
+                #            print(f"{self.name} Sent packet {flow.packets}")
+                if flow.done() or pacer.finished:
+                    break
+                wait()
+                if bucket is not None:
+                    bucket.consume(size)
+                    bucket.wait()
+        except Exception as exc:
+            log.exception("Schedule %s stopped", self.name)
+            self.result["error"] = str(exc)
+
+        if self.profile:
+            self.result["cpu_time"] = time.thread_time() - cpu_start
+        conn.close()
+        set_result(self.result, flow, start_time, pacer)
+        conn.add_result(self.result)
 
 
 class SOCSender:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        engine: str = "thread",
+        workers: typing.Union[None, int, str] = None,
+        affinity: bool = False,
+        report_interval: typing.Optional[float] = None,
+        report_format: str = "text",
+        report_stream: typing.Optional[typing.TextIO] = None,
+        profile: bool = False,
+        profile_dir: typing.Optional[str] = None,
+    ) -> None:
+        """`engine` selects how schedules are driven.
+
+        thread
+           Each schedule runs in its own `SOCSrunner` thread.
+
+        asyncio
+           Every schedule runs as a task of one asyncio event loop. This
+           scales to hundreds of schedules, which would otherwise
+           contend for the GIL.
+
+        If `workers` is a positive number, or 'auto' for one per CPU, the
+        schedules are shared out between that many worker processes,
+        each driving its share with `engine`. This lifts the limit of
+        one core for the whole run. With `affinity`, each worker is
+        pinned to its own CPU.
+
+        With a `report_interval`, progress is reported every that many
+        seconds while the run goes on, and the results at the end. See
+        `stats.SOCSReporter` for `report_format` and `report_stream`.
+        Worker processes only report their results.
+
+        With `profile`, every runner times where its time goes, as if
+        each schedule had `histograms` set: the source, the send, and
+        the 'wait' for the pacer and, in a thread runner, the 'bucket'
+        wait for the token bucket. A thread runner also reports the CPU
+        time of its thread, from `time.thread_time`, as `cpu_time`.
+
+        With a `profile_dir`, which implies `profile`, each thread
+        runner runs under cProfile and writes its statistics to
+        `<schedule name>.prof` in that directory. The asyncio engine
+        runs every schedule in one thread, so it writes one profile,
+        `asyncio-<pid>.prof`, and reports no CPU time.
+
+        Runs without `profile` are not slowed at all.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine "{engine}"')
+        if workers is not None and workers != "auto":
+            try:
+                count = int(workers)
+            except (TypeError, ValueError):
+                count = 0
+            if count < 1:
+                raise ValueError(f'Bad number of workers "{workers}"')
+            workers = count
+        self.engine = engine
+        self.workers = workers
+        self.affinity = affinity
+        # SOCSrunner threads, runners with the same interface for the
+        # asyncio engine, or worker processes
         self.threads = list()
+        self.results = dict()
+        self.stopping = False
+        # Set by start, for the runners prepare got ready
+        self.run_request = threading.Event()
+        self.reporter = None
+        # The event loop of the asyncio engine
+        self.loop = None
+        if report_format not in stats.REPORT_FORMATS:
+            raise ValueError(f'Unknown report format "{report_format}"')
+        self.report_interval = report_interval
+        self.report_format = report_format
+        self.report_stream = report_stream
+        self.profile = profile or profile_dir is not None
+        self.profile_dir = profile_dir
 
     def run(self, stream: typing.TextIO) -> None:
-        schedules = config.get_schedules(stream)
-        syncthreads = threading.Event()
+        self.run_schedules(config.get_schedules(stream))
+
+    def run_schedules(self, schedules: typing.List[config.SOCSSchedule]) -> None:
+        self.prepare(schedules)
+        self.start()
+
+    def prepare(self, schedules: typing.List[config.SOCSSchedule]) -> None:
+        """Builds the runners of `schedules`, opens their transports and
+        fills their pools, so that `start` has them all send at once.
+
+        With `workers`, the worker processes are only built here; each
+        prepares its own share once it is started.
+        """
+        self.reporter = None
+        if self.report_interval:
+            self.reporter = stats.SOCSReporter(
+                self.report_interval, self.report_format, self.report_stream
+            )
+
+        if self.workers:
+            # Imported here so single-process runs do not pay for
+            # multiprocessing
+            from socketsender import workers
+
+            self.threads = workers.make_workers(
+                schedules,
+                self.workers,
+                self.engine,
+                self.affinity,
+                self.profile,
+                self.profile_dir,
+            )
+        elif self.engine == "asyncio":
+            # Imported here so the thread engine does not pay for asyncio
+            from socketsender import asyncengine
+
+            self.threads = [
+                asyncengine.SOCSAsyncRunner(s, self.profile) for s in schedules
+            ]
+            if self.stopping:
+                self.stop_all()
+            if self.reporter is not None:
+                self.reporter.watch(self.threads)
+            self.loop = asyncengine.SOCSAsyncEngine(self.threads, self.profile_dir)
+            self.loop.prepare()
+        else:
+            if self.reporter is not None:
+                # Watches the list as prepare_threads fills it
+                self.reporter.watch(self.threads)
+            self.prepare_threads(schedules)
+
+    def start(self) -> None:
+        """Runs what `prepare` got ready to completion, and fills in
+        `results`.
+        """
+        if self.workers:
+            from socketsender import workers
+
+            self.results = workers.run(self.threads)
+        elif self.engine == "asyncio":
+            self.loop.start()
+        else:
+            self.start_threads()
+
+        if not self.workers:
+            self.results = {sth.name: sth.result for sth in self.threads}
+        if self.reporter is not None:
+            self.reporter.stop()
+            if self.reporter.is_alive():
+                self.reporter.join()
+            self.reporter.report_results(self.results)
+
+    def prepare_threads(self, schedules: typing.List[config.SOCSSchedule]) -> None:
         try:
             for sched in schedules:
-                sth = SOCSrunner(syncthreads, sched)
+                sth = SOCSrunner(
+                    self.run_request, sched, self.profile, self.profile_dir
+                )
                 self.threads.append(sth)
                 sth.start()
+            # Connections are opened and pools filled before anyone starts
+            for sth in self.threads:
+                sth.ready.wait()
+        except KeyboardInterrupt:
+            self.stop_all()
 
-            syncthreads.set()
+    def start_threads(self) -> None:
+        try:
+            # stop_all may have been called while the threads started
+            if self.stopping:
+                self.stop_all()
+            self.run_request.set()
 
             for sth in self.threads:
                 sth.join()
@@ -79,9 +506,7 @@ class SOCSender:
             for sth in self.threads:
                 sth.join()
 
-        # for sth in self.threads:
-        #     print(f"frequency for {sth.name} is {pprint.pformat(sth.result)}")
-
     def stop_all(self):
+        self.stopping = True
         for sth in self.threads:
             sth.stop()
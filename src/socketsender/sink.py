@@ -0,0 +1,270 @@
+"""Receives what a run sends, and checks it.
+
+The sink binds the targets of a set of schedules and counts the
+packets and bytes that arrive for each flow. Packets that carry the
+sequence header of `socketsender.header` are counted per schedule,
+with their loss, duplicates, reordering and one-way latency; other
+packets are counted per target. A schedule that broadcasts to
+several targets is counted once per target. TCP targets only count bytes, as a
+stream has no packets to check.
+
+Datagrams are read in batches, with one `recvmmsg` system call where
+the platform has it, so the sink keeps up with a batching sender.
+"""
+
+import json
+import selectors
+import socket
+import sys
+import time
+import typing
+
+from socketsender import config, header, stats, transport
+
+# Sequence numbers remembered per flow to tell duplicates from packets
+# that arrived late
+WINDOW = 1 << 16
+
+# Datagrams read per system call, and the largest datagram kept whole
+BATCH_SIZE = 64
+MAX_DATAGRAM = 65536
+
+# Seconds between checks for a stop request
+POLL_INTERVAL = 0.1
+
+
+class SOCSFlowStats:
+    def __init__(self) -> None:
+        """Counts the packets of one flow.
+
+        The sequence numbers seen within WINDOW of the highest are
+        remembered in a ring of flags. A packet behind the highest
+        number fills a gap, unless its flag is already set, which makes
+        it a duplicate. Packets more than WINDOW behind are taken to
+        fill a gap.
+        """
+        self.packets = 0
+        self.bytes = 0
+        self.sequenced = False
+        self.max_seq = -1
+        self.missing = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.seen = bytearray(WINDOW)
+        self.latency = stats.SOCSHistogram()
+
+    def record(self, size: int) -> None:
+        self.packets += 1
+        self.bytes += size
+
+    def record_seq(self, seq: int, latency_ns: int) -> None:
+        self.sequenced = True
+        self.latency.record(latency_ns)
+        seen = self.seen
+        max_seq = self.max_seq
+        if seq > max_seq:
+            gap = seq - max_seq - 1
+            self.missing += gap
+            if gap >= WINDOW:
+                self.seen = seen = bytearray(WINDOW)
+            else:
+                for missed in range(max_seq + 1, seq):
+                    seen[missed % WINDOW] = 0
+            seen[seq % WINDOW] = 1
+            self.max_seq = seq
+        elif max_seq - seq < WINDOW and seen[seq % WINDOW]:
+            self.duplicates += 1
+        else:
+            seen[seq % WINDOW] = 1
+            self.reordered += 1
+            self.missing = max(0, self.missing - 1)
+
+    def summary(self) -> dict:
+        retval = {"packets": self.packets, "bytes": self.bytes}
+        if self.sequenced:
+            retval["lost"] = self.missing
+            retval["duplicates"] = self.duplicates
+            retval["reordered"] = self.reordered
+            retval["latency"] = self.latency.summary()
+        return retval
+
+
+class SOCSSink:
+    def __init__(
+        self,
+        schedules: typing.List[typing.Union[config.SOCSSchedule, config.SOCSTargets]],
+        bind_addr: typing.Optional[str] = None,
+        report_interval: typing.Optional[float] = None,
+        report_format: str = "text",
+        report_stream: typing.Optional[typing.TextIO] = None,
+    ) -> None:
+        """Listens on the targets of `schedules`, which may be schedules
+        or just their targets, from `config.get_targets`.
+
+        Each target is bound on its own address, or on `bind_addr` if
+        it is given. With a `report_interval`, the packets and rates
+        so far are reported every that many seconds, in text or as
+        JSON lines.
+        """
+        if report_format not in stats.REPORT_FORMATS:
+            raise ValueError(f'Unknown report format "{report_format}"')
+        self.names = {header.schedule_id(s.name): s.name for s in schedules}
+        # Schedules that send every packet to several targets are
+        # counted per target, as each target receives the whole sequence
+        self.broadcast = {header.schedule_id(s.name) for s in schedules if s.copies > 1}
+        self.report_interval = report_interval
+        self.report_format = report_format
+        self.report_stream = sys.stdout if report_stream is None else report_stream
+        self.flows = dict()
+        self.quitquit = False
+        # Socket -> name of the target it serves
+        self.udp = dict()
+        self.listeners = dict()
+        self.conns = dict()
+        # The sockets are drained one at a time, so they share one set
+        # of buffers
+        self.receiver = transport.SOCSUdpReceiver(BATCH_SIZE, MAX_DATAGRAM)
+        self.selector = selectors.DefaultSelector()
+
+        targets = {(a, p, s.protocol) for s in schedules for a, p in s.targets}
+        for addr, port, protocol in sorted(targets):
+            sock = self.bind(bind_addr or addr, port, protocol)
+            name = f"{addr}:{port}/{protocol}"
+            if protocol == "tcp":
+                self.listeners[sock] = name
+            else:
+                self.udp[sock] = name
+            self.selector.register(sock, selectors.EVENT_READ)
+
+    @staticmethod
+    def bind(addr: str, port: int, protocol: str) -> socket.socket:
+        family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+        if protocol == "tcp":
+            sock = socket.socket(family, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((addr, port))
+        if protocol == "tcp":
+            sock.listen(8)
+        sock.setblocking(False)
+        return sock
+
+    def flow(self, name: str) -> SOCSFlowStats:
+        flow = self.flows.get(name)
+        if flow is None:
+            flow = self.flows[name] = SOCSFlowStats()
+        return flow
+
+    def receive_udp(self, sock: socket.socket) -> None:
+        target = self.udp[sock]
+        unpack = header.unpack
+        received = self.receiver.receive(sock)
+        # After the batch is in, so nothing in it arrived later
+        now = time.time_ns()
+        for data in received:
+            size = len(data)
+            hdr = unpack(data)
+            if hdr is None:
+                self.flow(target).record(size)
+                continue
+            name = self.names.get(hdr.schedule_id)
+            if name is None:
+                name = f"id {hdr.schedule_id:08x}"
+            if hdr.schedule_id in self.broadcast:
+                name = f"{name} to {target}"
+            flow = self.flow(name)
+            flow.record(size)
+            flow.record_seq(hdr.seq, now - hdr.time_ns)
+
+    def receive_tcp(self, sock: socket.socket) -> None:
+        try:
+            data = sock.recv(MAX_DATAGRAM)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            del self.conns[sock]
+            self.selector.unregister(sock)
+            sock.close()
+            return
+        self.flow(self.conns[sock]).bytes += len(data)
+
+    def accept(self, listener: socket.socket) -> None:
+        conn, _ = listener.accept()
+        conn.setblocking(False)
+        self.conns[conn] = self.listeners[listener]
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def stop(self):
+        self.quitquit = True
+
+    def run(self, duration: typing.Optional[float] = None) -> None:
+        """Receives until `stop` is called, or for `duration` seconds.
+        """
+        start = time.perf_counter()
+        next_report = None
+        if self.report_interval:
+            next_report = start + self.report_interval
+        last = (start, dict())
+        try:
+            while not self.quitquit:
+                now = time.perf_counter()
+                if duration is not None and now - start >= duration:
+                    break
+                if next_report is not None and now >= next_report:
+                    last = self.report(start, *last)
+                    next_report += self.report_interval
+                for key, _ in self.selector.select(POLL_INTERVAL):
+                    sock = key.fileobj
+                    if sock in self.udp:
+                        self.receive_udp(sock)
+                    elif sock in self.listeners:
+                        self.accept(sock)
+                    elif sock in self.conns:
+                        self.receive_tcp(sock)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def report(self, start: float, then: float, counts: dict) -> tuple:
+        """Reports the flows since `then`, when they had `counts`
+        packets and bytes, and returns the time and counts for the
+        next report.
+        """
+        now = time.perf_counter()
+        elapsed = max(now - then, 1e-9)
+        sample = {"time": now - start, "flows": dict()}
+        new_counts = dict()
+        for name, flow in self.flows.items():
+            packets, nbytes = counts.get(name, (0, 0))
+            new_counts[name] = (flow.packets, flow.bytes)
+            sample["flows"][name] = {
+                "packets": flow.packets,
+                "bytes": flow.bytes,
+                "pps": (flow.packets - packets) / elapsed,
+                "mbps": (flow.bytes - nbytes) * 8 / elapsed / 1e6,
+                "lost": flow.missing,
+            }
+        if self.report_format == "json":
+            print(json.dumps(sample), file=self.report_stream, flush=True)
+        else:
+            lines = [
+                f"[{sample['time']:8.1f}s] {name}: {values['packets']} packets,"
+                f" {values['pps']:.1f} pps, {values['mbps']:.3f} Mbit/s,"
+                f" {values['lost']} lost"
+                for name, values in sample["flows"].items()
+            ]
+            if lines:
+                print("\n".join(lines), file=self.report_stream, flush=True)
+        return now, new_counts
+
+    def results(self) -> dict:
+        return {name: flow.summary() for name, flow in self.flows.items()}
+
+    def close(self) -> None:
+        for sock in list(self.udp) + list(self.listeners) + list(self.conns):
+            sock.close()
+        self.selector.close()
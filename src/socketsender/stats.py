@@ -0,0 +1,202 @@
+"""Statistics gathered while sending.
+"""
+
+import json
+import sys
+import threading
+import time
+import typing
+
+REPORT_FORMATS = ("text", "json")
+
+# Each power of two is split into 2 ** SUB_BUCKET_BITS buckets, so a
+# recorded value is known to within 1 / 2 ** SUB_BUCKET_BITS of itself.
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Enough buckets for any 64-bit value
+BUCKETS = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class SOCSHistogram:
+    def __init__(self) -> None:
+        """Counts durations in nanoseconds in logarithmic buckets.
+
+        The memory used is fixed, however many values are recorded.
+        """
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def index(value: int) -> int:
+        if value < SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+    @staticmethod
+    def bounds(index: int) -> typing.Tuple[int, int]:
+        """The lowest and highest values counted in bucket `index`.
+        """
+        if index < SUB_BUCKETS:
+            return index, index
+        shift = index // SUB_BUCKETS - 1
+        mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        """The value below which `percent` percent of the values fall.
+
+        This is the middle of the bucket holding that value, so it is
+        as precise as the buckets.
+        """
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                low, high = self.bounds(index)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Count, min, max, mean and percentiles, in seconds.
+        """
+        if not self.count:
+            return {"count": 0}
+        retval = {
+            "count": self.count,
+            "min": self.min / 1e9,
+            "max": self.max / 1e9,
+            "mean": self.total / self.count / 1e9,
+        }
+        for percent in PERCENTILES:
+            retval[f"p{percent:g}"] = self.percentile(percent) / 1e9
+        return retval
+
+
+class SOCSReporter(threading.Thread):
+    def __init__(
+        self, interval: float, fmt: str = "text", stream: typing.TextIO = None
+    ) -> None:
+        """Reports the progress of a run every `interval` seconds.
+
+        Each report gives, for every schedule and for all of them
+        together, the packets sent so far, the packet and bit rates
+        since the previous report, and how far the schedule lags
+        behind its pacing. With `fmt` 'json', each report is one JSON
+        object per line.
+
+        The counters are read without locks while the runners update
+        them, so a report may be a packet or so out of date.
+        """
+        super().__init__(name="SOCSReporter", daemon=True)
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f'Unknown report format "{fmt}"')
+        self.interval = interval
+        self.format = fmt
+        self.stream = sys.stdout if stream is None else stream
+        self.runners = list()
+        self.quitquit = threading.Event()
+        self.start_time = time.perf_counter()
+        # Schedule name -> (time, packets, bytes) at the previous report
+        self.last = dict()
+
+    def watch(self, runners: list) -> None:
+        """Starts reporting on `runners`, which may still be filling up.
+        """
+        self.runners = runners
+        self.start_time = time.perf_counter()
+        self.start()
+
+    def stop(self):
+        self.quitquit.set()
+
+    def run(self):
+        while not self.quitquit.wait(self.interval):
+            self.report(self.sample())
+
+    def sample(self) -> dict:
+        now = time.perf_counter()
+        schedules = dict()
+        total = {"packets": 0, "bytes": 0, "pps": 0.0, "mbps": 0.0, "lag": 0.0}
+        for runner in list(self.runners):
+            flow = runner.flow
+            if flow is None:
+                # Not started yet
+                continue
+            packets = flow.packets
+            nbytes = flow.bytes
+            then, last_packets, last_bytes = self.last.get(
+                runner.name, (runner.start_time, 0, 0)
+            )
+            self.last[runner.name] = (now, packets, nbytes)
+            elapsed = max(now - then, 1e-9)
+            lag = 0.0
+            if not flow.finished:
+                lag = runner.pacer.lag()
+                if runner.bucket is not None:
+                    lag = max(lag, runner.bucket.lag())
+            sample = {
+                "packets": packets,
+                "bytes": nbytes,
+                "pps": (packets - last_packets) / elapsed,
+                "mbps": (nbytes - last_bytes) * 8 / elapsed / 1e6,
+                "lag": lag,
+            }
+            schedules[runner.name] = sample
+            for key in ("packets", "bytes", "pps", "mbps"):
+                total[key] += sample[key]
+            total["lag"] = max(total["lag"], lag)
+        return {"time": now - self.start_time, "schedules": schedules, "total": total}
+
+    def report(self, sample: dict) -> None:
+        if self.format == "json":
+            print(json.dumps(sample), file=self.stream, flush=True)
+            return
+
+        rows = list(sample["schedules"].items())
+        rows.append(("total", sample["total"]))
+        lines = list()
+        for name, values in rows:
+            lines.append(
+                f"[{sample['time']:8.1f}s] {name}: {values['packets']} packets,"
+                f" {values['pps']:.1f} pps, {values['mbps']:.3f} Mbit/s,"
+                f" lag {values['lag']:.6f} s"
+            )
+        print("\n".join(lines), file=self.stream, flush=True)
+
+    def report_results(self, results: dict) -> None:
+        """Reports the final `results` of the run.
+        """
+        report_results(results, self.format, self.stream)
+
+
+def report_results(results: dict, fmt: str, stream: typing.TextIO) -> None:
+    """Writes `results`, keyed by schedule or flow name, to `stream`.
+    """
+    if fmt == "json":
+        print(json.dumps({"results": results}), file=stream, flush=True)
+        return
+
+    lines = list()
+    for name, result in results.items():
+        lines.append(f"{name}:")
+        for key, value in result.items():
+            lines.append(f"    {key}: {value}")
+    print("\n".join(lines), file=stream, flush=True)
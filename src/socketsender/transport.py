@@ -0,0 +1,591 @@
+"""Sends the packets of a schedule over a socket.
+
+A transport owns the socket of one schedule. `send` sends a single
+packet; `send_batch` sends a list of packets, using one `sendmmsg`
+system call where the platform has it and a tight `sendto` loop
+everywhere else. The socket options of the schedule, such as its
+send buffer size, type of service and local address, are set by
+`configure`, and a UDP socket may be connected to its target so that
+packets are sent without an address.
+
+`SOCSUdpReceiver` is the receiving counterpart, which reads batches
+of datagrams with one `recvmmsg` system call where it can.
+
+With a `backpressure` policy other than 'block', the UDP socket does
+not block: a packet the kernel has no room for (EAGAIN or ENOBUFS) is
+sent again or dropped, and the refusals, the drops and the time spent
+waiting for room are counted, to tell a sender that cannot keep up
+from a kernel that does not take the packets.
+
+A schedule with `protocol` 'tcp' keeps one connection open for the
+whole run instead, and reconnects with exponential backoff whenever it
+is lost.
+"""
+
+import ctypes
+import errno
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import time
+import typing
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+PROTOCOLS = ("udp", "tcp")
+
+# Seconds before the first attempt to reconnect, doubled after every
+# failed attempt up to RECONNECT_MAX_DELAY
+RECONNECT_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5.0
+
+BACKPRESSURE_POLICIES = ("block", "retry", "drop")
+
+# Attempts to send a refused packet again, with the 'retry' policy
+SEND_RETRIES = 3
+
+# Longest wait, in seconds, for room to send a refused packet again
+RETRY_WAIT = 0.001
+
+# The kernel has no room for the packet
+FULL_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS)
+
+
+def _iov_max() -> int:
+    try:
+        return os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        return 1024
+
+
+# Most buffers one `sendmsg` call takes
+IOV_MAX = _iov_max()
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_mmsg(name: str):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        # The symbols already loaded into the process, libc among them;
+        # this spares the subprocesses of ctypes.util.find_library
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    if name == "recvmmsg":
+        func.argtypes = [
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.c_uint,
+            ctypes.c_int,
+            ctypes.c_void_p,
+        ]
+    else:
+        func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    func.restype = ctypes.c_int
+    return func
+
+
+_sendmmsg = _load_mmsg("sendmmsg")
+_recvmmsg = _load_mmsg("recvmmsg")
+
+
+def has_sendmmsg() -> bool:
+    """True if batches are sent with a single `sendmmsg` system call.
+    """
+    return _sendmmsg is not None
+
+
+def has_recvmmsg() -> bool:
+    """True if batches are received with a single `recvmmsg` system call.
+    """
+    return _recvmmsg is not None
+
+
+def sockaddr(family: int, addr: tuple) -> bytes:
+    """Packs `addr` into the C `sockaddr_in` or `sockaddr_in6` layout.
+    """
+    host, port = addr[0], addr[1]
+    packed = socket.inet_pton(family, host)
+    if family == socket.AF_INET:
+        return struct.pack("=H", family) + struct.pack("!H", port) + packed + bytes(8)
+    return (
+        struct.pack("=H", family)
+        + struct.pack("!HI", port, 0)
+        + packed
+        + struct.pack("=I", 0)
+    )
+
+
+def family(schedule: object) -> int:
+    if schedule.tgt_addr.version == 6:
+        return socket.AF_INET6
+    return socket.AF_INET
+
+
+def backoff(delay: float) -> typing.Iterator[float]:
+    """Yields the delays between attempts to reconnect, starting at
+    `delay` and doubling up to RECONNECT_MAX_DELAY.
+    """
+    while True:
+        yield delay
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+def configure(sock: socket.socket, schedule: object) -> None:
+    """Sets the socket options of `schedule` on `sock`, and binds it to
+    the local address of `schedule`, if it has one.
+    """
+    if schedule.sndbuf is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, schedule.sndbuf)
+    if schedule.tos is not None:
+        if sock.family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_TCLASS, schedule.tos)
+        else:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, schedule.tos)
+    if schedule.priority is not None:
+        if hasattr(socket, "SO_PRIORITY"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, schedule.priority)
+        else:
+            log.warning("SO_PRIORITY is not available; priority is ignored")
+    if schedule.bind_addr is not None or schedule.bind_port is not None:
+        wildcard = "::" if sock.family == socket.AF_INET6 else "0.0.0.0"
+        sock.bind((schedule.bind_addr or wildcard, schedule.bind_port or 0))
+
+
+def tcp_socket(schedule: object) -> socket.socket:
+    """Makes an unconnected TCP socket for `schedule` that sends small
+    writes at once.
+    """
+    sock = socket.socket(family(schedule), socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if schedule.bind_port:
+        # The port may still be held by the connection being replaced
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    configure(sock, schedule)
+    return sock
+
+
+class SOCSUdpTransport:
+    def __init__(self, schedule: object) -> None:
+        """Sends the packets of `schedule` from one UDP socket.
+
+        With `connect` set, the socket is connected to the target and
+        packets are sent without an address. A connected socket reports
+        the ICMP errors of earlier packets as a failed send; the packet
+        is then sent once more, and dropped if that fails too.
+
+        A schedule with several targets sends each packet to all of
+        them, or to each in turn, according to its `fanout`.
+
+        Unless the `backpressure` policy is 'block', the socket does not
+        block; see `guard`.
+        """
+        self.family = family(schedule)
+        self.addr = schedule.ip_addr
+        self.targets = schedule.targets
+        self.copies = schedule.copies
+        self.rotate = len(self.targets) > 1 and self.copies == 1
+        self.next = 0
+        self.connected = schedule.connect
+        self.sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        configure(self.sock, schedule)
+        self.backpressure = schedule.backpressure
+        self.retries = schedule.send_retries
+        self.refused = 0
+        self.dropped = 0
+        self.blocked_ns = 0
+        self.sock_sendto = self.sock.sendto
+        self.sock_send = self.sock.send
+        self.poller = None
+        if self.backpressure != "block":
+            self.sock.setblocking(False)
+            self.sock_sendto = self.guard(self.sock.sendto)
+            self.sock_send = self.guard(self.sock.send)
+            # Unlike select, poll takes descriptors of 1024 and above
+            if hasattr(select, "poll"):
+                self.poller = select.poll()
+                self.poller.register(self.sock, select.POLLOUT)
+        if self.connected:
+            self.sock.connect(self.addr)
+            self.send = self.send_connected
+            self.send_loop = self.send_loop_connected
+        elif self.copies > 1:
+            self.send = self.send_broadcast
+            self.send_loop = self.send_loop_broadcast
+        elif self.rotate:
+            self.send = self.send_round_robin
+            self.send_loop = self.send_loop_round_robin
+
+        if schedule.batch_size > 1 and has_sendmmsg():
+            self.setup_mmsg(schedule.batch_size)
+            self.send_batch = self.send_mmsg
+        else:
+            self.send_batch = self.send_loop
+
+    def setup_mmsg(self, size: int) -> None:
+        """Preallocates the message headers for batches of up to `size`.
+
+        The headers of a connected socket carry no address. When
+        broadcasting, each packet has a header per target, all pointing
+        at the packet's one buffer.
+        """
+        names = [sockaddr(self.family, t) for t in self.targets]
+        self.names = [ctypes.create_string_buffer(n, len(n)) for n in names]
+        self.name_addresses = [ctypes.addressof(n) for n in self.names]
+        copies = self.copies
+        self.iovs = (_iovec * size)()
+        self.msgs = (_mmsghdr * (size * copies))()
+        for i in range(0, size):
+            for j in range(0, copies):
+                hdr = self.msgs[i * copies + j].msg_hdr
+                if not self.connected:
+                    hdr.msg_name = self.name_addresses[j]
+                    hdr.msg_namelen = len(names[j])
+                hdr.msg_iov = ctypes.pointer(self.iovs[i])
+                hdr.msg_iovlen = 1
+
+    def guard(self, func: typing.Callable) -> typing.Callable:
+        """Wraps `func`, a send call of the non-blocking socket, so that a
+        packet the kernel refuses for want of room is counted, and then
+        dropped or, with the 'retry' policy, sent again up to `retries`
+        times once there is room.
+        """
+        retry = self.backpressure == "retry"
+
+        def guarded(*args):
+            attempts = 0
+            while True:
+                try:
+                    return func(*args)
+                except OSError as exc:
+                    if exc.errno not in FULL_ERRNOS:
+                        raise
+                self.refused += 1
+                if not retry or attempts == self.retries:
+                    self.dropped += 1
+                    return 0
+                attempts += 1
+                self.wait_for_room()
+
+        return guarded
+
+    def wait_for_room(self) -> None:
+        """Waits up to RETRY_WAIT seconds for the socket to take more.
+
+        A full device queue (ENOBUFS) leaves the socket writable, so the
+        wait may end at once; the retries then run out quickly.
+        """
+        start = time.perf_counter_ns()
+        if self.poller is None:
+            select.select([], [self.sock], [], RETRY_WAIT)
+        else:
+            self.poller.poll(RETRY_WAIT * 1000)
+        self.blocked_ns += time.perf_counter_ns() - start
+
+    def add_result(self, result: dict) -> None:
+        """Adds the backpressure counts to `result`.
+        """
+        if self.backpressure == "block":
+            return
+        result["refused"] = self.refused
+        result["dropped"] = self.dropped
+        result["blocked_time"] = self.blocked_ns / 1e9
+
+    def send(self, data: bytes) -> None:
+        self.sock_sendto(data, self.addr)
+
+    def send_connected(self, data: bytes) -> None:
+        try:
+            self.sock_send(data)
+        except ConnectionRefusedError:
+            try:
+                self.sock_send(data)
+            except ConnectionRefusedError:
+                pass
+
+    def send_broadcast(self, data: bytes) -> None:
+        sendto = self.sock_sendto
+        for addr in self.targets:
+            sendto(data, addr)
+
+    def send_round_robin(self, data: bytes) -> None:
+        self.sock_sendto(data, self.targets[self.next])
+        self.next = (self.next + 1) % len(self.targets)
+
+    def send_loop(self, packets: typing.List[bytes]) -> None:
+        sendto = self.sock_sendto
+        addr = self.addr
+        for data in packets:
+            sendto(data, addr)
+
+    def send_loop_connected(self, packets: typing.List[bytes]) -> None:
+        send = self.send_connected
+        for data in packets:
+            send(data)
+
+    def send_loop_broadcast(self, packets: typing.List[bytes]) -> None:
+        sendto = self.sock_sendto
+        targets = self.targets
+        for data in packets:
+            for addr in targets:
+                sendto(data, addr)
+
+    def send_loop_round_robin(self, packets: typing.List[bytes]) -> None:
+        sendto = self.sock_sendto
+        targets = self.targets
+        i = self.next
+        for data in packets:
+            sendto(data, targets[i])
+            i = (i + 1) % len(targets)
+        self.next = i
+
+    def send_mmsg(self, packets: typing.List[bytes]) -> None:
+        """Sends `packets` with as few `sendmmsg` calls as the kernel allows.
+
+        `sendmmsg` needs the address of each buffer, which ctypes only
+        exposes for `bytes`; other buffers are copied.
+        """
+        iovs = self.iovs
+        keep = list()
+        for i, data in enumerate(packets):
+            if type(data) is not bytes:
+                data = bytes(data)
+            keep.append(data)
+            iovs[i].iov_base = ctypes.cast(data, ctypes.c_void_p).value
+            iovs[i].iov_len = len(data)
+
+        msgs = self.msgs
+        count = len(keep)
+        if self.rotate:
+            names = self.name_addresses
+            target = self.next
+            for i in range(0, count):
+                msgs[i].msg_hdr.msg_name = names[target]
+                target = (target + 1) % len(names)
+            self.next = target
+        count *= self.copies
+
+        fd = self.sock.fileno()
+        sent = 0
+        retried = False
+        attempts = 0
+        while sent < count:
+            result = _sendmmsg(
+                fd,
+                ctypes.addressof(msgs) + sent * ctypes.sizeof(_mmsghdr),
+                count - sent,
+                0,
+            )
+            if result < 0:
+                err = ctypes.get_errno()
+                if err in FULL_ERRNOS and self.backpressure != "block":
+                    # As in `guard`, for the first datagram not sent
+                    self.refused += 1
+                    if self.backpressure == "retry" and attempts < self.retries:
+                        attempts += 1
+                        self.wait_for_room()
+                        continue
+                    self.dropped += 1
+                    result = 1
+                elif err != errno.ECONNREFUSED or not self.connected:
+                    raise OSError(err, os.strerror(err))
+                elif not retried:
+                    retried = True
+                    continue
+                else:
+                    # Refused twice in a row: the packet is dropped
+                    result = 1
+            retried = False
+            attempts = 0
+            sent += result
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+class SOCSUdpReceiver:
+    def __init__(self, batch_size: int, size: int) -> None:
+        """Reads up to `batch_size` datagrams of up to `size` bytes at a
+        time from any socket, into buffers allocated once and shared by
+        all the sockets it reads.
+        """
+        self.size = size
+        self.buffers = [bytearray(size) for _ in range(0, batch_size)]
+        self.views = [memoryview(b) for b in self.buffers]
+        if has_recvmmsg():
+            self.iovs = (_iovec * batch_size)()
+            self.msgs = (_mmsghdr * batch_size)()
+            for i, buf in enumerate(self.buffers):
+                self.iovs[i].iov_base = ctypes.addressof(
+                    (ctypes.c_char * size).from_buffer(buf)
+                )
+                self.iovs[i].iov_len = size
+                self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovs[i])
+                self.msgs[i].msg_hdr.msg_iovlen = 1
+            self.receive = self.receive_mmsg
+        else:
+            self.receive = self.receive_loop
+
+    def receive_mmsg(self, sock: socket.socket) -> typing.List[memoryview]:
+        """Reads the datagrams waiting on `sock`, without blocking.
+
+        The views returned are only valid until the next call.
+        """
+        count = _recvmmsg(
+            sock.fileno(),
+            ctypes.addressof(self.msgs),
+            len(self.buffers),
+            socket.MSG_DONTWAIT,
+            None,
+        )
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(err, os.strerror(err))
+        views = self.views
+        msgs = self.msgs
+        return [views[i][: msgs[i].msg_len] for i in range(0, count)]
+
+    def receive_loop(self, sock: socket.socket) -> typing.List[memoryview]:
+        retval = list()
+        recv_into = sock.recv_into
+        for view in self.views:
+            try:
+                size = recv_into(view, 0, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            retval.append(view[:size])
+        return retval
+
+
+class SOCSTcpTransport:
+    def __init__(
+        self,
+        schedule: object,
+        wait: typing.Callable[[float], typing.Any] = time.sleep,
+    ) -> None:
+        """Sends the packets of `schedule` down one TCP connection.
+
+        The packets of a batch are coalesced into scatter-gather
+        `sendmsg` writes of up to IOV_MAX packets each. When the
+        connection fails, the transport reconnects, calling `wait` with
+        each backoff delay; if `wait` returns true, as
+        `threading.Event.wait` does once the run is stopping, it gives
+        up and the data is dropped. Data that was partly written when
+        the connection failed is written again in full on the new
+        connection.
+
+        The first connection is only tried once here, so that a target
+        that is down does not hold up the start of the run; if it
+        fails, the first send tries again. Only the connections lost
+        after that are counted as reconnections.
+        """
+        self.family = family(schedule)
+        self.addr = schedule.ip_addr
+        self.schedule = schedule
+        self.reconnect_delay = schedule.reconnect_delay
+        self.wait = wait
+        self.reconnects = 0
+        self.sock = None
+        self.connect(retry=False)
+        self.send_batch = self.send_msg
+
+    def connect(self, retry: bool = True) -> bool:
+        """Connects, retrying, if `retry`, until it succeeds or `wait`
+        gives up.
+        """
+        for delay in backoff(self.reconnect_delay):
+            sock = tcp_socket(self.schedule)
+            try:
+                sock.connect(self.addr)
+                self.sock = sock
+                return True
+            except OSError as exc:
+                sock.close()
+                log.warning("Cannot connect to %s:%s: %s", *self.addr, exc)
+            if not retry or self.wait(delay):
+                return False
+
+    def disconnect(self, exc: OSError) -> None:
+        log.warning("Lost connection to %s:%s: %s", *self.addr, exc)
+        self.sock.close()
+        self.sock = None
+        self.reconnects += 1
+
+    def send(self, data: bytes) -> None:
+        while self.sock is not None or self.connect():
+            try:
+                self.sock.sendall(data)
+                return
+            except OSError as exc:
+                self.disconnect(exc)
+
+    def send_msg(self, packets: typing.List[bytes]) -> None:
+        while self.sock is not None or self.connect():
+            try:
+                self.write(packets)
+                return
+            except OSError as exc:
+                if exc.errno == errno.EMSGSIZE:
+                    # Not the connection's fault; reconnecting would not help
+                    raise
+                self.disconnect(exc)
+
+    def write(self, packets: typing.List[bytes]) -> None:
+        """Writes all of `packets`, resuming after partial writes.
+        """
+        buffers = list(packets)
+        while buffers:
+            sent = self.sock.sendmsg(buffers[:IOV_MAX])
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                del buffers[0]
+            if sent:
+                buffers[0] = memoryview(buffers[0])[sent:]
+
+    def add_result(self, result: dict) -> None:
+        result["reconnects"] = self.reconnects
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def make_transport(
+    schedule: object, wait: typing.Callable[[float], typing.Any] = time.sleep
+) -> typing.Union[SOCSUdpTransport, SOCSTcpTransport]:
+    """Builds the transport for the `protocol` of `schedule`.
+
+    `wait` is only used by TCP transports; see `SOCSTcpTransport`.
+    """
+    if schedule.protocol == "tcp":
+        return SOCSTcpTransport(schedule, wait)
+    return SOCSUdpTransport(schedule)
@@ -0,0 +1,207 @@
+"""Shares the schedules of a run between worker processes.
+
+Every worker runs its share of the schedules with an ordinary
+single-process `SOCSender`, so one run can use more than one core.
+The workers start sending together on a shared start signal, like the
+threads of a single-process run, and send their results back to the
+parent when they finish.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import typing
+
+from socketsender import config, sender
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Seconds between checks on the workers while waiting for them
+POLL_INTERVAL = 0.1
+
+
+class SOCSworker(multiprocessing.Process):
+    def __init__(
+        self,
+        run_request: multiprocessing.Event,
+        ready: multiprocessing.Semaphore,
+        results: multiprocessing.Queue,
+        schedules: typing.List[config.SOCSSchedule],
+        engine: str,
+        cpu: typing.Optional[int],
+        index: int,
+        profile: bool = False,
+        profile_dir: typing.Optional[str] = None,
+    ) -> None:
+        super().__init__(name=f"SOCSworker-{index}")
+        # run_request, ready and results are shared by all workers
+        self.run_request = run_request
+        self.ready = ready
+        self.results = results
+        self.schedules = schedules
+        self.engine = engine
+        self.cpu = cpu
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.quitquit = multiprocessing.Event()
+
+    def stop(self):
+        self.quitquit.set()
+
+    def watch(self, socs: sender.SOCSender) -> None:
+        self.quitquit.wait()
+        socs.stop_all()
+
+    def run(self):
+        if self.cpu is not None:
+            os.sched_setaffinity(0, {self.cpu})
+
+        socs = sender.SOCSender(
+            engine=self.engine, profile=self.profile, profile_dir=self.profile_dir
+        )
+        threading.Thread(target=self.watch, args=(socs,), daemon=True).start()
+        try:
+            # Ready once the transports are open and the pools filled,
+            # so that every worker starts sending together
+            socs.prepare(self.schedules)
+            self.ready.release()
+            self.run_request.wait()
+            socs.start()
+        except KeyboardInterrupt:
+            # The parent is interrupted too, and stops everyone
+            pass
+        self.results.put((self.name, socs.results))
+
+
+def load(schedule: config.SOCSSchedule) -> float:
+    """Estimates the datagrams per second `schedule` will send.
+    """
+    if schedule.profile is not None:
+        rate = schedule.profile.mean_rate()
+    elif schedule.frequency is not None:
+        rate = schedule.frequency
+    elif schedule.bandwidth is None:
+        # Paced by its source, at a rate not known in advance
+        rate = 0.0
+    else:
+        rate = schedule.bandwidth / (schedule.length or 128)
+    return rate * schedule.copies
+
+
+def shard(
+    schedules: typing.List[config.SOCSSchedule], count: int
+) -> typing.List[typing.List[config.SOCSSchedule]]:
+    """Splits `schedules` into at most `count` shards of similar load.
+
+    The load of a schedule is its packet rate. Each schedule, busiest
+    first, goes to the least loaded shard.
+    """
+    shards = [list() for _ in range(0, min(count, len(schedules)))]
+    loads = [0.0] * len(shards)
+    for sched in sorted(schedules, key=load, reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(sched)
+        loads[i] += load(sched)
+    return shards
+
+
+def make_workers(
+    schedules: typing.List[config.SOCSSchedule],
+    workers: typing.Union[int, str],
+    engine: str,
+    affinity: bool,
+    profile: bool = False,
+    profile_dir: typing.Optional[str] = None,
+) -> typing.List[SOCSworker]:
+    if workers == "auto":
+        workers = os.cpu_count() or 1
+    cpus = None
+    if affinity:
+        if hasattr(os, "sched_getaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+        else:
+            log.warning("CPU affinity is not supported on this platform")
+
+    run_request = multiprocessing.Event()
+    ready = multiprocessing.Semaphore(0)
+    results = multiprocessing.Queue()
+    retval = list()
+    for i, scheds in enumerate(shard(schedules, int(workers))):
+        cpu = None if cpus is None else cpus[i % len(cpus)]
+        retval.append(
+            SOCSworker(
+                run_request,
+                ready,
+                results,
+                scheds,
+                engine,
+                cpu,
+                i,
+                profile,
+                profile_dir,
+            )
+        )
+    return retval
+
+
+def collect(workers: typing.List[SOCSworker], results: dict, done: set) -> None:
+    """Merges the results of `workers` into `results` as they finish.
+
+    `done` holds the names of the workers already heard from.
+    """
+    shared = workers[0].results
+    while len(done) < len(workers):
+        try:
+            name, result = shared.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if any(w.is_alive() for w in workers):
+                continue
+            # Results are flushed before a worker exits, so one more
+            # look finds anything still in flight.
+            try:
+                name, result = shared.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                missing = [w.name for w in workers if w.name not in done]
+                log.error("No results from %s", ", ".join(missing))
+                return
+        results.update(result)
+        done.add(name)
+
+
+def wait_ready(workers: typing.List[SOCSworker]) -> bool:
+    for _ in workers:
+        while not workers[0].ready.acquire(timeout=POLL_INTERVAL):
+            if not all(w.is_alive() for w in workers):
+                log.error("A worker died before the run started")
+                return False
+    return True
+
+
+def run(workers: typing.List[SOCSworker]) -> dict:
+    """Runs `workers` to completion and returns their merged results.
+    """
+    results = dict()
+    done = set()
+    if not workers:
+        return results
+
+    try:
+        for worker in workers:
+            worker.start()
+        if not wait_ready(workers):
+            for worker in workers:
+                worker.stop()
+        workers[0].run_request.set()
+        collect(workers, results, done)
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.stop()
+        workers[0].run_request.set()
+        collect(workers, results, done)
+
+    for worker in workers:
+        worker.join()
+    return results
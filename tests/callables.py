@@ -19,3 +19,29 @@ class SOCS_Test2:
     def __call__(self, **kwds) -> bytes:
         time.sleep(0.5)
         return b"Hello"
+
+
+class SOCS_Test3:
+    def __init__(self, _: object) -> None:
+        self.calls = 0
+
+    def __call__(self, **kwds) -> bytes:
+        self.calls += 1
+        if self.calls > 5:
+            raise RuntimeError("Out of packets")
+        return b"Hello"
+
+
+def rate_up(t: float) -> float:
+    """A frequency that starts at 500 packets per second and rises.
+    """
+    return 500.0 + 1000.0 * t
+
+
+class SOCS_Test4:
+    def __init__(self, _: object) -> None:
+        pass
+
+    def __call__(self, **kwds) -> bytes:
+        time.sleep(0.05)
+        return b"Hello"
@@ -0,0 +1,100 @@
+"""
+Tests for `socketsender.arrivals` module.
+"""
+import itertools
+import os
+import tempfile
+
+import pytest
+from socketsender import arrivals
+
+
+def gaps(model, count=20000, mean=0.01):
+    times = list(itertools.islice(model.times(mean), count + 1))
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+def write_distribution(text):
+    of, fname = tempfile.mkstemp()
+    os.write(of, text.encode())
+    os.close(of)
+    return fname
+
+
+@pytest.mark.parametrize(
+    "model",
+    [
+        arrivals.SOCSPoissonArrivals(1),
+        arrivals.SOCSUniformArrivals(0.5, 1),
+        arrivals.SOCSParetoArrivals(2.5, 1),
+        arrivals.SOCSEmpiricalArrivals([1.0, 2.0, 6.0], seed=1),
+        arrivals.SOCSEmpiricalArrivals([0.0, 1.0, 3.0], [0.0, 0.5, 1.0], seed=1),
+    ],
+)
+def test_mean(model):
+    drawn = gaps(model)
+
+    assert next(model.times(0.01)) == 0.0
+    assert min(drawn) >= 0
+    assert sum(drawn) / len(drawn) == pytest.approx(0.01, rel=0.05)
+    # Seeded models draw the same gaps every time
+    assert gaps(model, 100) == drawn[:100]
+
+
+def test_uniform():
+    drawn = gaps(arrivals.SOCSUniformArrivals(0.5))
+
+    assert 0.005 <= min(drawn) < 0.0051
+    assert 0.0149 < max(drawn) <= 0.015
+
+
+def test_poisson():
+    drawn = gaps(arrivals.SOCSPoissonArrivals())
+
+    # Exponential gaps are as spread as they are long
+    variance = sum((g - 0.01) ** 2 for g in drawn) / len(drawn)
+    assert variance ** 0.5 == pytest.approx(0.01, rel=0.1)
+
+
+def test_empirical_samples():
+    fname = write_distribution("# gaps\n1\n\n2\n6 # long\n")
+    values, probabilities = arrivals.read_distribution(fname)
+    os.unlink(fname)
+    model = arrivals.SOCSEmpiricalArrivals(values, probabilities)
+
+    assert probabilities is None
+    assert set(round(g, 6) for g in gaps(model, 100, 0.03)) == {0.01, 0.02, 0.06}
+
+
+def test_empirical_cdf():
+    fname = write_distribution("0.001, 0.25\n0.002, 0.5\n0.004, 1\n")
+    values, probabilities = arrivals.read_distribution(fname)
+    os.unlink(fname)
+    model = arrivals.SOCSEmpiricalArrivals(values, probabilities)
+
+    assert probabilities == [0.25, 0.5, 1.0]
+    # The quarter of the gaps at the first point, and the rest spread
+    # between the points
+    assert model.unit_mean == pytest.approx(0.00025 + 0.000375 + 0.0015)
+    drawn = gaps(model, mean=model.unit_mean)
+    assert min(drawn) == pytest.approx(0.001)
+    assert max(drawn) <= 0.004
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "# nothing\n",
+        "-1\n",
+        "0\n0\n",
+        "1 0.5\n2 0.4\n",
+        "1 0.5\n2 0.9\n",
+        "1 0.5\n2\n",
+    ],
+)
+def test_bad_distribution(text):
+    fname = write_distribution(text)
+    with pytest.raises(ValueError):
+        arrivals.read_distribution(fname)
+    os.unlink(fname)
@@ -0,0 +1,59 @@
+"""
+Tests for `socketsender.bench` module.
+"""
+import json
+import subprocess
+import tempfile
+
+from socketsender import bench
+
+
+def test_run():
+    results = bench.SOCSBench(duration=0.1, length=16).run(
+        sources=["sequential"], engines=["thread"], paths=["udp", "tcp-batch"]
+    )
+
+    assert results["length"] == 16
+    assert [c["path"] for c in results["cases"]] == ["udp", "tcp-batch"]
+    for case in results["cases"]:
+        assert case["packets"] > 0
+        assert case["bytes"] == case["packets"] * 16
+        assert case["pps"] > 0
+        assert case["cpu_per_packet"] > 0
+
+
+def test_cli():
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        sb = subprocess.run(
+            [
+                "socketsender-bench",
+                "--duration",
+                "0.1",
+                "--sources",
+                "random",
+                "--engines",
+                "asyncio",
+                "--paths",
+                "udp-batch",
+                "--output",
+                output.name,
+            ],
+            stdout=subprocess.PIPE,
+        )
+        results = json.load(open(output.name))
+
+    assert sb.returncode == 0
+    assert b"random" in sb.stdout
+    assert len(results["cases"]) == 1
+    assert results["cases"][0]["engine"] == "asyncio"
+
+
+def test_sources():
+    results = bench.SOCSBench(duration=0.05, length=16).run(
+        engines=["thread"], paths=["udp"]
+    )
+
+    assert [c["source"] for c in results["cases"]] == list(bench.SOURCES)
+    for case in results["cases"]:
+        assert case["packets"] > 0
+        assert case["bytes"] == case["packets"] * 16
@@ -2,6 +2,8 @@
 Tests for `socketsender.callables` module.
 """
 
+import struct
+
 from socketsender import callables as udpcalls
 from socketsender import config
 
@@ -52,6 +54,51 @@ def test_genrandom_lenNone():
     assert len(bstring) == 128
 
 
+def test_genrandom_seed():
+    stream = """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: 100
+  source: random
+  total: 1000
+  seed: 42
+...
+        """
+    sch1 = config.get_schedules(stream)[0]
+    sch2 = config.get_schedules(stream)[0]
+
+    assert sch1.seed == 42
+    assert sch1.source() == sch2.source()
+    assert sch1.source() == sch2.source()
+
+
+def test_genrandom_pool():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: 100
+  source: random
+  total: 1000
+  random_pool: 3
+...
+        """
+    )[0]
+
+    assert sch.random_pool == 3
+    packets = [sch.source() for _ in range(0, 4)]
+
+    assert all(len(p) == 100 for p in packets)
+    assert packets[0] != packets[1]
+    assert packets[3] == packets[0]
+
+
 def test_gensequential():
     sched = config.get_schedules(
         """
@@ -75,6 +122,26 @@ def test_gensequential():
     assert len(bstring) == 140
 
 
+def test_gensequential_continues():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: 200
+  source: sequential
+  total: 1000
+...
+        """
+    )[0]
+
+    data = b"".join(bytes(sch.source()) for _ in range(0, 5))
+
+    assert data == bytes(i % 256 for i in range(0, 1000))
+
+
 def test_gensequential_lenNone():
     sched = config.get_schedules(
         """
@@ -143,3 +210,93 @@ def test_genfilesource_lenNone():
     bstring = sch.source()
 
     assert len(bstring) == 128
+
+
+def test_genfilesource_line():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: none
+  source: file
+  total: 1000
+  framing: line
+  user_data1: "tests/data/b.txt"
+...
+        """
+    )[0]
+
+    assert sch.source() == b"bbbbbbb0\n"
+    assert sch.source() == b"bbbbbbb1\n"
+
+
+def test_genfilesource_loop():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: none
+  source: file
+  total: infinity
+  framing: line
+  loop: true
+  user_data1: "tests/data/b.txt"
+...
+        """
+    )[0]
+
+    packets = [bytes(sch.source()) for _ in range(0, 11)]
+
+    assert packets[9] == b"bbbbbbb9\n"
+    assert packets[10] == b"bbbbbbb0\n"
+
+
+def test_genfilesource_eof():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: 50
+  source: file
+  total: 1000
+  user_data1: "tests/data/b.txt"
+...
+        """
+    )[0]
+
+    assert len(sch.source()) == 50
+    assert len(sch.source()) == 40
+    assert len(sch.source()) == 0
+
+
+def test_genfilesource_prefixed(tmp_path):
+    fname = tmp_path / "records.bin"
+    records = (b"one", b"", b"three" * 100)
+    fname.write_bytes(b"".join(struct.pack("!H", len(r)) + r for r in records))
+
+    sch = config.get_schedules(
+        f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: none
+  source: file
+  total: 1000
+  framing: prefixed
+  user_data1: "{fname}"
+...
+        """
+    )[0]
+
+    assert [sch.source() for _ in range(0, 4)] == [b"one", b"", b"three" * 100, b""]
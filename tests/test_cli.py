@@ -180,6 +180,69 @@ def test_module():
     os.unlink(fname)
 
 
+def test_engine():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    fname = mktemp2(port)
+
+    subprocess.Popen(
+        [
+            "socketsender",
+            "--engine",
+            "asyncio",
+            "--module",
+            os.path.join("tests", "data", "welp.py"),
+            fname,
+        ],
+        executable="socketsender",
+    )
+
+    for i in range(0, 10):
+        msg = sock.recv(1024)
+        assert msg == f"Welp{i}\n".encode()
+
+    os.unlink(fname)
+
+
+def test_cache_timing():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    fname = mktemp1(port)
+
+    with tempfile.TemporaryDirectory() as cache:
+        for expected in ("validate", "cache"):
+            sb = subprocess.run(
+                ["socketsender", "--timing", "--cache", cache, fname],
+                stderr=subprocess.PIPE,
+                check=True,
+            )
+            assert expected in sb.stderr.decode()
+            assert sorted(sock.recv(1024) for _ in range(0, 20))[0] == b"aaaaaaa0\n"
+
+    os.unlink(fname)
+
+
+def test_profile_dir():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    fname = mktemp1(port)
+
+    with tempfile.TemporaryDirectory() as profiles:
+        subprocess.run(["socketsender", "--profile-dir", profiles, fname], check=True)
+        assert sorted(os.listdir(profiles)) == ["boo.prof", "foo.prof"]
+
+    os.unlink(fname)
+
+
 def test_bad_module():
     sb = subprocess.run(
         [
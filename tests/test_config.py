@@ -1,12 +1,19 @@
 """
 Tests for `socketsender.config` module.
 """
+import io
 import ipaddress
+import json
+import os
+import pickle
+import tempfile
 
 import pytest
 import schema
+from socketsender import arrivals
 from socketsender import callables as udpcalls
 from socketsender import config
+from socketsender import profiles
 
 
 def test_ok():
@@ -422,3 +429,754 @@ def test_badtotal2():
 ...
         """
         )
+
+
+def test_pickle():
+    """A pickled schedule builds a fresh source when unpickled.
+    """
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1
+  length: 10
+  source: sequential
+  total: 1000
+...
+        """
+    )[0]
+    sch.source()
+
+    copy = pickle.loads(pickle.dumps(sch))
+
+    assert copy.name == "foo"
+    assert copy.ip_addr == ("1.1.1.1", 44)
+    assert copy.source is not sch.source
+    assert bytes(copy.source()) == bytes(range(0, 10))
+
+
+def test_bandwidth():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  bandwidth: 100Mbit/s
+  bandwidth_burst: 1500
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )[0]
+
+    assert sch.frequency is None
+    assert sch.bandwidth == pytest.approx(12.5e6)
+    assert sch.bandwidth_burst == pytest.approx(1500.0)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1000, 1000.0),
+        ("1000", 1000.0),
+        ("2.5 MB/s", 2.5e6),
+        ("1Gbit", 1.25e8),
+        ("8kbit/s", 1000.0),
+    ],
+)
+def test_to_bandwidth(value, expected):
+    assert config.to_bandwidth(value) == pytest.approx(expected)
+
+
+def test_badbandwidth():
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  bandwidth: lots
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_norate():
+    """Either frequency or bandwidth must be given.
+    """
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_protocol():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  protocol: tcp
+  reconnect_delay: 2
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].protocol == "udp"
+    assert sch[0].reconnect_delay == pytest.approx(0.1)
+    assert sch[1].protocol == "tcp"
+    assert sch[1].reconnect_delay == pytest.approx(2.0)
+    assert "protocol:    tcp" in str(sch[1])
+
+
+def test_badprotocol():
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  protocol: sctp
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_socket_options():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  connect: true
+  bind_addr: "10.0.0.1"
+  bind_port: 5000
+  sndbuf: 1048576
+  dscp: 46
+  priority: 4
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].connect is False
+    assert sch[0].bind_addr is None
+    assert sch[0].sndbuf is None
+    assert sch[0].tos is None
+    assert sch[0].priority is None
+    assert sch[1].connect is True
+    assert sch[1].bind_addr == "10.0.0.1"
+    assert sch[1].bind_port == 5000
+    assert sch[1].sndbuf == 1048576
+    assert sch[1].tos == 184
+    assert sch[1].priority == 4
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "tos: 256",
+        "dscp: 64",
+        "tos: 16\n  dscp: 4",
+        "sndbuf: 0",
+        "bind_port: 70000",
+        "bind_addr: nowhere",
+        "bind_addr: '::1'",
+    ],
+)
+def test_badsocket_options(extra):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  {extra}
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_targets():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "10.0.0.0/30"
+  target_port: 5000-5002
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+- name: boo
+  target_addr: ["10.0.1.1", "10.0.2.0/31"]
+  target_port: [44, 50-51]
+  fanout: round-robin
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].targets == [
+        (addr, port)
+        for addr in ("10.0.0.1", "10.0.0.2")
+        for port in (5000, 5001, 5002)
+    ]
+    assert sch[0].ip_addr == ("10.0.0.1", 5000)
+    assert sch[0].copies == 6
+    assert "targets:     6 (broadcast)" in str(sch[0])
+    assert len(sch[1].targets) == 9
+    assert sch[1].targets[-1] == ("10.0.2.1", 51)
+    assert sch[1].copies == 1
+
+
+@pytest.mark.parametrize(
+    "targets",
+    [
+        'target_addr: ["1.1.1.1", "::1"]\n  target_port: 44',
+        "target_addr: []\n  target_port: 44",
+        'target_addr: "1.1.1.1"\n  target_port: 65535-65536',
+        'target_addr: "1.1.1.1"\n  target_port: [44, 45]\n  protocol: tcp',
+        'target_addr: "1.1.1.1"\n  target_port: [44, 45]\n  connect: true',
+        'target_addr: "1.1.1.1"\n  target_port: 44\n  fanout: random',
+    ],
+)
+def test_badtargets(targets):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  {targets}
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_template():
+    sch = config.get_schedules(
+        """
+---
+- name: "flow{i}"
+  target_addr: "10.0.0.1"
+  target_port: 44
+  each:
+    target_port: 5000-5003
+    bind_port: [7000, 7001]
+  frequency: 10
+  length: 100
+  source: sequential
+  total: 1000
+- name: boo
+  instances: 2
+  target_addr: ["10.0.0.1", "10.0.0.2"]
+  target_port: 44
+  each:
+    bind_addr: "10.1.0.0/24"
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert [s.name for s in sch] == [
+        "flow0",
+        "flow1",
+        "flow2",
+        "flow3",
+        "boo-0",
+        "boo-1",
+    ]
+    assert [s.ip_addr for s in sch[:4]] == [("10.0.0.1", p) for p in range(5000, 5004)]
+    assert [s.bind_port for s in sch[:4]] == [7000, 7001, 7000, 7001]
+    assert sch[3].targets == [("10.0.0.1", 5003)]
+    assert sch[0].source is not sch[1].source
+    assert sch[4].targets == [("10.0.0.1", 44), ("10.0.0.2", 44)]
+    assert sch[4].copies == 2
+    assert [s.bind_addr for s in sch[4:]] == ["10.1.0.1", "10.1.0.2"]
+
+
+def test_iter_schedules():
+    schedules = config.iter_schedules(
+        """
+- name: foo
+  instances: 1000000
+  target_addr: "10.0.0.1"
+  target_port: 44
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+        """
+    )
+
+    assert next(schedules).name == "foo-0"
+    assert next(schedules).name == "foo-1"
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "instances: 0",
+        "each: {target_port: []}",
+        "each: {target_port: 65536}",
+        "each: {target_addr: ['1.1.1.2', '::1']}",
+        "each: {bind_addr: '::1'}",
+        "each: {source: random}",
+    ],
+)
+def test_badtemplate(extra):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  {extra}
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_json():
+    with tempfile.NamedTemporaryFile("w+", suffix=".json") as stream:
+        json.dump(
+            [
+                {
+                    "name": "foo",
+                    "target_addr": "1.1.1.1",
+                    "target_port": 44,
+                    "frequency": 10,
+                    "length": 100,
+                    "source": "random",
+                    "total": 1000,
+                }
+            ],
+            stream,
+        )
+        stream.seek(0)
+
+        sch = config.get_schedules(stream)
+
+    assert sch[0].ip_addr == ("1.1.1.1", 44)
+    assert sch[0].frequency == pytest.approx(10.0)
+
+
+def test_load_cache():
+    data = b"""
+- name: "foo{i}"
+  instances: 3
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  length: 10
+  source: sequential
+  total: 1000
+"""
+    with tempfile.TemporaryDirectory() as cache:
+        first = dict()
+        sch = config.load(io.BytesIO(data), cache, first)
+        second = dict()
+        cached = config.load(io.BytesIO(data), cache, second)
+        (path,) = [os.path.join(cache, name) for name in os.listdir(cache)]
+        with open(path, "wb") as fd:
+            fd.write(b"garbage")
+        third = dict()
+        reloaded = config.load(io.BytesIO(data), cache, third)
+
+    assert set(first) == {"parse", "validate"}
+    assert set(second) == {"cache"}
+    assert set(third) == {"parse", "validate"}
+    assert [s.name for s in cached] == [s.name for s in sch]
+    assert [s.name for s in reloaded] == [s.name for s in sch]
+    assert bytes(cached[2].source()) == bytes(range(0, 10))
+
+
+def test_load_cache_arrival():
+    with tempfile.TemporaryDirectory() as tmp:
+        gaps = os.path.join(tmp, "gaps.txt")
+        with open(gaps, "w") as fd:
+            fd.write("0.001\n0.002\n")
+        data = f"""
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  arrival: {{model: empirical, file: {gaps}}}
+  length: 10
+  source: sequential
+  total: 1000
+""".encode()
+        cache = os.path.join(tmp, "cache")
+        config.load(io.BytesIO(data), cache)
+        with open(gaps, "w") as fd:
+            fd.write("0.005\n0.007\n")
+        timings = dict()
+        (cached,) = config.load(io.BytesIO(data), cache, timings)
+
+    assert set(timings) == {"cache"}
+    assert cached.arrival.values == [0.005, 0.007]
+
+
+def test_arrival():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  arrival: poisson
+  seed: 5
+  length: 100
+  source: random
+  total: 1000
+- name: zoo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  arrival: {model: pareto, shape: 1.2}
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].arrival is None
+    assert isinstance(sch[1].arrival, arrivals.SOCSPoissonArrivals)
+    assert sch[1].arrival.seed == 5
+    assert sch[2].arrival.shape == pytest.approx(1.2)
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "frequency: 10\n  arrival: gaussian",
+        "frequency: 10\n  arrival: {model: uniform, jitter: 2}",
+        "frequency: 10\n  arrival: {model: pareto, shape: 1}",
+        "frequency: 10\n  arrival: {model: empirical}",
+        "frequency: 10\n  arrival: {model: empirical, file: /nonexistent}",
+        "bandwidth: 1000\n  arrival: poisson",
+        "profile: [{duration: 1, rate: 5}]\n  arrival: poisson",
+    ],
+)
+def test_badarrival(extra):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  {extra}
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_profile():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  profile:
+    - {duration: 1, ramp: [10, 100]}
+    - {duration: 2, rate: 100}
+    - {duration: 1, sine: {mean: 50, amplitude: 10, period: 0.5}}
+  length: 100
+  source: random
+  total: infinity
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: tests.callables.rate_up
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].frequency is None
+    assert [type(p) for p in sch[0].profile.phases] == [
+        profiles.SOCSRampPhase,
+        profiles.SOCSConstantPhase,
+        profiles.SOCSSinePhase,
+    ]
+    assert sch[0].profile.duration() == pytest.approx(4.0)
+    assert sch[1].frequency(1.0) == pytest.approx(1500.0)
+    assert sch[1].profile.mean_rate() == pytest.approx(500.0)
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "profile: []",
+        "profile: [{duration: 1}]",
+        "profile: [{duration: 1, rate: 5, ramp: [1, 2]}]",
+        "profile: [{duration: 1, ramp: [1]}]",
+        "profile: [{duration: 0, rate: 5}]",
+        "frequency: 10\n  profile: [{duration: 1, rate: 5}]",
+        "frequency: nosuchmodule.rate",
+    ],
+)
+def test_badprofile(extra):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  {extra}
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_bursts():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1000
+  burst_size: 10
+  length: 100
+  source: random
+  total: 1000
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  burst_interval: 0.01
+  burst_size: [4, 12]
+  length: 100
+  source: random
+  total: 1000
+- name: zoo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1000
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].burst_sizes == (10, 10)
+    assert sch[0].batch_size == 10
+    assert sch[0].burst_interval == pytest.approx(0.01)
+    assert sch[1].burst_sizes == (4, 12)
+    assert sch[1].batch_size == 12
+    assert sch[1].frequency == pytest.approx(800.0)
+    assert sch[2].burst_sizes is None
+    assert sch[2].burst_interval is None
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "frequency: 10\n  burst_size: 0",
+        "frequency: 10\n  burst_size: [5, 2]",
+        "frequency: 10\n  burst_size: [1, 2, 3]",
+        "frequency: 10\n  burst_interval: 0.1",
+        "frequency: 10\n  burst_size: 5\n  batch_size: 5",
+        "frequency: 10\n  burst_size: 5\n  burst_interval: 0.1",
+        "profile: [{duration: 1, rate: 5}]\n  burst_size: 5",
+    ],
+)
+def test_badbursts(extra):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  {extra}
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_backpressure():
+    sch = config.get_schedules(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  length: 100
+  source: random
+  total: 1000
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  backpressure: retry
+  send_retries: 5
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+    )
+
+    assert sch[0].backpressure == "block"
+    assert sch[0].send_retries == 3
+    assert sch[1].backpressure == "retry"
+    assert sch[1].send_retries == 5
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        "backpressure: wait",
+        "backpressure: drop\n  protocol: tcp",
+        "backpressure: retry\n  send_retries: -1",
+    ],
+)
+def test_badbackpressure(extra):
+    with pytest.raises(schema.SchemaError):
+        config.get_schedules(
+            f"""
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 10
+  {extra}
+  length: 100
+  source: random
+  total: 1000
+...
+        """
+        )
+
+
+def test_get_targets():
+    targets = config.get_targets(
+        """
+---
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: [44, 45]
+  frequency: 10
+  length: 100
+  source: file
+  user_data1: /nonexistent
+  total: 1000
+- name: boo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  protocol: tcp
+  source: nosuchmodule.Source
+  arrival: {model: empirical, file: /nonexistent}
+- name: "zoo{i}"
+  instances: 3
+  target_addr: "1.1.1.1"
+  target_port: 44
+  fanout: round-robin
+  each:
+    target_port: 5000-5001
+  source: random
+...
+        """
+    )
+
+    assert [t.name for t in targets] == ["foo", "boo", "zoo0", "zoo1", "zoo2"]
+    assert targets[0].targets == [("1.1.1.1", 44), ("1.1.1.1", 45)]
+    assert targets[0].copies == 2
+    assert targets[1].protocol == "tcp"
+    assert targets[2].targets == [("1.1.1.1", 5000)]
+    assert targets[4].targets == [("1.1.1.1", 5000)]
+    assert targets[4].protocol == "udp"
+
+    with pytest.raises(schema.SchemaError):
+        config.get_targets('- {name: foo, target_addr: "1.1.1.1"}')
@@ -0,0 +1,49 @@
+"""
+Tests for `socketsender.header` module.
+"""
+import time
+
+from socketsender import header
+
+
+def test_roundtrip():
+    stamper = header.SOCSStamper("foo")
+    stamper.seq = 12
+    before = time.time_ns()
+    data = stamper.stamp(b"abc")
+
+    assert data[:4] == b"SOCS"
+    hdr = header.unpack(data)
+    assert hdr[:2] == (header.schedule_id("foo"), 12)
+    assert before <= hdr.time_ns <= time.time_ns()
+
+
+def test_no_header():
+    assert header.unpack(b"Hello") is None
+    assert header.unpack(bytes(header.SIZE)) is None
+
+
+def test_stamp():
+    stamper = header.SOCSStamper("foo", count=2, size=16)
+
+    first = stamper.stamp(b"Hello")
+    assert len(first) == header.SIZE + 5
+    assert bytes(first[header.SIZE :]) == b"Hello"
+    assert header.unpack(first)[:2] == (header.schedule_id("foo"), 0)
+
+    sent = list()
+    stamper.wrap_batch(sent.extend)([b"one", b"two"])
+    assert [header.unpack(p).seq for p in sent] == [1, 2]
+    assert [bytes(p[header.SIZE :]) for p in sent] == [b"one", b"two"]
+
+
+def test_stamp_longer():
+    stamper = header.SOCSStamper("foo", count=1, size=4)
+    first = stamper.stamp(b"Hi")
+
+    longer = stamper.stamp(b"Hello, world")
+    assert bytes(longer[header.SIZE :]) == b"Hello, world"
+    assert header.unpack(longer).seq == 1
+    # Earlier views stay valid, if stale
+    assert len(first) == header.SIZE + 2
+    assert len(stamper.buffers[0]) == header.SIZE + 12
@@ -0,0 +1,134 @@
+"""
+Tests for `socketsender.pacing` module.
+"""
+import time
+
+from socketsender import config, pacing
+
+
+def test_rate():
+    """Never faster than the rate, and not much slower on a busy machine.
+    """
+    pacer = pacing.SOCSPacer(0.001)
+    start = time.perf_counter()
+    pacer.start()
+    for _ in range(0, 200):
+        pacer.wait()
+
+    assert 0.2 <= time.perf_counter() - start < 0.25
+
+
+def test_no_drift():
+    """Time spent between waits does not delay later deadlines.
+    """
+    pacer = pacing.SOCSPacer(0.002)
+    start = time.perf_counter()
+    pacer.start()
+    for _ in range(0, 100):
+        time.sleep(0.001)
+        pacer.wait()
+
+    assert 0.2 <= time.perf_counter() - start < 0.25
+
+
+def test_burst():
+    pacer = pacing.SOCSPacer(0.001)
+    pacer.start()
+    time.sleep(0.01)
+    pacer.wait()
+
+    assert pacer.remaining() < 0
+    assert pacer.skipped == 0
+
+
+def test_skip():
+    pacer = pacing.SOCSPacer(0.001, catchup="skip")
+    pacer.start()
+    time.sleep(0.0105)
+    pacer.wait()
+
+    assert pacer.remaining() <= 1000000
+    assert pacer.skipped >= 9
+    assert pacer.index == pacer.skipped + 2
+
+
+def test_bucket():
+    bucket = pacing.SOCSTokenBucket(1000000)
+    start = time.perf_counter()
+    bucket.start()
+    for i in range(0, 200):
+        bucket.consume(500 + (i % 2) * 1000)
+        bucket.wait()
+
+    assert 0.199 <= time.perf_counter() - start < 0.25
+
+
+def test_bucket_burst():
+    bucket = pacing.SOCSTokenBucket(1000000, burst=5000)
+    bucket.start()
+    bucket.consume(4000)
+
+    assert bucket.remaining() == 0
+
+    bucket.consume(4000)
+
+    assert 0 < bucket.remaining() <= 3000000
+
+
+def test_table():
+    pacer = pacing.SOCSTablePacer(iter([0.5, 0.51, 0.52, 0.53]))
+    start = time.perf_counter()
+    pacer.start()
+    events = 1
+    while not pacer.finished:
+        pacer.wait()
+        events += 1
+
+    assert events == 4
+    assert 0.03 <= time.perf_counter() - start < 0.1
+
+
+def test_table_skip():
+    pacer = pacing.SOCSTablePacer(iter([i / 1000 for i in range(0, 100)]), "skip")
+    pacer.start()
+    time.sleep(0.05)
+    pacer.wait()
+
+    assert pacer.skipped >= 45
+    assert pacer.lag() < 0.002
+
+
+def test_table_blocks():
+    pacer = pacing.SOCSTablePacer(iter([0.0] * (pacing.BLOCK_SIZE * 2 + 5)))
+    pacer.start()
+    events = 1
+    while not pacer.finished:
+        pacer.wait()
+        events += 1
+
+    assert events == pacing.BLOCK_SIZE * 2 + 5
+
+
+def test_arrival():
+    schedule = config.get_schedules(
+        """
+- name: foo
+  target_addr: "1.1.1.1"
+  target_port: 44
+  frequency: 1000
+  arrival: poisson
+  seed: 1
+  length: 100
+  source: random
+  total: 1000
+"""
+    )[0]
+    pacer = pacing.make_pacer(schedule)
+    start = time.perf_counter()
+    pacer.start()
+    for _ in range(0, 100):
+        pacer.wait()
+
+    assert isinstance(pacer, pacing.SOCSTablePacer)
+    # 100 exponential gaps of 1 ms on average
+    assert 0.05 < time.perf_counter() - start < 0.2
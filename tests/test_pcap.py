@@ -0,0 +1,189 @@
+"""
+Tests for `socketsender.pcap` module.
+"""
+
+import os
+import socket
+import struct
+import tempfile
+
+import pytest
+from socketsender import config, pcap, sender
+
+
+def udp4(payload, proto=17, fragment=0):
+    udp = struct.pack("!HHHH", 1000, 2000, 8 + len(payload), 0) + payload
+    ip = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + len(udp),
+        0,
+        fragment,
+        64,
+        proto,
+        0,
+        bytes([10, 0, 0, 1]),
+        bytes([10, 0, 0, 2]),
+    )
+    return ip + udp
+
+
+def udp6(payload):
+    udp = struct.pack("!HHHH", 1000, 2000, 8 + len(payload), 0) + payload
+    # With a hop-by-hop options header to skip
+    hop = bytes([17, 0]) + bytes(6)
+    ip = struct.pack(
+        "!IHBB16s16s", 6 << 28, len(hop) + len(udp), 0, 64, bytes(16), bytes(16)
+    )
+    return ip + hop + udp
+
+
+def ether(packet, ethertype=0x0800, vlan=False):
+    header = bytes(12)
+    if vlan:
+        header += struct.pack("!HH", 0x8100, 5)
+    return header + struct.pack("!H", ethertype) + packet
+
+
+def write_pcap(frames, order="<", nanoseconds=False):
+    """`frames` are (seconds, frame) pairs on Ethernet."""
+    magic = pcap.PCAP_MAGIC_NS if nanoseconds else pcap.PCAP_MAGIC_US
+    data = struct.pack(order + "IHHiIII", magic, 2, 4, 0, 0, 65535, 1)
+    for stamp, frame in frames:
+        fraction = round(stamp % 1 * (1e9 if nanoseconds else 1e6))
+        data += struct.pack(
+            order + "IIII", int(stamp), fraction, len(frame), len(frame)
+        )
+        data += frame
+    return write_file(data)
+
+
+def pcapng_block(block_type, body):
+    body += bytes(-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+def write_pcapng(frames):
+    """`frames` are (seconds, frame) pairs on raw IP, in nanoseconds."""
+    data = pcapng_block(
+        pcap.PCAPNG_SHB, struct.pack("<IHHq", pcap.PCAPNG_BYTE_ORDER, 1, 0, -1)
+    )
+    options = struct.pack("<HHB3x", pcap.IF_TSRESOL, 1, 9) + bytes(4)
+    data += pcapng_block(
+        pcap.PCAPNG_IDB, struct.pack("<HHI", pcap.LINKTYPE_RAW, 0, 65535) + options
+    )
+    for stamp, frame in frames:
+        units = round(stamp * 1e9)
+        body = struct.pack(
+            "<IIIII", 0, units >> 32, units & 0xFFFFFFFF, len(frame), len(frame)
+        )
+        data += pcapng_block(pcap.PCAPNG_EPB, body + frame)
+    return write_file(data)
+
+
+def write_file(data):
+    of, fname = tempfile.mkstemp(suffix=".pcap")
+    os.write(of, data)
+    os.close(of)
+    return fname
+
+
+def test_pcap():
+    fname = write_pcap(
+        [
+            (1.5, ether(udp4(b"one"))),
+            (1.75, ether(udp4(b"tcp", proto=6))),
+            (2.0, ether(udp4(b"frag", fragment=0x2000))),
+            (2.25, ether(udp6(b"two"), ethertype=0x86DD)),
+            (2.5, ether(udp4(b"three"), vlan=True)),
+        ]
+    )
+    packets = [(t, bytes(p)) for t, p in pcap.SOCSPcapReader(fname).packets()]
+    os.unlink(fname)
+
+    assert packets == [
+        (1500000000, b"one"),
+        (2250000000, b"two"),
+        (2500000000, b"three"),
+    ]
+
+
+@pytest.mark.parametrize("order, nanoseconds", [(">", False), ("<", True)])
+def test_pcap_formats(order, nanoseconds):
+    fname = write_pcap([(3.000000001, ether(udp4(b"one")))], order, nanoseconds)
+    packets = [(t, bytes(p)) for t, p in pcap.SOCSPcapReader(fname).packets()]
+    os.unlink(fname)
+
+    assert packets == [(3000000001 if nanoseconds else 3000000000, b"one")]
+
+
+def test_pcapng():
+    fname = write_pcapng([(1.000000001, udp4(b"one")), (1.5, udp4(b"two"))])
+    packets = [(t, bytes(p)) for t, p in pcap.SOCSPcapReader(fname).packets()]
+    os.unlink(fname)
+
+    assert packets == [(1000000001, b"one"), (1500000000, b"two")]
+
+
+def test_not_a_capture():
+    with pytest.raises(pcap.SOCSPcapError):
+        pcap.SOCSPcapReader("tests/data/a.txt")
+
+
+def get_schedule(fname, extra=""):
+    return config.get_schedules(f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: 0
+  length: none
+  source: pcap
+  total: infinity
+  user_data1: "{fname}"
+  {extra}
+""")[0]
+
+
+def test_source():
+    fname = write_pcap([(t / 10, ether(udp4(b"%d" % t))) for t in range(0, 4)])
+    sch = get_schedule(fname, "replay_speed: 2\n  loop: true")
+
+    assert [bytes(sch.source()) for _ in range(0, 6)] == [
+        b"0",
+        b"1",
+        b"2",
+        b"3",
+        b"0",
+        b"1",
+    ]
+    times = sch.source.times(batch_size=2)
+    assert [next(times) for _ in range(0, 4)] == pytest.approx([0, 0.1, 0.15, 0.25])
+    os.unlink(fname)
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_replay(engine):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2.0)
+    port = sock.getsockname()[1]
+    fname = write_pcap([(t / 20, ether(udp4(b"%d" % t))) for t in range(0, 5)])
+
+    socs = sender.SOCSender(engine=engine)
+    socs.run(f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  length: none
+  source: pcap
+  total: infinity
+  user_data1: "{fname}"
+""")
+    os.unlink(fname)
+
+    assert [sock.recv(1024) for _ in range(0, 5)] == [b"%d" % t for t in range(0, 5)]
+    result = socs.results["foo"]
+    assert result["packets"] == 5
+    assert result["capture_time"] == pytest.approx(0.2)
+    assert result["achieved_speed"] == pytest.approx(1.0, rel=0.1)
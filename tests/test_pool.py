@@ -0,0 +1,85 @@
+"""
+Tests for `socketsender.pool` module.
+"""
+import itertools
+import time
+
+import pytest
+
+from socketsender import pool
+
+
+def test_order():
+    counter = itertools.count()
+    packets = pool.SOCSPacketPool(lambda: str(next(counter)).encode(), 4)
+    packets.fill()
+
+    assert [packets() for _ in range(0, 20)] == [
+        str(i).encode() for i in range(0, 20)
+    ]
+    packets.stop()
+
+
+def test_total():
+    counter = itertools.count()
+    packets = pool.SOCSPacketPool(lambda: next(counter), 8, total=5)
+    packets.fill()
+
+    assert [packets() for _ in range(0, 5)] == list(range(0, 5))
+    packets.producer.join(1.0)
+    assert not packets.producer.is_alive()
+    assert next(counter) == 5
+
+
+def test_underruns():
+    def slow():
+        time.sleep(0.01)
+        return b"x"
+
+    packets = pool.SOCSPacketPool(slow, 2)
+    packets.fill()
+    assert packets.underruns == 0
+
+    for _ in range(0, 6):
+        packets()
+
+    assert packets.underruns > 0
+    packets.stop()
+
+
+def test_error():
+    counter = itertools.count()
+
+    def failing():
+        if next(counter) >= 5:
+            raise RuntimeError("Out of packets")
+        return b"x"
+
+    packets = pool.SOCSPacketPool(failing, 3)
+    packets.fill()
+
+    assert [packets() for _ in range(0, 5)] == [b"x"] * 5
+    with pytest.raises(RuntimeError):
+        packets()
+    with pytest.raises(RuntimeError):
+        packets()
+    packets.stop()
+
+
+def test_ready():
+    def slow():
+        time.sleep(0.01)
+        return b"x"
+
+    packets = pool.SOCSPacketPool(slow, 4, total=6)
+    packets.fill()
+    assert packets.ready(4)
+    assert packets.ready(10)
+
+    for _ in range(0, 4):
+        packets()
+    assert not packets.ready(2)
+    time.sleep(0.1)
+    assert packets.ready(2)
+    assert packets.ready(4)
+    packets.stop()
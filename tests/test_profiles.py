@@ -0,0 +1,62 @@
+"""
+Tests for `socketsender.profiles` module.
+"""
+import pytest
+from socketsender import profiles
+
+
+def test_constant():
+    profile = profiles.SOCSProfile([profiles.SOCSConstantPhase(1.0, 10.0)])
+
+    assert list(profile.times()) == pytest.approx([i / 10 for i in range(0, 10)])
+    assert list(profile.times(batch_size=5)) == pytest.approx([0.0, 0.5])
+
+
+def test_steps_and_pause():
+    profile = profiles.SOCSProfile(
+        [
+            profiles.SOCSConstantPhase(1.0, 2.0),
+            profiles.SOCSConstantPhase(1.0, 0.0),
+            profiles.SOCSConstantPhase(1.0, 4.0),
+        ]
+    )
+
+    assert list(profile.times()) == pytest.approx([0.0, 0.5, 2.0, 2.25, 2.5, 2.75])
+    assert profile.mean_rate() == pytest.approx(2.0)
+    assert profile.duration() == pytest.approx(3.0)
+
+
+def test_ramp():
+    profile = profiles.SOCSProfile([profiles.SOCSRampPhase(10.0, 100.0, 300.0)])
+    times = list(profile.times())
+
+    # The average of the rates, over the duration
+    assert len(times) == pytest.approx(2000, rel=0.01)
+    assert times[1] - times[0] == pytest.approx(0.01)
+    assert times[-1] - times[-2] == pytest.approx(1 / 300, rel=0.01)
+    assert profile.mean_rate() == pytest.approx(200.0)
+
+
+def test_sine():
+    profile = profiles.SOCSProfile([profiles.SOCSSinePhase(4.0, 0.0, 100.0, 2.0)])
+    times = list(profile.times())
+
+    # Only the positive half of each period sends
+    assert len(times) == pytest.approx(2 * 100 * 2 / 3.14159, rel=0.05)
+    assert all(t % 2.0 < 1.0 for t in times)
+
+
+def test_callable():
+    profile = profiles.SOCSProfile([profiles.SOCSCallablePhase(lambda t: 10.0)])
+    times = profile.times()
+
+    assert [next(times) for _ in range(0, 3)] == pytest.approx([0.0, 0.1, 0.2])
+    assert profile.mean_rate() == 10.0
+
+
+def test_block():
+    times = iter([0.0, 0.5, 1.0])
+
+    assert profiles.block(times, 2) == [0, 500000000]
+    assert profiles.block(times, 2) == [1000000000]
+    assert profiles.block(times, 2) == []
@@ -1,22 +1,29 @@
 """
 Tests for `socketsender.sender` module.
 """
+import asyncio
+import io
+import json
 import logging
 import os
+import pstats
 import select
 import signal
 import socket
+import tempfile
 import threading
+import time
 from multiprocessing import Process
 
-from socketsender import sender
+import pytest
+from socketsender import config, header, pacing, sender, sink
 
 logging.basicConfig()
 
 FOO = None
 
 
-def do_test1(port=None):
+def do_test1(port=None, engine="thread", workers=None):
     stream = f"""
 ---
 - name: foo
@@ -38,7 +45,7 @@ def do_test1(port=None):
   user_data1: "tests/data/b.txt"
 ...
     """
-    sender.SOCSender().run(stream)
+    sender.SOCSender(engine=engine, workers=workers).run(stream)
 
 
 def do_test2(port=None):
@@ -93,6 +100,24 @@ def do_test3(port=None):
     FOO.run(stream)
 
 
+def do_test4(port=None, engine="thread"):
+    global FOO
+    stream = f"""
+---
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1000
+  length: 4
+  source: sequential
+  total: 10
+  batch_size: 4
+...
+    """
+    FOO = sender.SOCSender(engine=engine)
+    FOO.run(stream)
+
+
 def test_ok():
     expected_data = (
         b"aaaaaaa0\n",
@@ -231,3 +256,727 @@ def test_source_call_too_long():
     for i in range(0, 20):
         msg = sock.recv(1024)
         assert msg == b"Hello"
+
+
+def test_batch():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    thr = threading.Thread(target=do_test4, kwargs={"port": port})
+    thr.start()
+
+    data = b"".join(sock.recv(1024) for _ in range(0, 10))
+    assert data == bytes(range(0, 40))
+
+    thr.join()
+    assert FOO.threads[0].result["packets"] == 10
+
+
+def test_asyncio():
+    expected_data = (
+        b"aaaaaaa0\n",
+        b"bbbbbbb0\n",
+        b"aaaaaaa1\n",
+        b"bbbbbbb1\n",
+        b"aaaaaaa2\n",
+        b"bbbbbbb2\n",
+    )
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    proc = Process(target=do_test1, kwargs={"port": port, "engine": "asyncio"})
+    proc.start()
+
+    for i in range(0, 6):
+        msg = sock.recv(1024)
+        assert msg == expected_data[i]
+
+    proc.join()
+
+
+def test_asyncio_result():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    thr = threading.Thread(target=do_test4, kwargs={"port": port, "engine": "asyncio"})
+    thr.start()
+
+    data = b"".join(sock.recv(1024) for _ in range(0, 10))
+    assert data == bytes(range(0, 40))
+
+    thr.join()
+    assert FOO.results["foo"]["packets"] == 10
+    assert set(FOO.results["foo"]) == {
+        "packets",
+        "bytes",
+        "time",
+        "frequency",
+        "bandwidth",
+        "skipped",
+    }
+
+
+def test_bad_engine():
+    with pytest.raises(ValueError):
+        sender.SOCSender(engine="fibers")
+
+
+@pytest.mark.parametrize("workers", [0, "0", -1, "foo", 1.5j])
+def test_bad_workers(workers):
+    with pytest.raises(ValueError, match="Bad number of workers"):
+        sender.SOCSender(workers=workers)
+
+
+def test_workers_count():
+    assert sender.SOCSender(workers="2").workers == 2
+    assert sender.SOCSender(workers="auto").workers == "auto"
+
+
+def test_workers():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    proc = Process(target=do_test1, kwargs={"port": port, "workers": 2})
+    proc.start()
+
+    msgs = [sock.recv(1024) for _ in range(0, 20)]
+    assert [m for m in msgs if m.startswith(b"a")] == [
+        f"aaaaaaa{i}\n".encode() for i in range(0, 10)
+    ]
+    assert [m for m in msgs if m.startswith(b"b")] == [
+        f"bbbbbbb{i}\n".encode() for i in range(0, 10)
+    ]
+
+    proc.join()
+    assert proc.exitcode == 0
+
+
+def test_workers_result():
+    global FOO
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    schedules = [
+        f"""
+- name: foo{i}
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1000
+  length: 4
+  source: random
+  total: 5
+"""
+        for i in range(0, 3)
+    ]
+    FOO = sender.SOCSender(workers="auto", affinity=True)
+    FOO.run("".join(schedules))
+
+    assert set(FOO.results) == {"foo0", "foo1", "foo2"}
+    assert all(r["packets"] == 5 for r in FOO.results.values())
+    assert len(FOO.threads) == min(3, os.cpu_count())
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_workers_start_together(engine):
+    """The workers start once every pool is filled, so a slow prefill
+    in one does not leave the others sending ahead.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5.0)
+
+    port = sock.getsockname()[1]
+    socs = sender.SOCSender(engine=engine, workers=2)
+    thr = threading.Thread(
+        target=socs.run,
+        args=(
+            f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1
+  length: 5
+  source: tests.callables.SOCS_Test2
+  total: 1
+  prefill: 2
+- name: boo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1
+  length: 5
+  source: sequential
+  total: 1
+""",
+        ),
+    )
+    thr.start()
+    arrivals = dict()
+    for _ in range(0, 2):
+        data = sock.recv(1024)
+        arrivals[data] = time.perf_counter()
+    thr.join()
+
+    assert socs.results["foo"]["packets"] == 1
+    # Against the half second the pool of foo takes to fill
+    assert abs(arrivals[b"Hello"] - arrivals[b"\x00\x01\x02\x03\x04"]) < 0.3
+
+
+def test_bandwidth():
+    global FOO
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    FOO = sender.SOCSender()
+    FOO.run(
+        f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  bandwidth: 800kbit
+  length: none
+  source: file
+  framing: line
+  loop: true
+  total: 40
+  user_data1: "tests/data/a.txt"
+"""
+    )
+
+    result = FOO.results["foo"]
+    assert result["bytes"] == 360
+    # The last packet is sent as soon as the bucket allows, so only
+    # the bytes before it are paced.
+    assert result["time"] == pytest.approx(351 / 100000, rel=0.2)
+
+
+def test_histograms():
+    global FOO
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    FOO = sender.SOCSender()
+    FOO.run(
+        f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1000
+  length: 10
+  source: random
+  total: 50
+  histograms: true
+"""
+    )
+
+    histograms = FOO.results["foo"]["histograms"]
+    assert histograms["source"]["count"] == 50
+    assert histograms["send"]["count"] == 50
+    assert histograms["interval"]["count"] == 49
+    assert histograms["interval"]["p50"] == pytest.approx(0.001, rel=0.1)
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_report(engine):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    out = io.StringIO()
+    socs = sender.SOCSender(
+        engine=engine, report_interval=0.1, report_format="json", report_stream=out
+    )
+    socs.run(
+        f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 50
+  length: 10
+  source: random
+  total: 20
+"""
+    )
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) >= 2
+    assert "foo" in lines[-2]["schedules"]
+    assert lines[-1]["results"]["foo"]["packets"] == 20
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_tcp(engine):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    listener.settimeout(2.0)
+
+    port = listener.getsockname()[1]
+    socs = sender.SOCSender(engine=engine)
+    thr = threading.Thread(
+        target=socs.run,
+        args=(
+            f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  protocol: tcp
+  frequency: 1000
+  length: 5
+  source: sequential
+  total: 40
+  batch_size: 4
+""",
+        ),
+    )
+    thr.start()
+    conn, _ = listener.accept()
+    data = b""
+    while len(data) < 200:
+        chunk = conn.recv(1024)
+        assert chunk
+        data += chunk
+    thr.join()
+
+    assert data == bytes(range(0, 200))
+    assert socs.results["foo"]["packets"] == 40
+    assert socs.results["foo"]["reconnects"] == 0
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_prefill(engine):
+    """A source as slow as SOCS_Test2 does not hold up sending once
+    its packets are generated ahead.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    socs = sender.SOCSender(engine=engine)
+    socs.run(
+        f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 100
+  length: 5
+  source: tests.callables.SOCS_Test2
+  total: 4
+  prefill: 4
+"""
+    )
+
+    result = socs.results["foo"]
+    assert result["packets"] == 4
+    # Well below the 0.5 seconds the source takes per packet
+    assert result["time"] < 0.3
+    assert result["pool_underruns"] == 0
+    assert [sock.recv(1024) for _ in range(0, 4)] == [b"Hello"] * 4
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_stamp(engine, batch_size):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    stream = f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 2000
+  length: 10
+  source: sequential
+  total: 20
+  batch_size: {batch_size}
+  stamp: true
+"""
+    socs = sink.SOCSSink(config.get_schedules(stream))
+    thr = threading.Thread(target=socs.run)
+    thr.start()
+
+    sent = sender.SOCSender(engine=engine)
+    sent.run(stream)
+    time.sleep(0.1)
+    socs.stop()
+    thr.join()
+
+    assert sent.results["foo"]["bytes"] == 20 * (10 + header.SIZE)
+    result = socs.results()["foo"]
+    assert result["packets"] == 20
+    assert result["lost"] == 0
+    assert result["reordered"] == 0
+    assert result["latency"]["count"] == 20
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+@pytest.mark.parametrize("fanout", ["broadcast", "round-robin"])
+def test_fanout(engine, fanout):
+    ports = list()
+    for _ in range(0, 3):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        ports.append(sock.getsockname()[1])
+        sock.close()
+    stream = f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {ports}
+  fanout: {fanout}
+  frequency: 2000
+  length: 10
+  source: sequential
+  total: 30
+  batch_size: 4
+  stamp: true
+"""
+    socs = sink.SOCSSink(config.get_schedules(stream))
+    thr = threading.Thread(target=socs.run)
+    thr.start()
+
+    sent = sender.SOCSender(engine=engine)
+    sent.run(stream)
+    time.sleep(0.1)
+    socs.stop()
+    thr.join()
+
+    results = socs.results()
+    assert sent.results["foo"]["packets"] == 30
+    if fanout == "broadcast":
+        assert sent.results["foo"]["datagrams"] == 90
+        for port in ports:
+            assert results[f"foo to 127.0.0.1:{port}/udp"]["packets"] == 30
+            assert results[f"foo to 127.0.0.1:{port}/udp"]["lost"] == 0
+    else:
+        assert "datagrams" not in sent.results["foo"]
+        assert results["foo"]["packets"] == 30
+        assert results["foo"]["duplicates"] == 0
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_profile(engine):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", 0))
+
+    port = sock.getsockname()[1]
+    socs = sender.SOCSender(engine=engine)
+    socs.run(
+        f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  profile:
+    - {{duration: 0.1, rate: 100}}
+    - {{duration: 0.1, rate: 0}}
+    - {{duration: 0.1, ramp: [100, 300]}}
+  length: 10
+  source: random
+  total: infinity
+"""
+    )
+
+    result = socs.results["foo"]
+    # The schedule ends with its profile
+    assert result["packets"] == 10 + 20
+    assert result["time"] == pytest.approx(0.3, abs=0.03)
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+@pytest.mark.parametrize("burst_size", ["8", "[2, 8]"])
+def test_bursts(engine, burst_size):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    stream = f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  burst_interval: 0.005
+  burst_size: {burst_size}
+  seed: 3
+  length: 10
+  source: sequential
+  total: 40
+  stamp: true
+"""
+    socs = sink.SOCSSink(config.get_schedules(stream))
+    thr = threading.Thread(target=socs.run)
+    thr.start()
+
+    sent = sender.SOCSender(engine=engine)
+    sent.run(stream)
+    time.sleep(0.1)
+    socs.stop()
+    thr.join()
+
+    result = sent.results["foo"]
+    assert result["packets"] == 40
+    if burst_size == "8":
+        assert result["burst_duration"]["count"] == 5
+    else:
+        assert 5 <= result["burst_duration"]["count"] <= 20
+    assert socs.results()["foo"]["packets"] == 40
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+@pytest.mark.parametrize("backpressure", ["drop", "retry"])
+def test_backpressure(engine, backpressure):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    stream = f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 2000
+  length: 10
+  source: sequential
+  total: 20
+  batch_size: 4
+  backpressure: {backpressure}
+"""
+    sent = sender.SOCSender(engine=engine)
+    sent.run(stream)
+    sock.close()
+
+    result = sent.results["foo"]
+    assert result["packets"] == 20
+    assert result["dropped"] == 0
+    assert "refused" in result
+    assert "blocked_time" in result
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+@pytest.mark.parametrize("prefill", ["", "prefill: 3"])
+def test_error(engine, prefill):
+    stream = f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 5
+  source: tests.callables.SOCS_Test3
+  total: 10
+  {prefill}
+- name: boo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 10
+"""
+    sent = sender.SOCSender(engine=engine)
+    sent.run(stream)
+
+    assert sent.results["foo"]["error"] == "Out of packets"
+    assert sent.results["foo"]["packets"] == 5
+    assert "error" not in sent.results["boo"]
+    assert sent.results["boo"]["packets"] == 10
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_profile_hooks(engine):
+    stream = """
+- name: foo/1
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 20
+  bandwidth: 100000
+"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sent = sender.SOCSender(engine=engine, profile_dir=tmp)
+        sent.run(stream)
+        files = os.listdir(tmp)
+        assert len(files) == 1
+        pstats.Stats(os.path.join(tmp, files[0]))
+
+    result = sent.results["foo/1"]
+    histograms = result["histograms"]
+    assert histograms["source"]["count"] == 20
+    assert histograms["send"]["count"] == 20
+    assert histograms["wait"]["count"] == 19
+    if engine == "thread":
+        assert files == ["foo_1.prof"]
+        assert histograms["bucket"]["count"] == 19
+        assert 0 < result["cpu_time"] < result["time"]
+    else:
+        assert files[0].startswith("asyncio-")
+        assert "cpu_time" not in result
+
+    sent = sender.SOCSender(engine=engine)
+    sent.run(stream)
+    assert "histograms" not in sent.results["foo/1"]
+    assert "cpu_time" not in sent.results["foo/1"]
+
+
+def test_asyncio_underrun():
+    stream = """
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 5
+  source: tests.callables.SOCS_Test4
+  prefill: 2
+  total: 8
+- name: boo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 500
+  length: 10
+  source: sequential
+  total: 50
+"""
+    sent = sender.SOCSender(engine="asyncio")
+    sent.run(stream)
+
+    assert sent.results["foo"]["packets"] == 8
+    assert sent.results["foo"]["pool_underruns"] > 0
+    # Not held up by the pool of foo, which takes 0.3 s to catch up
+    assert sent.results["boo"]["time"] < 0.2
+
+
+def test_stamp_buffers():
+    (schedule,) = config.get_schedules(
+        """
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 100
+  batch_size: 32
+  stamp: true
+"""
+    )
+    sent = list()
+    flow = sender.SOCSflow(schedule, sent.append, sent.extend)
+
+    assert flow.send_event() == 32 * (10 + header.SIZE)
+    # Each slot is sized for the length, not the largest packet
+    assert [len(p.obj) for p in sent] == [10 + header.SIZE] * 32
+
+
+def test_result_frequency():
+    (schedule,) = config.get_schedules(
+        """
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 10
+  batch_size: 4
+"""
+    )
+    flow = sender.SOCSflow(schedule, lambda data: None, lambda packets: None)
+    result = dict()
+    sender.set_result(
+        result, flow, time.perf_counter() - 1.0, pacing.make_pacer(schedule)
+    )
+    # Stopped before the first send
+    assert result["packets"] == 0
+    assert result["frequency"] == 0.0
+
+    flow = sender.SOCSflow(schedule, lambda data: None, lambda packets: None)
+    while not flow.done():
+        flow.send_event()
+    sender.set_result(
+        result, flow, time.perf_counter() - 1.0, pacing.make_pacer(schedule)
+    )
+    # Two batches of 4 over the time up to the last, of 2
+    assert result["packets"] == 10
+    assert result["frequency"] == pytest.approx(8.0, rel=0.01)
+
+
+def test_asyncio_udp_flow_control():
+    from socketsender import asyncengine
+
+    (schedule,) = config.get_schedules(
+        """
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 10
+"""
+    )
+    runner = asyncengine.SOCSAsyncRunner(schedule)
+
+    async def check():
+        await runner.open()
+        protocol = runner.endpoint.get_protocol()
+        assert isinstance(protocol, asyncengine.SOCSUdpProtocol)
+        protocol.pause_writing()
+        assert not protocol.writable.is_set()
+        protocol.resume_writing()
+        assert protocol.writable.is_set()
+        runner.endpoint.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(check())
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("engine", sender.ENGINES)
+def test_tcp_target_down(engine):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    down = listener.getsockname()[1]
+    listener.close()
+    stream = f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {down}
+  protocol: tcp
+  reconnect_delay: 0.01
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 10
+- name: boo
+  target_addr: "127.0.0.1"
+  target_port: 9
+  frequency: 1000
+  length: 10
+  source: sequential
+  total: 10
+"""
+    sent = sender.SOCSender(engine=engine)
+    timer = threading.Timer(0.5, sent.stop_all)
+    timer.start()
+    sent.run(stream)
+    timer.cancel()
+
+    # Not held up until the run was stopped
+    assert sent.results["boo"]["packets"] == 10
+    # Never connected, so never reconnected
+    assert sent.results["foo"]["reconnects"] == 0
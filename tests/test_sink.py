@@ -0,0 +1,232 @@
+"""
+Tests for `socketsender.sink` module.
+"""
+
+import io
+import json
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from socketsender import config, header, sink
+
+
+def get_schedules(port, protocol="udp"):
+    return config.get_schedules(f"""
+---
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  protocol: {protocol}
+  frequency: 1
+  length: 5
+  source: sequential
+  total: 10
+...
+        """)
+
+
+def free_port(kind=socket.SOCK_DGRAM):
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def packet(name, seq):
+    stamper = header.SOCSStamper(name, size=4)
+    stamper.seq = seq
+    return bytes(stamper.stamp(bytes(4)))
+
+
+def run_sink(socs):
+    thr = threading.Thread(target=socs.run)
+    thr.start()
+    return thr
+
+
+def test_flow_stats():
+    flow = sink.SOCSFlowStats()
+    for seq in (0, 1, 3, 2, 2, 6, 5):
+        flow.record(10)
+        flow.record_seq(seq, 1000)
+
+    summary = flow.summary()
+    assert summary["packets"] == 7
+    assert summary["lost"] == 1
+    assert summary["duplicates"] == 1
+    assert summary["reordered"] == 2
+    assert summary["latency"]["count"] == 7
+
+
+def test_flow_stats_window():
+    flow = sink.SOCSFlowStats()
+    flow.record_seq(0, 0)
+    flow.record_seq(sink.WINDOW * 3, 0)
+    flow.record_seq(1, 0)
+
+    assert flow.missing == sink.WINDOW * 3 - 2
+    assert flow.reordered == 1
+
+
+def test_udp():
+    port = free_port()
+    socs = sink.SOCSSink(get_schedules(port))
+    thr = run_sink(socs)
+
+    out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for seq in (0, 1, 3):
+        out.sendto(packet("foo", seq), ("127.0.0.1", port))
+    out.sendto(packet("bar", 0), ("127.0.0.1", port))
+    out.sendto(b"Hello", ("127.0.0.1", port))
+    time.sleep(0.2)
+    socs.stop()
+    thr.join()
+
+    results = socs.results()
+    assert results["foo"]["packets"] == 3
+    assert results["foo"]["lost"] == 1
+    assert results[f"id {header.schedule_id('bar'):08x}"]["packets"] == 1
+    assert results[f"127.0.0.1:{port}/udp"] == {"packets": 1, "bytes": 5}
+
+
+def test_many_targets():
+    port = free_port()
+    # More than select() can take
+    targets = config.get_targets(f"""
+---
+- name: foo
+  target_addr: ["127.1.0.0/22", "127.1.4.0/25"]
+  target_port: {port}
+  fanout: round-robin
+...
+        """)
+    socs = sink.SOCSSink(targets)
+    assert max(s.fileno() for s in socs.udp) >= 1024
+    thr = run_sink(socs)
+
+    out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    out.sendto(b"Hello", ("127.1.4.126", port))
+    time.sleep(0.2)
+    socs.stop()
+    thr.join()
+
+    assert socs.results() == {f"127.1.4.126:{port}/udp": {"packets": 1, "bytes": 5}}
+
+
+def test_broadcast():
+    ports = [free_port(), free_port()]
+    schedules = config.get_schedules(f"""
+---
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {ports}
+  frequency: 1
+  length: 5
+  source: sequential
+  total: 10
+...
+        """)
+    socs = sink.SOCSSink(schedules)
+    thr = run_sink(socs)
+
+    out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for port in ports:
+        for seq in (0, 1):
+            out.sendto(packet("foo", seq), ("127.0.0.1", port))
+    time.sleep(0.2)
+    socs.stop()
+    thr.join()
+
+    results = socs.results()
+    for port in ports:
+        assert results[f"foo to 127.0.0.1:{port}/udp"]["packets"] == 2
+        assert results[f"foo to 127.0.0.1:{port}/udp"]["duplicates"] == 0
+
+
+def test_tcp():
+    port = free_port(socket.SOCK_STREAM)
+    socs = sink.SOCSSink(get_schedules(port, "tcp"))
+    thr = run_sink(socs)
+
+    out = socket.create_connection(("127.0.0.1", port))
+    out.sendall(b"Hello" * 100)
+    out.close()
+    time.sleep(0.2)
+    socs.stop()
+    thr.join()
+
+    assert socs.results()[f"127.0.0.1:{port}/tcp"]["bytes"] == 500
+
+
+def test_report():
+    port = free_port()
+    stream = io.StringIO()
+    socs = sink.SOCSSink(
+        get_schedules(port),
+        report_interval=0.1,
+        report_format="json",
+        report_stream=stream,
+    )
+    out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    out.sendto(packet("foo", 0), ("127.0.0.1", port))
+
+    socs.run(duration=0.35)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) >= 2
+    assert lines[-1]["flows"]["foo"]["packets"] == 1
+
+
+def test_cli():
+    port = free_port()
+    with tempfile.NamedTemporaryFile("w", suffix=".yml") as cfg:
+        cfg.write(f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1
+  length: 5
+  source: sequential
+  total: 10
+""")
+        cfg.flush()
+        sb = subprocess.run(
+            [
+                "socketsender-sink",
+                "--duration",
+                "0.2",
+                "--report-format",
+                "json",
+                cfg.name,
+            ],
+            stdout=subprocess.PIPE,
+        )
+
+    assert sb.returncode == 0
+    assert json.loads(sb.stdout) == {"results": {}}
+
+
+def test_cli_sender_files():
+    port = free_port()
+    with tempfile.NamedTemporaryFile("w", suffix=".yml") as cfg:
+        cfg.write(f"""
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1
+  length: 5
+  source: file
+  user_data1: /nonexistent/on/this/host
+  total: 10
+""")
+        cfg.flush()
+        sb = subprocess.run(
+            ["socketsender-sink", "--duration", "0.2", cfg.name],
+            stdout=subprocess.PIPE,
+        )
+
+    assert sb.returncode == 0
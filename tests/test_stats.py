@@ -0,0 +1,103 @@
+"""
+Tests for `socketsender.stats` module.
+"""
+import io
+import json
+import types
+
+import pytest
+from socketsender import stats
+
+
+def test_buckets():
+    """Every value falls within the bounds of its bucket.
+    """
+    for value in list(range(0, 1000)) + [2 ** 40 + 12345, 2 ** 64 - 1]:
+        low, high = stats.SOCSHistogram.bounds(stats.SOCSHistogram.index(value))
+        assert low <= value <= high
+        assert high - low <= value / stats.SUB_BUCKETS
+
+
+def test_summary():
+    hist = stats.SOCSHistogram()
+    for value in range(1, 1001):
+        hist.record(value * 1000)
+
+    summary = hist.summary()
+
+    assert summary["count"] == 1000
+    assert summary["min"] == pytest.approx(1e-6)
+    assert summary["max"] == pytest.approx(1e-3)
+    assert summary["mean"] == pytest.approx(500.5e-6)
+    assert summary["p50"] == pytest.approx(500e-6, rel=1 / stats.SUB_BUCKETS)
+    assert summary["p99"] == pytest.approx(990e-6, rel=1 / stats.SUB_BUCKETS)
+    assert summary["p99.9"] <= summary["max"]
+
+
+def test_empty():
+    assert stats.SOCSHistogram().summary() == {"count": 0}
+
+
+def test_fixed_memory():
+    hist = stats.SOCSHistogram()
+    size = len(hist.counts)
+    for value in range(0, 100000, 7):
+        hist.record(value ** 3)
+
+    assert len(hist.counts) == size
+
+
+def fake_runner(name, packets, nbytes, finished=False):
+    flow = types.SimpleNamespace(packets=packets, bytes=nbytes, finished=finished)
+    pacer = types.SimpleNamespace(lag=lambda: 0.5)
+    return types.SimpleNamespace(
+        name=name, flow=flow, pacer=pacer, bucket=None, start_time=0.0
+    )
+
+
+def test_sample():
+    reporter = stats.SOCSReporter(1.0)
+    reporter.runners = [
+        fake_runner("foo", 10, 100),
+        fake_runner("boo", 20, 200, finished=True),
+        types.SimpleNamespace(name="late", flow=None),
+    ]
+
+    sample = reporter.sample()
+
+    assert list(sample["schedules"]) == ["foo", "boo"]
+    assert sample["schedules"]["foo"]["lag"] == 0.5
+    assert sample["schedules"]["boo"]["lag"] == 0.0
+    assert sample["total"]["packets"] == 30
+    assert sample["total"]["bytes"] == 300
+    assert sample["total"]["lag"] == 0.5
+
+
+def test_report_json():
+    out = io.StringIO()
+    reporter = stats.SOCSReporter(1.0, "json", out)
+    reporter.runners = [fake_runner("foo", 10, 100)]
+
+    reporter.report(reporter.sample())
+    reporter.report_results({"foo": {"packets": 10}})
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert lines[0]["schedules"]["foo"]["packets"] == 10
+    assert lines[1] == {"results": {"foo": {"packets": 10}}}
+
+
+def test_report_text():
+    out = io.StringIO()
+    reporter = stats.SOCSReporter(1.0, "text", out)
+    reporter.runners = [fake_runner("foo", 10, 100)]
+
+    reporter.report(reporter.sample())
+
+    lines = out.getvalue().splitlines()
+    assert lines[0].split("] ")[1].startswith("foo: 10 packets,")
+    assert lines[1].split("] ")[1].startswith("total: 10 packets,")
+
+
+def test_bad_format():
+    with pytest.raises(ValueError):
+        stats.SOCSReporter(1.0, "xml")
@@ -0,0 +1,331 @@
+"""
+Tests for `socketsender.transport` module.
+"""
+import errno
+import socket
+import threading
+
+import pytest
+from socketsender import config, transport
+
+
+def get_schedule(port, batch_size=1, protocol="udp", extra=""):
+    return config.get_schedules(
+        f"""
+---
+- name: foo
+  target_addr: "127.0.0.1"
+  target_port: {port}
+  frequency: 1
+  length: 5
+  source: sequential
+  total: 10
+  batch_size: {batch_size}
+  protocol: {protocol}
+  reconnect_delay: 0.01
+  {extra}
+...
+        """
+    )[0]
+
+
+def get_sink():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2.0)
+    return sock, sock.getsockname()[1]
+
+
+def test_send():
+    sock, port = get_sink()
+    udp = transport.SOCSUdpTransport(get_schedule(port))
+
+    udp.send(b"Hello")
+
+    assert sock.recv(1024) == b"Hello"
+    udp.close()
+
+
+def test_send_batch():
+    sock, port = get_sink()
+    udp = transport.SOCSUdpTransport(get_schedule(port, batch_size=4))
+
+    udp.send_batch([b"one", bytearray(b"two"), memoryview(b"three")])
+    udp.send_batch([b"four"])
+
+    assert [sock.recv(1024) for _ in range(0, 4)] == [b"one", b"two", b"three", b"four"]
+    udp.close()
+
+
+def test_send_loop():
+    sock, port = get_sink()
+    udp = transport.SOCSUdpTransport(get_schedule(port, batch_size=4))
+
+    udp.send_loop([b"one", b"two"])
+
+    assert [sock.recv(1024) for _ in range(0, 2)] == [b"one", b"two"]
+    udp.close()
+
+
+def test_connected():
+    sock, port = get_sink()
+    schedule = get_schedule(
+        port, batch_size=4, extra="connect: true\n  sndbuf: 65536\n  tos: 0x10"
+    )
+    udp = transport.SOCSUdpTransport(schedule)
+
+    udp.send(b"Hello")
+    udp.send_batch([b"one", bytearray(b"two")])
+    udp.send_loop([b"three"])
+
+    received = [sock.recv(1024) for _ in range(0, 4)]
+    assert received == [b"Hello", b"one", b"two", b"three"]
+    assert udp.sock.getpeername() == ("127.0.0.1", port)
+    assert udp.sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS) == 0x10
+    # Linux doubles the size asked for, to leave room for its bookkeeping
+    assert udp.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 65536
+    udp.close()
+
+
+def test_connected_refused():
+    sock, port = get_sink()
+    sock.close()
+    udp = transport.SOCSUdpTransport(
+        get_schedule(port, batch_size=4, extra="connect: true")
+    )
+
+    # The ICMP errors the closed port sends back are not raised
+    for _ in range(0, 10):
+        udp.send(b"Hello")
+        udp.send_batch([b"one", b"two"])
+    udp.close()
+
+
+def test_bind():
+    sock, port = get_sink()
+    local = get_sink()[0]
+    local_port = local.getsockname()[1]
+    local.close()
+    udp = transport.SOCSUdpTransport(
+        get_schedule(port, extra=f"bind_addr: 127.0.0.1\n  bind_port: {local_port}")
+    )
+
+    udp.send(b"Hello")
+
+    assert sock.recvfrom(1024) == (b"Hello", ("127.0.0.1", local_port))
+    udp.close()
+
+
+def test_broadcast():
+    sinks = [get_sink() for _ in range(0, 3)]
+    ports = ", ".join(str(port) for _, port in sinks)
+    for batch_size in (1, 4):
+        udp = transport.SOCSUdpTransport(get_schedule(f"[{ports}]", batch_size))
+
+        udp.send(b"Hello")
+        udp.send_batch([b"one", memoryview(b"two")])
+
+        for sock, _ in sinks:
+            assert [sock.recv(1024) for _ in range(0, 3)] == [b"Hello", b"one", b"two"]
+        udp.close()
+
+
+def test_round_robin():
+    (first, first_port), (last, last_port) = [get_sink() for _ in range(0, 2)]
+    for batch_size in (1, 4):
+        schedule = get_schedule(
+            f"[{first_port}, {last_port}]", batch_size, extra="fanout: round-robin"
+        )
+        udp = transport.SOCSUdpTransport(schedule)
+
+        udp.send(b"one")
+        udp.send_batch([b"two", b"three", b"four"])
+        udp.send_loop([b"five"])
+
+        assert [first.recv(1024) for _ in range(0, 3)] == [b"one", b"three", b"five"]
+        assert [last.recv(1024) for _ in range(0, 2)] == [b"two", b"four"]
+        udp.close()
+
+
+def test_sockaddr():
+    assert transport.sockaddr(socket.AF_INET, ("1.2.3.4", 258))[2:8] == bytes(
+        [1, 2, 1, 2, 3, 4]
+    )
+    assert len(transport.sockaddr(socket.AF_INET, ("1.2.3.4", 258))) == 16
+    assert len(transport.sockaddr(socket.AF_INET6, ("::1", 258))) == 28
+
+
+def get_listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1)
+    sock.settimeout(2.0)
+    return sock, sock.getsockname()[1]
+
+
+def recv_exactly(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+
+def test_tcp():
+    listener, port = get_listener()
+    tcp = transport.make_transport(get_schedule(port, batch_size=4, protocol="tcp"))
+    conn, _ = listener.accept()
+
+    tcp.send(b"Hello")
+    tcp.send_batch([b"one", bytearray(b"two"), memoryview(b"three")])
+
+    assert recv_exactly(conn, 16) == b"Helloonetwothree"
+    assert tcp.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert tcp.reconnects == 0
+    tcp.close()
+
+
+def test_tcp_large_batch():
+    listener, port = get_listener()
+    tcp = transport.make_transport(get_schedule(port, batch_size=2000, protocol="tcp"))
+    conn, _ = listener.accept()
+
+    tcp.send_batch([b"%04d" % i for i in range(0, 2000)])
+
+    assert recv_exactly(conn, 8000) == b"".join(b"%04d" % i for i in range(0, 2000))
+    assert tcp.reconnects == 0
+    tcp.close()
+
+
+def test_tcp_reconnect():
+    listener, port = get_listener()
+    tcp = transport.make_transport(get_schedule(port, protocol="tcp"))
+    conn, _ = listener.accept()
+    conn.close()
+
+    # The first writes may still succeed before the reset arrives
+    for _ in range(0, 100):
+        tcp.send(b"x")
+        if tcp.reconnects:
+            break
+    conn, _ = listener.accept()
+    tcp.send(b"Hello")
+
+    assert tcp.reconnects == 1
+    # The write that failed is written again on the new connection
+    assert recv_exactly(conn, 6) == b"xHello"
+    tcp.close()
+
+
+def test_tcp_give_up():
+    listener, port = get_listener()
+    listener.close()
+    stopping = threading.Event()
+    stopping.set()
+
+    tcp = transport.SOCSTcpTransport(get_schedule(port, protocol="tcp"), stopping.wait)
+    tcp.send(b"Hello")
+
+    assert tcp.sock is None
+    result = dict()
+    tcp.add_result(result)
+    # Never connected, so never reconnected
+    assert result == {"reconnects": 0}
+
+
+def test_receive():
+    sock, port = get_sink()
+    sock.setblocking(False)
+    udp = transport.SOCSUdpTransport(get_schedule(port))
+    receiver = transport.SOCSUdpReceiver(4, 16)
+
+    assert receiver.receive(sock) == []
+    for data in (b"one", b"two", b"three", b"four", b"five"):
+        udp.send(data)
+
+    assert [bytes(d) for d in receiver.receive(sock)] == [
+        b"one",
+        b"two",
+        b"three",
+        b"four",
+    ]
+    assert [bytes(d) for d in receiver.receive_loop(sock)] == [b"five"]
+    udp.close()
+
+
+def test_receive_shared():
+    first, first_port = get_sink()
+    second, second_port = get_sink()
+    first.setblocking(False)
+    second.setblocking(False)
+    receiver = transport.SOCSUdpReceiver(4, 16)
+    udp = transport.SOCSUdpTransport(get_schedule(first_port))
+    udp.send(b"one")
+    udp.close()
+    udp = transport.SOCSUdpTransport(get_schedule(second_port))
+    udp.send(b"two")
+    udp.close()
+
+    assert [bytes(d) for d in receiver.receive(first)] == [b"one"]
+    assert [bytes(d) for d in receiver.receive(second)] == [b"two"]
+
+
+def refusing(failures, exc):
+    """A send call that fails `failures` times with `exc`, then succeeds.
+    """
+    calls = list()
+
+    def send(data, addr=None):
+        calls.append(data)
+        if len(calls) <= failures:
+            raise exc
+        return len(data)
+
+    return send
+
+
+@pytest.mark.parametrize(
+    "exc", [BlockingIOError(errno.EAGAIN, "full"), OSError(errno.ENOBUFS, "full")]
+)
+def test_backpressure(exc):
+    sock, port = get_sink()
+    drop = transport.SOCSUdpTransport(get_schedule(port, extra="backpressure: drop"))
+    retry = transport.SOCSUdpTransport(
+        get_schedule(port, extra="backpressure: retry\n  send_retries: 2")
+    )
+
+    assert drop.guard(refusing(1, exc))(b"Hello") == 0
+    assert retry.guard(refusing(2, exc))(b"Hello") == 5
+    assert retry.guard(refusing(3, exc))(b"Hello") == 0
+    result = dict()
+    drop.add_result(result)
+    assert result == {"refused": 1, "dropped": 1, "blocked_time": 0.0}
+    retry.add_result(result)
+    assert result["refused"] == 5
+    assert result["dropped"] == 1
+    assert result["blocked_time"] >= 0.0
+
+    with pytest.raises(ConnectionRefusedError):
+        drop.guard(refusing(1, ConnectionRefusedError()))(b"Hello")
+
+    drop.send(b"Hello")
+    assert sock.recv(1024) == b"Hello"
+    drop.close()
+    retry.close()
+
+
+def test_wait_for_room_high_fd():
+    sock, port = get_sink()
+    # Pushes the socket of the transport past what select() takes
+    fillers = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(0, 1024)]
+    retry = transport.SOCSUdpTransport(
+        get_schedule(port, extra="backpressure: retry\n  send_retries: 2")
+    )
+    try:
+        assert retry.sock.fileno() >= 1024
+        assert retry.guard(refusing(2, OSError(errno.ENOBUFS, "full")))(b"Hello") == 5
+    finally:
+        retry.close()
+        for filler in fillers:
+            filler.close()